@@ -1,3 +1,4 @@
+
 # Disclaimer:
 # This code is provided as an example of how to build code against and interact
 # with the Deep Instinct Agentless Connector over REST API. It is provided
@@ -7,36 +8,261 @@
 # officially supported, although the API that it calls is.
 #
 
-import deepinstinctagentless as di, time, json
-
-#CONFIGURATION
-scanner_ip = '192.168.0.50'
-file_to_scan = 'example.pdf'
-number_of_scans = 5000
-
-# ESTABLISH VARIABLES
-start_time = time.perf_counter()
-n = 0
-total_scan_duration_in_microseconds = 0
-total_file_size_in_bytes = 0
-
-# EXECUTE THE SCANS
-while n < number_of_scans:
-    verdict = di.scan_file(file_to_scan, scanner_ip)
-    total_scan_duration_in_microseconds += verdict['scan_duration_in_microseconds']
-    total_file_size_in_bytes += verdict['file_size_in_bytes']
-    n += 1
-    print('Completed scan', n,'of',number_of_scans, end='\r')
-
-# CALCULATE RESULTS
-results = {}
-results['scan_count'] = n
-results['runtime_in_seconds'] = time.perf_counter() - start_time
-results['scan_time_in_seconds'] = total_scan_duration_in_microseconds / 1000000
-results['scan_volume_in_megabytes'] = total_file_size_in_bytes / 1000000
-results['ratio_of_time_spent_scanning'] = results['scan_time_in_seconds'] / results['runtime_in_seconds']
-results['gross_throughput_in_megabytes_per_second'] = results['scan_volume_in_megabytes'] / results['scan_time_in_seconds']
-results['net_throughput_in_megabytes_per_second'] = results['scan_volume_in_megabytes'] / results['runtime_in_seconds']
-
-# PRINT RESULTS TO CONSOLE
-print('\n', json.dumps(results, indent=4))
+# Load test / benchmark for the Deep Instinct Agentless Connector.
+#
+# Submits scans concurrently through deepinstinctagentless and reports
+# throughput plus client-side latency percentiles (p50/p90/p99/max) and a
+# latency histogram for each combination of scan mode (binary/base64) and
+# concurrency level. A warmup phase is run and discarded before measuring.
+#
+# The files scanned come from --corpus (a folder), --file (one or more files),
+# or by default a synthetic corpus of random files whose sizes are drawn from
+# --size-distribution.
+#
+# Results are printed to the console and can be written as JSON (full detail
+# including the histogram) and/or appended to a CSV (one row per run) so runs
+# can be compared over time.
+#
+# Examples:
+#   python agentless_load_test.py --mock
+#   python agentless_load_test.py --scanner 192.168.0.50 --corpus ./samples --concurrency 1,8,32 --mode both
+#   python agentless_load_test.py --mock --scans 2000 --output-json results.json --output-csv results.csv
+
+import deepinstinctagentless as di
+import mock_agentless_connector
+import argparse, concurrent.futures, csv, datetime, itertools, json, math, os, random, sys, tempfile, time
+
+#Upper bounds (in milliseconds) of the latency histogram buckets
+histogram_buckets_ms = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000]
+
+size_units = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+#Converts a size such as '64KB' or '10MB' to bytes
+def parse_size(size):
+    size = size.strip().upper()
+    for unit in sorted(size_units, key=len, reverse=True):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * size_units[unit])
+    return int(size)
+
+
+#Converts '4KB:50,64KB:30,1MB:15' to [(4096, 50), (65536, 30), (1048576, 15)]
+def parse_size_distribution(size_distribution):
+    distribution = []
+    for entry in size_distribution.split(','):
+        size, weight = entry.split(':') if ':' in entry else (entry, 1)
+        distribution.append((parse_size(size), float(weight)))
+    return distribution
+
+
+#Writes file_count random files to folder with sizes drawn from distribution
+def create_synthetic_corpus(folder, file_count, distribution, seed=None):
+    generator = random.Random(seed)
+    sizes = generator.choices([size for size, weight in distribution], weights=[weight for size, weight in distribution], k=file_count)
+    file_names = []
+    for n, size in enumerate(sizes):
+        file_name = os.path.join(folder, f'synthetic_{n:05d}_{size}.bin')
+        with open(file_name, 'wb') as f:
+            f.write(os.urandom(size))
+        file_names.append(file_name)
+    return file_names
+
+
+#Returns the value at the given percentile (nearest-rank) of a sorted list
+def percentile(sorted_values, percent):
+    if len(sorted_values) == 0:
+        return None
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+#Counts latencies into the histogram buckets (the last bucket is overflow)
+def build_histogram(latencies_ms):
+    counts = [0] * (len(histogram_buckets_ms) + 1)
+    for latency in latencies_ms:
+        for i, upper_bound in enumerate(histogram_buckets_ms):
+            if latency <= upper_bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f'<={upper_bound}ms' for upper_bound in histogram_buckets_ms] + [f'>{histogram_buckets_ms[-1]}ms']
+    return dict(zip(labels, counts))
+
+
+#Submits scan_count scans (cycling through file_names) with up to concurrency
+#in flight, and returns a list of per-scan samples
+def execute_scans(file_names, scan_count, scanner_ips, concurrency, encoded, scanner_port, protocol, balancing):
+
+    balancer = di.ScannerBalancer(scanner_ips, balancing=balancing)
+
+    #scan a single file and time it from the client's point of view
+    def timed_scan(file_name):
+        scanner_ip = balancer.acquire()
+        start_time = time.perf_counter()
+        try:
+            verdict = di.scan_file(file_name, scanner_ip, encoded=encoded, scanner_port=scanner_port, protocol=protocol)
+            error = None if verdict != None else 'unexpected response'
+        except (di.requests.exceptions.RequestException, OSError) as e:
+            verdict = None
+            error = type(e).__name__
+        finally:
+            balancer.release(scanner_ip)
+        return {'file_name': file_name,
+                'file_size_in_bytes': os.path.getsize(file_name),
+                'scanner_ip': scanner_ip,
+                'latency_ms': (time.perf_counter() - start_time) * 1000,
+                'verdict': verdict['verdict'] if verdict != None else None,
+                'scan_duration_in_microseconds': verdict.get('scan_duration_in_microseconds', 0) if verdict != None else 0,
+                'error': error}
+
+    samples = []
+    scan_queue = itertools.islice(itertools.cycle(file_names), scan_count)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        #keep the pool full without queueing every scan up front
+        in_flight = {executor.submit(timed_scan, file_name) for file_name in itertools.islice(scan_queue, concurrency)}
+        while len(in_flight) > 0:
+            done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                samples.append(future.result())
+                for file_name in itertools.islice(scan_queue, 1):
+                    in_flight.add(executor.submit(timed_scan, file_name))
+            print('Completed scan', len(samples), 'of', scan_count, end='\r')
+    print()
+    return samples
+
+
+#Summarizes the samples from one run
+def summarize(samples, runtime, mode, concurrency):
+
+    successful_samples = [sample for sample in samples if sample['error'] == None]
+    latencies_ms = sorted(sample['latency_ms'] for sample in successful_samples)
+    scan_volume_in_megabytes = sum(sample['file_size_in_bytes'] for sample in successful_samples) / 1000000
+    scan_time_in_seconds = sum(sample['scan_duration_in_microseconds'] for sample in successful_samples) / 1000000
+
+    verdict_counts = {}
+    for sample in successful_samples:
+        verdict_counts[sample['verdict']] = verdict_counts.get(sample['verdict'], 0) + 1
+    error_counts = {}
+    for sample in samples:
+        if sample['error'] != None:
+            error_counts[sample['error']] = error_counts.get(sample['error'], 0) + 1
+
+    results = {}
+    results['mode'] = mode
+    results['concurrency'] = concurrency
+    results['scan_count'] = len(samples)
+    results['successful_scans'] = len(successful_samples)
+    results['failed_scans'] = len(samples) - len(successful_samples)
+    results['runtime_in_seconds'] = round(runtime, 3)
+    results['scans_per_second'] = round(len(successful_samples) / runtime, 2) if runtime > 0 else 0
+    results['scan_volume_in_megabytes'] = round(scan_volume_in_megabytes, 3)
+    results['net_throughput_in_megabytes_per_second'] = round(scan_volume_in_megabytes / runtime, 3) if runtime > 0 else 0
+    results['scan_time_in_seconds'] = round(scan_time_in_seconds, 3)
+    for name, percent in (('p50', 50), ('p90', 90), ('p99', 99)):
+        value = percentile(latencies_ms, percent)
+        results[f'{name}_latency_ms'] = round(value, 2) if value != None else None
+    results['max_latency_ms'] = round(latencies_ms[-1], 2) if len(latencies_ms) > 0 else None
+    results['mean_latency_ms'] = round(sum(latencies_ms) / len(latencies_ms), 2) if len(latencies_ms) > 0 else None
+    results['latency_histogram'] = build_histogram(latencies_ms)
+    results['verdicts'] = verdict_counts
+    results['errors'] = error_counts
+    return results
+
+
+#Appends one row per run to a CSV file, writing the header if the file is new
+def append_results_to_csv(file_name, all_results, run_metadata):
+    fields = ['timestamp', 'scanners', 'corpus_files', 'mode', 'concurrency', 'scan_count', 'successful_scans', 'failed_scans',
+              'runtime_in_seconds', 'scans_per_second', 'scan_volume_in_megabytes', 'net_throughput_in_megabytes_per_second',
+              'p50_latency_ms', 'p90_latency_ms', 'p99_latency_ms', 'max_latency_ms', 'mean_latency_ms']
+    write_header = not os.path.exists(file_name) or os.path.getsize(file_name) == 0
+    with open(file_name, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        if write_header:
+            writer.writeheader()
+        for results in all_results:
+            writer.writerow({**run_metadata, **results})
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Load test / benchmark for the Deep Instinct Agentless Connector')
+    parser.add_argument('--scanner', action='append', help='Scanner IP or hostname (repeat for several scanners)')
+    parser.add_argument('--port', type=int, default=5000, help='Scanner port (default 5000)')
+    parser.add_argument('--protocol', default='https', choices=['https', 'http'])
+    parser.add_argument('--mock', action='store_true', help='Start the bundled local mock connector and scan against it (offline)')
+    parser.add_argument('--mock-latency-ms', type=float, default=5, help='Base scan latency simulated by the mock connector')
+    parser.add_argument('--mode', default='binary', choices=['binary', 'base64', 'both'])
+    parser.add_argument('--concurrency', default='8', help='Scans in flight; comma separated to compare several levels, e.g. 1,8,32')
+    parser.add_argument('--scans', type=int, default=1000, help='Measured scans per run')
+    parser.add_argument('--warmup', type=int, default=50, help='Scans to run and discard before each measured run')
+    parser.add_argument('--balancing', default='round_robin', choices=['round_robin', 'least_outstanding'])
+    parser.add_argument('--corpus', help='Folder of files to scan')
+    parser.add_argument('--file', action='append', help='File to scan (repeatable)')
+    parser.add_argument('--corpus-files', type=int, default=100, help='Number of files in the synthetic corpus')
+    parser.add_argument('--size-distribution', default='4KB:40,64KB:30,512KB:20,4MB:10', help='Synthetic corpus sizes and weights')
+    parser.add_argument('--seed', type=int, help='Random seed for the synthetic corpus')
+    parser.add_argument('--output-json', help='Write full results (including histograms) to this JSON file')
+    parser.add_argument('--output-csv', help='Append one summary row per run to this CSV file')
+    args = parser.parse_args()
+
+    # SELECT THE SCANNERS
+    if args.mock:
+        server = mock_agentless_connector.start_server(base_latency_ms=args.mock_latency_ms)
+        scanner_ips = [server.server_address[0]]
+        args.port = server.server_address[1]
+        args.protocol = 'http'
+        print('INFO: Using local mock connector on port', args.port)
+    elif args.scanner:
+        scanner_ips = args.scanner
+    else:
+        parser.error('Specify --scanner (one or more) or --mock')
+
+    # BUILD THE CORPUS
+    with tempfile.TemporaryDirectory() as temp_folder:
+        if args.file:
+            file_names = args.file
+        elif args.corpus:
+            file_names = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus) if os.path.isfile(os.path.join(args.corpus, name)))
+        else:
+            distribution = parse_size_distribution(args.size_distribution)
+            file_names = create_synthetic_corpus(temp_folder, args.corpus_files, distribution, seed=args.seed)
+            print('INFO: Created synthetic corpus of', len(file_names), 'files,', round(sum(os.path.getsize(f) for f in file_names) / 1000000, 1), 'MB')
+        if len(file_names) == 0:
+            sys.exit('ERROR: The corpus is empty')
+
+        modes = ['binary', 'base64'] if args.mode == 'both' else [args.mode]
+        concurrency_levels = [int(value) for value in args.concurrency.split(',')]
+
+        # EXECUTE THE RUNS
+        all_results = []
+        for mode, concurrency in itertools.product(modes, concurrency_levels):
+            encoded = mode == 'base64'
+            print('INFO: Running', mode, 'scans at concurrency', concurrency)
+            if args.warmup > 0:
+                execute_scans(file_names, args.warmup, scanner_ips, concurrency, encoded, args.port, args.protocol, args.balancing)
+            start_time = time.perf_counter()
+            samples = execute_scans(file_names, args.scans, scanner_ips, concurrency, encoded, args.port, args.protocol, args.balancing)
+            results = summarize(samples, time.perf_counter() - start_time, mode, concurrency)
+            all_results.append(results)
+            print(json.dumps(results, indent=4))
+
+    if args.mock:
+        server.shutdown()
+
+    # WRITE RESULTS
+    run_metadata = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'scanners': ' '.join(scanner_ips) if not args.mock else 'mock',
+                    'corpus_files': len(file_names)}
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump({**run_metadata, 'warmup_scans': args.warmup, 'runs': all_results}, f, indent=4)
+        print('INFO: Results written to', args.output_json)
+    if args.output_csv:
+        append_results_to_csv(args.output_csv, all_results, run_metadata)
+        print('INFO: Results appended to', args.output_csv)
+
+
+if __name__ == '__main__':
+    main()
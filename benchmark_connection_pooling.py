@@ -0,0 +1,64 @@
+# benchmark_connection_pooling.py
+#
+# This script compares the legacy request pattern (a bare requests.get per
+# call, which opens a new connection every time) against the pooled,
+# keep-alive session owned by deepinstinct30.DeepInstinctClient. It starts the
+# local mock D-Appliance (mock_d_appliance.py), pages through its synthetic
+# device list both ways, and prints the number of connections (handshakes)
+# the server accepted plus the wall time for each approach.
+#
+# No DI server or network access is required.
+#
+# Usage: python benchmark_connection_pooling.py
+
+import deepinstinct30 as di
+import mock_d_appliance
+import requests, json, time
+
+#CONFIGURATION
+device_count = 20000
+
+
+# Page through all devices using a bare requests.get per page (legacy pattern)
+def collect_devices_without_pooling(base_url, key):
+    last_id = 0
+    collected_devices = []
+    while last_id != None:
+        response = requests.get(f'{base_url}/api/v1/devices?after_device_id={last_id}', headers={'accept': 'application/json', 'Authorization': key})
+        response = response.json()
+        last_id = response['last_id']
+        collected_devices.extend(response['devices'])
+    return collected_devices
+
+
+# Run one benchmark pass and return the results as a dictionary
+def run_pass(name, function, appliance):
+    appliance.reset_stats()
+    start_time = time.perf_counter()
+    devices = function()
+    runtime = time.perf_counter() - start_time
+    return {'mode': name,
+            'devices': len(devices),
+            'requests': appliance.stats['requests'],
+            'connections': appliance.stats['connections'],
+            'runtime_in_seconds': round(runtime, 3)}
+
+
+def main():
+    server = mock_d_appliance.start_server(device_count=device_count)
+    appliance = server.appliance
+
+    results = []
+    results.append(run_pass('requests.get per call', lambda: collect_devices_without_pooling(f'http://{server.fqdn}', appliance.key), appliance))
+
+    #lift the client's rate limit so only connection handling is compared
+    client = di.DeepInstinctClient(server.fqdn, appliance.key, protocol='http', requests_per_second=10000)
+    with client, client.activate():
+        results.append(run_pass('DeepInstinctClient session', lambda: di.get_devices(), appliance))
+
+    server.shutdown()
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
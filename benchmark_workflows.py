@@ -0,0 +1,209 @@
+# benchmark_workflows.py
+#
+# This script benchmarks end-to-end deepinstinct30 workflows against the local
+# mock D-Appliance (mock_d_appliance.py) so that the effect of a change to the
+# wrapper can be measured reproducibly, without a DI server or network access.
+#
+# For each fleet size (devices and events) it runs these workflows:
+#   get_devices            di.get_devices()
+#   get_devices_parallel   di.get_devices(parallel=True)
+#   get_events             di.get_events()
+#   get_policies           di.get_policies(include_policy_data=True, include_allow_deny_lists=True, parallel=True)
+#   export_events          di.export_events()
+#   prevention_readiness   prevention_readiness.run_prevention_readiness() with its default criteria
+#                          (live event reads)
+#   prevention_readiness_event_store
+#                          the same, reading events through the local event store
+#   migrate_policies       di.migrate_policies() from MSP 1 to MSP 2
+#
+# and records wall time, request count, bytes transferred (request plus
+# response bodies, as counted by the mock server) and peak RSS. Each workflow
+# runs in its own Python process (so peak RSS is per workflow) inside a
+# temporary folder (so exported files are discarded).
+#
+# Results can be saved as a baseline and later runs compared against it. Any
+# metric which is worse than the baseline by more than the tolerance is flagged
+# as a regression and the script exits with status 1, so it can gate CI.
+#
+# Examples:
+#   python benchmark_workflows.py --sizes 1000,10000 --save-baseline
+#   python benchmark_workflows.py --sizes 1000,10000
+#   python benchmark_workflows.py --workflows get_devices,get_events --sizes 100000 --output-json results.json
+
+import argparse, datetime, json, os, statistics, subprocess, sys, tempfile, time
+
+workflow_names = ['get_devices', 'get_devices_parallel', 'get_events', 'get_policies', 'export_events', 'prevention_readiness', 'prevention_readiness_event_store', 'migrate_policies']
+
+#Criteria passed to prevention_readiness (the defaults offered by its prompts)
+prevention_readiness_config = {'min_days_since_deployment': 10, 'max_days_since_last_contact': 3, 'max_weekly_event_rate': 2,
+                               'include_closed_events': False, 'include_ransomware_behavior_events': True,
+                               'include_in_memory_protection_events': True, 'minimum_event_id': 0, 'use_local_event_store': False}
+
+#Metrics compared against the baseline, and the relative slack allowed on each
+#when --tolerance is not overridden (request and byte counts are deterministic)
+compared_metrics = {'wall_time_in_seconds': None, 'peak_rss_in_megabytes': None, 'requests': 0.01, 'bytes_transferred': 0.01}
+
+
+#Returns the peak resident set size of this process in MB, or None where the
+#platform does not provide it
+def get_peak_rss_in_megabytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+#Runs a single workflow in this process (invoked by run_workflow in a child
+#process) and writes its wall time and peak RSS to result_file
+def run_worker(workflow, fqdn, key, requests_per_second, result_file):
+    import deepinstinct30 as di
+
+    client = di.DeepInstinctClient(fqdn, key, protocol='http', requests_per_second=requests_per_second)
+    start_time = time.perf_counter()
+    with client, client.activate():
+        if workflow == 'get_devices':
+            di.get_devices()
+        elif workflow == 'get_devices_parallel':
+            di.get_devices(parallel=True)
+        elif workflow == 'get_events':
+            di.get_events()
+        elif workflow == 'get_policies':
+            di.get_policies(include_policy_data=True, include_allow_deny_lists=True, parallel=True)
+        elif workflow == 'export_events':
+            di.export_events()
+        elif workflow == 'prevention_readiness':
+            import prevention_readiness
+            prevention_readiness.run_prevention_readiness(fqdn, key, dict(prevention_readiness_config))
+        elif workflow == 'prevention_readiness_event_store':
+            import prevention_readiness
+            prevention_readiness.run_prevention_readiness(fqdn, key, {**prevention_readiness_config, 'use_local_event_store': True})
+        elif workflow == 'migrate_policies':
+            di.migrate_policies(source_msp_id=1, destination_msp_id=2)
+    wall_time = time.perf_counter() - start_time
+
+    with open(result_file, 'w') as f:
+        json.dump({'wall_time_in_seconds': round(wall_time, 3), 'peak_rss_in_megabytes': get_peak_rss_in_megabytes()}, f)
+
+
+#Runs one workflow in a child process against the mock server and returns its
+#metrics combined with the request and byte counts seen by the server
+def run_workflow(workflow, server, requests_per_second):
+    appliance = server.appliance
+    with tempfile.TemporaryDirectory() as temp_folder:
+        result_file = os.path.join(temp_folder, 'result.json')
+        appliance.reset_stats()
+        #answer NO to any interactive prompt (such as moving devices)
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', workflow, '--fqdn', server.fqdn, '--key', appliance.key,
+                                  '--requests-per-second', str(requests_per_second), '--result-file', result_file],
+                                 cwd=temp_folder, input='NO\n' * 100, capture_output=True, text=True,
+                                 env={**os.environ, 'PYTHONPATH': os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH', '')])})
+        if process.returncode != 0 or not os.path.exists(result_file):
+            print('ERROR: Workflow', workflow, 'failed with exit code', process.returncode)
+            print(process.stderr[-2000:])
+            return None
+        with open(result_file) as f:
+            results = json.load(f)
+    results['requests'] = appliance.stats['requests']
+    results['bytes_transferred'] = appliance.stats['bytes_sent'] + appliance.stats['bytes_received']
+    results['status_codes'] = {str(code): count for code, count in appliance.stats['status_codes'].items()}
+    return results
+
+
+#Compares results to a baseline and returns a list of regression descriptions
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous == None or current == None:
+            continue
+        for metric, default_tolerance in compared_metrics.items():
+            allowed = tolerance if default_tolerance == None else default_tolerance
+            if current.get(metric) == None or previous.get(metric) in (None, 0):
+                continue
+            change = current[metric] / previous[metric] - 1
+            if change > allowed:
+                regressions.append(f'{name} {metric}: {previous[metric]} -> {current[metric]} (+{round(change * 100, 1)}%)')
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark end-to-end deepinstinct30 workflows against a local mock D-Appliance')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated fleet sizes (devices and events)')
+    parser.add_argument('--workflows', default=','.join(workflow_names), help='Comma separated workflows to run')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per workflow; the median wall time is reported')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latency injected by the mock server per request')
+    parser.add_argument('--requests-per-second', type=int, default=1000, help='Client rate limit used during the benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='Baseline file to compare against / save to')
+    parser.add_argument('--save-baseline', action='store_true', help='Save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative increase in wall time and peak RSS before flagging')
+    parser.add_argument('--output-json', help='Write the results to this JSON file')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--fqdn', help=argparse.SUPPRESS)
+    parser.add_argument('--key', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args.worker, args.fqdn, args.key, args.requests_per_second, args.result_file)
+
+    import mock_d_appliance
+
+    workflows = args.workflows.split(',')
+    for workflow in workflows:
+        if workflow not in workflow_names:
+            parser.error(f'Unknown workflow {workflow}, choose from {",".join(workflow_names)}')
+
+    # RUN THE BENCHMARKS
+    results = {}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        #two MSPs so that migrate_policies has a destination
+        server = mock_d_appliance.start_server(device_count=size, event_count=size, msp_count=2, seed=args.seed, latency_ms=args.latency_ms)
+        for workflow in workflows:
+            name = f'{workflow}@{size}'
+            print('INFO: Running', name)
+            runs = [run_workflow(workflow, server, args.requests_per_second) for n in range(args.repeat)]
+            if None in runs:
+                results[name] = None
+                continue
+            results[name] = runs[-1]
+            results[name]['wall_time_in_seconds'] = round(statistics.median(run['wall_time_in_seconds'] for run in runs), 3)
+            print('     ', json.dumps({metric: results[name][metric] for metric in compared_metrics}))
+        server.shutdown()
+
+    # COMPARE TO BASELINE
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline['results'], args.tolerance)
+        print()
+        if len(regressions) > 0:
+            print('WARNING:', len(regressions), 'regression(s) compared to baseline', args.baseline, 'from', baseline['timestamp'])
+            for regression in regressions:
+                print('\t', regression)
+        else:
+            print('INFO: No regressions compared to baseline', args.baseline, 'from', baseline['timestamp'])
+
+    # WRITE RESULTS
+    output = {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+              'requests_per_second': args.requests_per_second, 'latency_ms': args.latency_ms, 'results': results, 'regressions': regressions}
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(output, f, indent=4)
+        print('INFO: Baseline saved to', args.baseline)
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(output, f, indent=4)
+        print('INFO: Results written to', args.output_json)
+
+    if len(regressions) > 0 or None in results.values():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
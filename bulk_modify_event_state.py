@@ -36,13 +36,19 @@
 #    to review the Excel document written to disk *before* answering "YES" to
 #    proceeding (when prompted).
 
+# Note on use_local_event_store: the local event store only downloads new
+# events and events closed since its previous sync, so it does not see other
+# changes to events it already holds (reopened, archived, reoccurrence and
+# close fields). When it is enabled, the selected events are re-fetched from
+# the server and filtered again before any action is taken.
+
 
 #import API Wrapper
 # Note: Always use latest from https://github.com/pvz01/deepinstinct_rest_api_wrapper/blob/main/deepinstinct30.py
 import deepinstinct30 as di
 
 #import additional libraries
-import json, datetime, pandas, sys
+import json, datetime, pandas, sys, concurrent.futures
 from dateutil import parser
 
 #server configuration
@@ -53,6 +59,11 @@ di.key = 'API-KEY'
 close_events = True
 archive_events = False
 
+#when enabled, events are read from a local event store which is synced
+#incrementally (only new/recently closed events are downloaded on each run),
+#and the selected events are re-fetched from the server before acting on them
+use_local_event_store = False
+
 #prompt for server configuration (unless hardcded values were provided above)
 if di.fqdn == 'SERVER-NAME.customers.deepinstinctweb.com':
     di.fqdn = input('FQDN of DI Server? ')
@@ -63,21 +74,42 @@ if di.key == 'API-KEY':
 #gathers events from the server 50 at a time
 di.debug_mode = True
 
-#get all events from server
-all_events = di.get_events()
+#get all events from server (or from the local event store)
+if use_local_event_store:
+    with di.EventStore() as event_store:
+        event_store.sync()
+        all_events = event_store.get_events()
+else:
+    all_events = di.get_events()
 print('INFO:', len(all_events), 'total visible events on server')
 
 #filter the events
-filtered_events = []
-for event in all_events:
+def event_matches_filter(event):
     if event['status'] in ['OPEN']:
         if event['recorded_device_info']['hostname'] in ['HOSTNAME01']:
             if event['type'] in ['REFLECTIVE_DOTNET']:
                 if event['path'] in ['C:\\Program Files (x86)\\Microsoft SQL Server\\100\\DTS\\Binn\\DTExec.exe']:
-                    filtered_events.append(event)
+                    return True
             if event['type'] in ['AMSI_BYPASS']:
                 if event['path'] in ['C:\\Program Files (x86)\\Microsoft SQL Server\\100\\DTS\\Binn\\SQLPS.exe']:
-                    filtered_events.append(event)
+                    return True
+    return False
+
+filtered_events = []
+for event in all_events:
+    if event_matches_filter(event):
+        filtered_events.append(event)
+
+#the local event store may hold stale copies of events (see note at top), so
+#re-fetch the selected events from the server and filter them again
+if use_local_event_store and len(filtered_events) > 0:
+    print('INFO: Re-fetching', len(filtered_events), 'selected events from server to confirm their current state')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        current_events = list(executor.map(di.get_event, [event['id'] for event in filtered_events]))
+    filtered_events = []
+    for event in current_events:
+        if event and event_matches_filter(event):
+            filtered_events.append(event)
 
 
 #write data to disk
@@ -97,22 +129,18 @@ event_id_list = []
 for event in filtered_events:
     event_id_list.append(event['id'])
 
-#break event_id_list into a list of smaller lists
-batch_size = 250
-event_id_list_broken_into_batches = [event_id_list[i:i + batch_size] for i in range(0, len(event_id_list), batch_size)]
-print('\nINFO: The', len(event_id_list), 'event IDs have been broken into', len(event_id_list_broken_into_batches), 'batches of', batch_size)
-
-#iterate through the batches of event ids
-batch_number = 1
-for batch in event_id_list_broken_into_batches:
-    print('Processing batch', batch_number, 'of', len(event_id_list_broken_into_batches))
-    if close_events:
-        #close the events
-        print('  Closing', len(batch), 'events')
-        di.close_events(batch)
-
-    if archive_events:
-        #archive the events
-        print('  Archiving', len(batch), 'events')
-        di.archive_events(batch)
-    batch_number += 1
+#apply the action(s); the wrapper splits the ids into batches of the size the
+#server accepts, sends the batches concurrently and retries failed batches
+if close_events:
+    #close the events
+    print('\nINFO: Closing', len(event_id_list), 'events')
+    report = di.bulk_event_action(event_id_list, 'close')
+    if report['failed_count'] > 0:
+        print('ERROR: Failed to close events', report['failed_event_ids'])
+
+if archive_events:
+    #archive the events
+    print('\nINFO: Archiving', len(event_id_list), 'events')
+    report = di.bulk_event_action(event_id_list, 'archive')
+    if report['failed_count'] > 0:
+        print('ERROR: Failed to archive events', report['failed_event_ids'])
@@ -28,27 +28,874 @@
 debug_mode = False
 
 # Import various libraries used by one or more method below.
-import requests, json, datetime, pandas, re, ipaddress, time, os
+import requests, json, datetime, pandas, re, ipaddress, time, os, contextlib, contextvars, threading, concurrent.futures, sqlite3, random, email.utils, logging, sys, bisect, csv, gzip, bz2, lzma, collections
 #If any of the above throw import errors, try running 'pip install library_name'
 #If that doesn't fix the problem I recommend to search Google for the error
 #that you are getting.
 
-# Export Device List to disk in Excel format
-def export_devices(include_deactivated=False):
-    #get the devices from server
-    devices = get_devices(include_deactivated=include_deactivated)
-    #convert to Pandas Data Frame
-    devices_df = pandas.DataFrame(devices)
+
+# Defaults for the request executor used by DeepInstinctClient (see below).
+# These can be modified at runtime, for example: di.max_requests_per_second = 10
+max_requests_per_second = 25  #token bucket rate, shared by all clients for a server
+max_retries = 5               #retries per request on 429/5xx/connection errors/timeouts
+retry_budget_ratio = 0.2      #retries allowed as a fraction of requests sent
+request_timeout = 60          #seconds, applied when a method does not set one
+
+# HTTP status codes which are treated as transient and retried
+retryable_status_codes = (429, 500, 502, 503, 504)
+
+# HTTP methods which are retried on any of the above and on connection errors
+# and timeouts. Other methods (such as POST) may not be safe to send twice, so
+# they are only retried when the server cannot have processed the request: on
+# the status codes in unprocessed_status_codes and when the connection could
+# not be established. Read-only POSTs (such as event searches) pass
+# idempotent=True to the client to be retried like a GET.
+idempotent_methods = ('GET', 'HEAD')
+unprocessed_status_codes = (429, 503)
+
+
+# Token bucket rate limiter. acquire() blocks until a token is available. The
+# rate adapts to the server: it is halved every time the server throttles us
+# (HTTP 429) and creeps back up towards max_rate on each success.
+class RateLimiter:
+
+    def __init__(self, max_rate, burst=None):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.burst = burst or max_rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    #server told us to slow down
+    def penalize(self):
+        with self.lock:
+            self.rate = max(1, self.rate / 2)
+
+    #request succeeded
+    def reward(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+    #change the configured rate (and the burst too, unless it was set explicitly)
+    def set_max_rate(self, max_rate):
+        with self.lock:
+            if self.burst == self.max_rate:
+                self.burst = max_rate
+                self.tokens = min(self.tokens, self.burst)
+            self.max_rate = max_rate
+            self.rate = min(self.rate, max_rate)
+
+
+# Retry budget which caps retries at a fraction of requests sent (plus a small
+# allowance), so that a struggling server is not hit with a retry storm
+class RetryBudget:
+
+    def __init__(self, ratio, minimum=10):
+        self.ratio = ratio
+        self.balance = minimum
+        self.maximum = minimum * 10
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.balance = min(self.maximum, self.balance + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.balance >= 1:
+                self.balance -= 1
+                return True
+            return False
+
+
+# One rate limiter per server, shared by every client for that server. A
+# client created with an explicit requests_per_second sets the rate for every
+# client of that server; clients without one use the server's existing rate
+# (max_requests_per_second for the first client).
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def _get_rate_limiter(fqdn, rate=None):
+    with _rate_limiters_lock:
+        if fqdn not in _rate_limiters:
+            _rate_limiters[fqdn] = RateLimiter(rate or max_requests_per_second)
+        elif rate != None:
+            _rate_limiters[fqdn].set_max_rate(rate)
+        return _rate_limiters[fqdn]
+
+
+# Calculates seconds to wait before retry number attempt (starting at 0):
+# Retry-After from the server if provided, otherwise exponential backoff with
+# full jitter, capped at 60 seconds
+def _get_retry_delay(attempt, response=None):
+    if response != None and 'Retry-After' in response.headers:
+        retry_after = response.headers['Retry-After']
+        try:
+            return max(0, float(retry_after))
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(60, 2 ** attempt))
+
+
+# INSTRUMENTATION
+#
+# Every request attempt made by a DeepInstinctClient is described by a record
+# (a dictionary with server, method, endpoint, url, status_code, error,
+# attempt, start_time, duration_seconds, request_bytes and response_bytes),
+# which is passed to each callable in request_hooks. The built-in hooks are:
+#   --> the stats collector, always on, summarized per endpoint by stats()
+#   --> RequestTrace, an optional per-run JSON trace file (see start_trace())
+#   --> logging of each request at DEBUG level to di.logger
+# Prometheus text format is available from prometheus_text() and
+# write_prometheus_textfile().
+#
+# Custom hooks can be added, for example:
+#   di.request_hooks.append(lambda record: print(record['endpoint'], record['duration_seconds']))
+
+# All of the wrapper's messages (progress, warnings and errors) are logged to
+# this logger, so applications can filter, silence or route them. Records
+# propagate to the application's logging configuration as usual; until the
+# application configures logging (adds a handler to the root logger) they are
+# printed to stdout instead, so scripts show progress without any setup.
+# Per-page and per-request messages are logged at DEBUG level.
+# To show errors only: di.logger.setLevel(logging.ERROR)
+# To see every page and request: di.logger.setLevel(logging.DEBUG)
+logger = logging.getLogger('deepinstinct30')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout)
+    _log_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    _log_handler.addFilter(lambda record: len(logging.getLogger().handlers) == 0)
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+
+# Upper bounds (in seconds) of the request latency histogram buckets
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Callables invoked with the record of every request attempt
+request_hooks = []
+
+
+# Converts a request URL to an endpoint name by dropping the server and query
+# string and replacing ids and hashes with placeholders, so that for example
+# https://foo/api/v1/policies/12/data?x=1 becomes /api/v1/policies/{id}/data
+def _get_endpoint(request_url):
+    path = request_url.split('://', 1)[-1].split('?', 1)[0]
+    path = '/' + path.split('/', 1)[1] if '/' in path else '/'
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', path)
+    return re.sub(r'/[0-9a-fA-F]{32,}(?=/|$)', '/{hash}', path)
+
+
+# Aggregates request records per (server, method, endpoint)
+class RequestStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def __call__(self, record):
+        key = (record['server'], record['method'], record['endpoint'])
+        with self.lock:
+            entry = self.endpoints.get(key)
+            if entry == None:
+                entry = {'requests': 0, 'retries': 0, 'errors': 0, 'status_codes': {}, 'total_seconds': 0, 'max_seconds': 0,
+                         'latency_histogram': [0] * (len(latency_buckets) + 1), 'request_bytes': 0, 'response_bytes': 0}
+                self.endpoints[key] = entry
+            entry['requests'] += 1
+            if record['attempt'] > 0:
+                entry['retries'] += 1
+            if record['error'] != None:
+                entry['errors'] += 1
+            else:
+                entry['status_codes'][record['status_code']] = entry['status_codes'].get(record['status_code'], 0) + 1
+            entry['total_seconds'] += record['duration_seconds']
+            entry['max_seconds'] = max(entry['max_seconds'], record['duration_seconds'])
+            for i, upper_bound in enumerate(latency_buckets):
+                if record['duration_seconds'] <= upper_bound:
+                    entry['latency_histogram'][i] += 1
+                    break
+            else:
+                entry['latency_histogram'][-1] += 1
+            entry['request_bytes'] += record['request_bytes']
+            entry['response_bytes'] += record['response_bytes']
+
+    # Returns a copy of the raw per (server, method, endpoint) data
+    def snapshot(self):
+        with self.lock:
+            return {key: json.loads(json.dumps(entry)) for key, entry in self.endpoints.items()}
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+
+_request_stats = RequestStats()
+request_hooks.append(_request_stats)
+
+
+# Returns request statistics per endpoint ('METHOD /endpoint'), optionally
+# limited to one server: request and retry counts, errors (no response at
+# all), status code counts, average/max latency in ms, a latency histogram
+# (keyed by bucket upper bound) and request/response bytes. Sorted by total
+# time spent, so the slowest endpoints come first.
+def stats(fqdn=None):
+    merged = {}
+    for (server, method, endpoint), entry in _request_stats.snapshot().items():
+        if fqdn != None and server != fqdn:
+            continue
+        name = f'{method} {endpoint}'
+        if name not in merged:
+            merged[name] = entry
+            continue
+        total = merged[name]
+        for field in ('requests', 'retries', 'errors', 'total_seconds', 'request_bytes', 'response_bytes'):
+            total[field] += entry[field]
+        total['max_seconds'] = max(total['max_seconds'], entry['max_seconds'])
+        total['latency_histogram'] = [a + b for a, b in zip(total['latency_histogram'], entry['latency_histogram'])]
+        for status_code, count in entry['status_codes'].items():
+            total['status_codes'][status_code] = total['status_codes'].get(status_code, 0) + count
+
+    results = {}
+    for name, entry in sorted(merged.items(), key=lambda item: item[1]['total_seconds'], reverse=True):
+        labels = [f'<={upper_bound}s' for upper_bound in latency_buckets] + [f'>{latency_buckets[-1]}s']
+        results[name] = {'requests': entry['requests'],
+                         'retries': entry['retries'],
+                         'errors': entry['errors'],
+                         'status_codes': {int(code): count for code, count in entry['status_codes'].items()},
+                         'total_seconds': round(entry['total_seconds'], 3),
+                         'avg_ms': round(entry['total_seconds'] / entry['requests'] * 1000, 1),
+                         'max_ms': round(entry['max_seconds'] * 1000, 1),
+                         'latency_histogram': dict(zip(labels, entry['latency_histogram'])),
+                         'request_bytes': entry['request_bytes'],
+                         'response_bytes': entry['response_bytes']}
+    return results
+
+
+# Clears the statistics returned by stats()
+def reset_stats():
+    _request_stats.reset()
+
+
+# Returns the request statistics in Prometheus text exposition format
+def prometheus_text():
+    lines = []
+
+    def label_text(server, method, endpoint, **extra_labels):
+        labels = {'server': server, 'method': method, 'endpoint': endpoint, **extra_labels}
+        return '{' + ','.join(f'{name}="{str(value)}"' for name, value in labels.items()) + '}'
+
+    snapshot = _request_stats.snapshot()
+    lines.append('# HELP deepinstinct_requests_total Requests sent to the DI server, by response status code')
+    lines.append('# TYPE deepinstinct_requests_total counter')
+    for (server, method, endpoint), entry in snapshot.items():
+        for status_code, count in entry['status_codes'].items():
+            lines.append(f'deepinstinct_requests_total{label_text(server, method, endpoint, status=status_code)} {count}')
+    for metric, field, help_text in (('deepinstinct_request_retries_total', 'retries', 'Requests which were retries of an earlier attempt'),
+                                     ('deepinstinct_request_errors_total', 'errors', 'Requests which failed without a response'),
+                                     ('deepinstinct_request_bytes_total', 'request_bytes', 'Request body bytes sent'),
+                                     ('deepinstinct_response_bytes_total', 'response_bytes', 'Response body bytes received')):
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for (server, method, endpoint), entry in snapshot.items():
+            lines.append(f'{metric}{label_text(server, method, endpoint)} {entry[field]}')
+    lines.append('# HELP deepinstinct_request_duration_seconds Request latency')
+    lines.append('# TYPE deepinstinct_request_duration_seconds histogram')
+    for (server, method, endpoint), entry in snapshot.items():
+        cumulative_count = 0
+        for upper_bound, count in zip(list(latency_buckets) + ['+Inf'], entry['latency_histogram']):
+            cumulative_count += count
+            lines.append(f'deepinstinct_request_duration_seconds_bucket{label_text(server, method, endpoint, le=upper_bound)} {cumulative_count}')
+        lines.append(f'deepinstinct_request_duration_seconds_sum{label_text(server, method, endpoint)} {entry["total_seconds"]}')
+        lines.append(f'deepinstinct_request_duration_seconds_count{label_text(server, method, endpoint)} {entry["requests"]}')
+    return '\n'.join(lines) + '\n'
+
+
+# Writes prometheus_text() to a file, for example for the node_exporter
+# textfile collector. The file is replaced atomically.
+def write_prometheus_textfile(file_name):
+    with open(f'{file_name}.tmp', 'w') as f:
+        f.write(prometheus_text())
+    os.replace(f'{file_name}.tmp', file_name)
+
+
+# Request hook which writes every request attempt to a JSON trace file in
+# Trace Event Format, which can be opened in chrome://tracing or Perfetto to
+# see a timeline of requests per thread. Use start_trace() and stop_trace().
+class RequestTrace:
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.file = open(file_name, 'w')
+        self.file.write('{"traceEvents": [\n')
+        self.first_event = True
+
+    def __call__(self, record):
+        event = {'name': f'{record["method"]} {record["endpoint"]}', 'cat': record['server'], 'ph': 'X',
+                 'ts': round(record['start_time'] * 1000000), 'dur': round(record['duration_seconds'] * 1000000),
+                 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'args': {field: record[field] for field in ('url', 'status_code', 'error', 'attempt', 'request_bytes', 'response_bytes')}}
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(('' if self.first_event else ',\n') + json.dumps(event))
+            self.first_event = False
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.write('\n]}\n')
+                self.file.close()
+
+
+# Starts writing a JSON trace of all requests to file_name (by default a
+# timestamped file in the current folder) and returns the RequestTrace
+def start_trace(file_name=None):
+    if file_name == None:
+        file_name = f'request_trace_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M.%S")}.json'
+    trace = RequestTrace(file_name)
+    request_hooks.append(trace)
+    return trace
+
+
+# Stops and closes a trace started with start_trace()
+def stop_trace(trace):
+    if trace in request_hooks:
+        request_hooks.remove(trace)
+    trace.close()
+
+
+# Builds the record for one request attempt and passes it to the hooks. Body
+# sizes are taken from the requests response unless provided.
+def _record_request(client, method, request_url, attempt, start_time, duration, response=None, error=None, request_bytes=None):
+    if request_bytes == None:
+        request_body = response.request.body if response != None else None
+        request_bytes = len(request_body) if isinstance(request_body, (bytes, str)) else 0
+    record = {'server': client.fqdn,
+              'method': method,
+              'endpoint': _get_endpoint(request_url),
+              'url': request_url,
+              'status_code': response.status_code if response != None else None,
+              'error': type(error).__name__ if error != None else None,
+              'attempt': attempt,
+              'start_time': start_time,
+              'duration_seconds': duration,
+              'request_bytes': request_bytes,
+              'response_bytes': len(response.content) if response != None else 0}
+    logger.debug('%s %s returned %s in %d ms', method, request_url, record['status_code'] or record['error'], duration * 1000, extra={'request': record})
+    for hook in list(request_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            logger.error('Request hook %r failed: %s', hook, e)
+
+
+# A client object which holds the server name and API key for one DI server
+# plus a keep-alive requests.Session with a connection pool. Reusing the pooled
+# connections avoids a fresh TCP+TLS handshake on every request, which on large
+# servers (hundreds of pages of devices/events) is a big share of the runtime.
+#
+# Every request goes through request(), which is the central request executor:
+# it waits for a token from the server's rate limiter, applies a default
+# timeout, and retries 429/5xx responses, connection errors and timeouts with
+# exponential backoff and jitter (honoring Retry-After), within a retry budget.
+# Requests which are not idempotent are retried only when the server cannot
+# have processed them (see idempotent_methods above).
+#
+# All of the module-level methods below run against the client returned by
+# get_client(). By default that is a shared client built from di.fqdn/di.key,
+# so existing code keeps working unchanged. To run against a specific client
+# instead, use it as a context, for example:
+#
+#   client = di.DeepInstinctClient('foo.customers.deepinstinctweb.com', 'API-KEY')
+#   with client.activate():
+#       devices = di.get_devices()
+#
+class DeepInstinctClient:
+
+    def __init__(self, fqdn, key, pool_connections=10, pool_maxsize=20, protocol='https', requests_per_second=None, retries=None):
+        self.fqdn = fqdn
+        self.key = key
+        self.protocol = protocol
+        self.pool_maxsize = pool_maxsize
+        #keep-alive session with a connection pool sized for parallel requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        #rate limiting and retry configuration (module defaults unless provided)
+        self.rate_limiter = _get_rate_limiter(fqdn, requests_per_second)
+        self.max_retries = max_retries if retries == None else retries
+        self.retry_budget = RetryBudget(retry_budget_ratio)
+
+    # Root URL of the server, used by all methods to calculate request URLs
+    @property
+    def base_url(self):
+        return f'{self.protocol}://{self.fqdn}'
+
+    # Send a request using the pooled session (same arguments as
+    # requests.request), with rate limiting and retries. Returns the final
+    # response, or raises the final exception if every attempt failed to
+    # get a response at all. idempotent defaults to True for GET and HEAD.
+    def request(self, method, request_url, idempotent=None, **kwargs):
+        kwargs.setdefault('timeout', request_timeout)
+        if idempotent == None:
+            idempotent = method.upper() in idempotent_methods
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            self.retry_budget.deposit()
+            start_time = time.time()
+            try:
+                response = self.session.request(method, request_url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                _record_request(self, method, request_url, attempt, start_time, time.time() - start_time, error=e)
+                #only a failed connect guarantees the request was never sent
+                if not idempotent and not isinstance(e, requests.exceptions.ConnectTimeout):
+                    raise
+                if attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    raise
+                delay = _get_retry_delay(attempt)
+                logger.warning('%s on %s %s . Retrying in %.1f seconds.', type(e).__name__, method, request_url, delay)
+            else:
+                _record_request(self, method, request_url, attempt, start_time, time.time() - start_time, response=response)
+                if response.status_code not in (retryable_status_codes if idempotent else unprocessed_status_codes):
+                    self.rate_limiter.reward()
+                    return response
+                if response.status_code == 429:
+                    self.rate_limiter.penalize()
+                if attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    return response
+                delay = _get_retry_delay(attempt, response)
+                logger.warning('Return code %s on %s %s . Retrying in %.1f seconds.', response.status_code, method, request_url, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, request_url, **kwargs):
+        return self.request('GET', request_url, **kwargs)
+
+    def post(self, request_url, **kwargs):
+        return self.request('POST', request_url, **kwargs)
+
+    def put(self, request_url, **kwargs):
+        return self.request('PUT', request_url, **kwargs)
+
+    def delete(self, request_url, **kwargs):
+        return self.request('DELETE', request_url, **kwargs)
+
+    # Make this client the one used by the module-level methods (in the
+    # current thread/context) for the duration of a with block
+    @contextlib.contextmanager
+    def activate(self):
+        token = _active_client.set(self)
+        try:
+            yield self
+        finally:
+            _active_client.reset(token)
+
+    # Request statistics for this client's server (see stats() below)
+    def stats(self):
+        return stats(self.fqdn)
+
+    # Close the pooled connections
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Client bound via DeepInstinctClient.activate() (if any)
+_active_client = contextvars.ContextVar('deepinstinct30_active_client', default=None)
+
+# Shared client built from the module-level fqdn and key
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+# Returns the client that the module-level methods should use
+def get_client():
+    global _default_client
+
+    #an explicitly activated client takes precedence
+    client = _active_client.get()
+    if client != None:
+        return client
+
+    #otherwise reuse the shared client, rebuilding it if di.fqdn or di.key changed
+    #(closing the replaced client's pooled connections)
+    with _default_client_lock:
+        if _default_client == None or _default_client.fqdn != fqdn or _default_client.key != key:
+            if _default_client != None:
+                _default_client.close()
+            _default_client = DeepInstinctClient(fqdn, key)
+        return _default_client
+
+
+# MULTI-SERVER FAN-OUT
+#
+# Runs any method in this module against many servers at once, each through
+# its own DeepInstinctClient on its own thread, so that a fleet-wide report
+# takes about as long as the slowest server instead of the sum of all of them.
+#
+# servers is a list of dictionaries with 'fqdn' and 'key', an optional 'name'
+# (defaults to the fqdn) and optionally any other DeepInstinctClient argument
+# such as 'requests_per_second' or 'protocol'. (fqdn, key) tuples also work.
+# Any further arguments are passed to function on every server.
+#
+# Returns one entry per server, in the order given:
+#   {'server': name, 'fqdn': fqdn, 'result': return value of function,
+#    'error': None or the exception raised, 'runtime_in_seconds': float}
+# An exception on one server is logged and recorded but does not stop the
+# others.
+#
+#   servers = [{'name': 'us', 'fqdn': 'us.customers.deepinstinctweb.com', 'key': 'API-KEY'},
+#              {'name': 'eu', 'fqdn': 'eu.customers.deepinstinctweb.com', 'key': 'API-KEY'}]
+#   results = di.run_on_servers(servers, di.get_devices, include_deactivated=False)
+#   devices = di.merge_server_results(results)
+#
+def run_on_servers(servers, function, *args, max_workers=8, **kwargs):
+    server_configs = []
+    for server in servers:
+        if isinstance(server, dict):
+            server = dict(server)
+        else:
+            server = {'fqdn': server[0], 'key': server[1]}
+        server_configs.append(server)
+
+    def run_on_server(server):
+        name = server.pop('name', server['fqdn'])
+        result = {'server': name, 'fqdn': server['fqdn'], 'result': None, 'error': None}
+        start_time = time.perf_counter()
+        try:
+            with DeepInstinctClient(**server) as client, client.activate():
+                result['result'] = function(*args, **kwargs)
+        except Exception as e:
+            logger.error('%s failed on server %s: %s: %s', getattr(function, '__name__', function), name, type(e).__name__, e)
+            result['error'] = e
+        result['runtime_in_seconds'] = round(time.perf_counter() - start_time, 3)
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(server_configs)))) as executor:
+        return list(executor.map(run_on_server, server_configs))
+
+
+# Merges the results of run_on_servers into a single list. Lists are
+# concatenated in server order and a single dictionary counts as a list of one.
+# Each dictionary is copied and tagged with the server name in tag_field.
+# Servers which returned an error or None are skipped.
+def merge_server_results(results, tag_field='server'):
+    merged = []
+    for server_result in results:
+        if server_result['error'] != None or server_result['result'] == None:
+            continue
+        records = server_result['result']
+        if isinstance(records, dict):
+            records = [records]
+        for record in records:
+            if isinstance(record, dict):
+                record = {**record, tag_field: server_result['server']}
+            merged.append(record)
+    return merged
+
+
+# STREAMING EXPORTS
+#
+# The export_* methods write through an ExportWriter, which streams rows to
+# disk as pages arrive from the server, so memory use stays bounded however
+# large the export is. Supported formats:
+#   xlsx     Excel, using openpyxl's write-only mode. A sheet which reaches
+#            Excel's row limit rolls over to a new sheet (Event_Data_2, ...).
+#   csv      Comma separated values, optionally compressed
+#   jsonl    JSON Lines (one JSON object per row), optionally compressed
+#   parquet  Apache Parquet (requires pyarrow), optionally compressed
+# csv and jsonl can be compressed with 'gzip', 'bz2' or 'xz'. parquet accepts
+# any codec supported by pyarrow ('snappy', 'gzip', 'zstd', ...).
+#
+# Unless columns are provided, they are learned from the first rows written to
+# each sheet (up to export_column_sample_size rows are held back for this).
+# If column_order is provided, the learned columns are limited to the ones in
+# it and arranged in its order. Nested values (lists and dictionaries) are
+# written as JSON text, except in jsonl where they are kept as-is.
+#
+# xlsx writes every sheet to one workbook. The other formats write the default
+# sheet to file_name.ext and any other sheet to file_name_sheet.ext.
+#
+# Example usage:
+#   with di.ExportWriter('exported_data/events', format='csv', compression='gzip') as writer:
+#       for page in di.iter_events(pages=True):
+#           writer.write_rows(page)
+#
+export_formats = ['xlsx', 'csv', 'jsonl', 'parquet']
+export_compressions = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+excel_max_rows = 1048576          #rows per Excel sheet, including the header
+export_column_sample_size = 1000  #rows used to learn the columns of a sheet
+export_parquet_row_group_size = 50000
+
+
+class ExportWriter:
+
+    def __init__(self, file_name, format='xlsx', compression=None, columns=None, column_order=None, sheet_name='Sheet1'):
+        if format not in export_formats:
+            raise ValueError(f'Unsupported export format {format}. Choose from {", ".join(export_formats)}.')
+        if compression != None and (format == 'xlsx' or (format in ('csv', 'jsonl') and compression not in export_compressions)):
+            raise ValueError(f'Unsupported compression {compression} for {format} exports')
+        self.file_name = file_name
+        self.format = format
+        self.compression = compression
+        self.columns = columns
+        self.column_order = column_order
+        self.default_sheet_name = sheet_name
+        self.sheets = {}
+        self.files = []
+        self.row_count = 0
+        self.workbook = None
+        if format == 'xlsx':
+            import openpyxl
+            self.workbook = openpyxl.Workbook(write_only=True)
+
+    # Appends a list of rows (dictionaries) to a sheet (the default sheet
+    # unless sheet_name is provided). Writing an empty list creates the sheet.
+    def write_rows(self, rows, sheet_name=None):
+        if sheet_name == None:
+            sheet_name = self.default_sheet_name
+        if sheet_name not in self.sheets:
+            sheet_class = {'xlsx': _ExcelExportSheet, 'csv': _CsvExportSheet, 'jsonl': _JsonLinesExportSheet, 'parquet': _ParquetExportSheet}[self.format]
+            self.sheets[sheet_name] = sheet_class(self, sheet_name)
+        self.sheets[sheet_name].write(rows)
+        self.row_count += len(rows)
+
+    # Returns the file name for a sheet (other than xlsx, where every sheet
+    # shares the workbook)
+    def _get_sheet_file_name(self, sheet_name):
+        file_name = self.file_name
+        if sheet_name != self.default_sheet_name:
+            file_name += '_' + re.sub(r'\W+', '_', sheet_name)
+        file_name += '.' + self.format
+        if self.format != 'parquet' and self.compression != None:
+            file_name += export_compressions[self.compression]
+        self.files.append(file_name)
+        return file_name
+
+    # Flushes all sheets and closes the files. Nothing is written to disk if
+    # no sheet was ever written to.
+    def close(self):
+        for sheet in self.sheets.values():
+            sheet.close()
+        if self.workbook != None and len(self.sheets) > 0:
+            self.files.append(f'{self.file_name}.xlsx')
+            self.workbook.save(self.files[-1])
+        self.workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Converts a value to something every tabular format can store
+def _get_export_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+# Flattens nested dictionaries into dotted keys, the same way as
+# pandas.json_normalize. Example: recorded_device_info.hostname
+def _flatten_record(record, prefix=''):
+    flattened = {}
+    for field, value in record.items():
+        if isinstance(value, dict):
+            flattened.update(_flatten_record(value, f'{prefix}{field}.'))
+        else:
+            flattened[f'{prefix}{field}'] = value
+    return flattened
+
+
+# One sheet of an ExportWriter. Holds rows back until the columns are known,
+# then passes them to the format-specific _open, _write and _close.
+class _ExportSheet:
+
+    needs_columns = True
+
+    def __init__(self, writer, name):
+        self.writer = writer
+        self.name = name
+        self.columns = writer.columns
+        self.pending_rows = []
+        self.opened = False
+
+    def write(self, rows):
+        if self.opened:
+            self._write(rows)
+            return
+        self.pending_rows.extend(rows)
+        if self.columns == None and self.needs_columns and len(self.pending_rows) < export_column_sample_size:
+            return
+        self._open_with_pending_rows()
+
+    def _open_with_pending_rows(self):
+        if self.columns == None and self.needs_columns:
+            columns = {}
+            for row in self.pending_rows:
+                columns.update(dict.fromkeys(row))
+            if self.writer.column_order != None:
+                columns = [column for column in self.writer.column_order if column in columns]
+            self.columns = list(columns)
+        self._open()
+        self.opened = True
+        self._write(self.pending_rows)
+        self.pending_rows = []
+
+    def close(self):
+        if not self.opened:
+            self._open_with_pending_rows()
+        self._close()
+
+    def _open_text_file(self):
+        opener = {None: open, 'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}[self.writer.compression]
+        return opener(self.writer._get_sheet_file_name(self.name), 'wt', newline='', encoding='utf-8')
+
+
+class _CsvExportSheet(_ExportSheet):
+
+    def _open(self):
+        self.file = self._open_text_file()
+        self.csv_writer = csv.writer(self.file)
+        self.csv_writer.writerow(self.columns)
+
+    def _write(self, rows):
+        self.csv_writer.writerows([[_get_export_value(row.get(column)) for column in self.columns] for row in rows])
+
+    def _close(self):
+        self.file.close()
+
+
+class _JsonLinesExportSheet(_ExportSheet):
+
+    needs_columns = False
+
+    def _open(self):
+        self.file = self._open_text_file()
+
+    def _write(self, rows):
+        for row in rows:
+            if self.columns != None:
+                row = {column: row.get(column) for column in self.columns}
+            elif self.writer.column_order != None:
+                row = {column: row[column] for column in self.writer.column_order if column in row}
+            self.file.write(json.dumps(row) + '\n')
+
+    def _close(self):
+        self.file.close()
+
+
+class _ExcelExportSheet(_ExportSheet):
+
+    def _open(self):
+        self.worksheet_count = 0
+        self._add_worksheet()
+
+    #starts a new worksheet, named Sheet, Sheet_2, Sheet_3, ... (at most 31 characters)
+    def _add_worksheet(self):
+        self.worksheet_count += 1
+        suffix = '' if self.worksheet_count == 1 else f'_{self.worksheet_count}'
+        self.worksheet = self.writer.workbook.create_sheet(self.name[:31 - len(suffix)] + suffix)
+        self.worksheet_row_count = 0
+        if len(self.columns) > 0:
+            self.worksheet.append(self.columns)
+            self.worksheet_row_count = 1
+
+    def _write(self, rows):
+        for row in rows:
+            if self.worksheet_row_count >= excel_max_rows:
+                self._add_worksheet()
+            self.worksheet.append([_get_export_value(row.get(column)) for column in self.columns])
+            self.worksheet_row_count += 1
+
+    def _close(self):
+        pass
+
+
+class _ParquetExportSheet(_ExportSheet):
+
+    def _open(self):
+        try:
+            import pyarrow, pyarrow.parquet
+        except ImportError:
+            raise ImportError('Parquet exports require pyarrow. Install it with: pip install pyarrow')
+        self.pyarrow = pyarrow
+        self.parquet_writer = None
+        self.schema = None
+        self.batch = []
+
+    #rows are batched so that row groups are not limited to one page of data
+    def _write(self, rows):
+        self.batch.extend(rows)
+        if len(self.batch) >= export_parquet_row_group_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        pyarrow = self.pyarrow
+        data = {column: [_get_export_value(row.get(column)) for row in self.batch] for column in self.columns}
+        self.batch = []
+        if self.schema == None:
+            table = pyarrow.Table.from_pydict(data)
+            #columns with no values yet are stored as strings
+            self.schema = pyarrow.schema([field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field for field in table.schema])
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(self.writer._get_sheet_file_name(self.name), self.schema, compression=self.writer.compression or 'snappy')
+        try:
+            table = pyarrow.Table.from_pydict(data, schema=self.schema)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            #a later value of another type, stored as text in string columns
+            for field in self.schema:
+                if pyarrow.types.is_string(field.type):
+                    data[field.name] = [None if value == None else str(value) for value in data[field.name]]
+            table = pyarrow.Table.from_pydict(data, schema=self.schema)
+        self.parquet_writer.write_table(table)
+
+    def _close(self):
+        if len(self.batch) > 0 or self.schema == None:
+            self._write_batch()
+        self.parquet_writer.close()
+
+
+# Export Device List to disk (Excel format by default, see ExportWriter for
+# the other formats and compression options)
+def export_devices(include_deactivated=False, format='xlsx', compression=None):
+    client = get_client()
     #calculate timestamp
     timestamp = datetime.datetime.today().strftime('%Y-%m-%d_%H.%M')
     #calculate folder name
     folder_name = create_export_folder()
     #calculate file name
-    file_name = f'device_list_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    #write data to disk
-    devices_df.to_excel(f'{folder_name}/{file_name}', index=False)
+    file_name = f'device_list_{timestamp}_{client.fqdn.split(".",1)[0]}'
+    #stream the devices from server to disk one page at a time
+    with ExportWriter(f'{folder_name}/{file_name}', format=format, compression=compression) as writer:
+        for devices in iter_devices(include_deactivated=include_deactivated, pages=True):
+            writer.write_rows(devices)
     #return confirmation message
-    print (f'INFO: {str(len(devices))} devices exported to {folder_name}/{file_name}')
+    logger.info('%s devices exported to %s', writer.row_count, ', '.join(writer.files))
 
 
 # Accepts a list of (exact hostnames | hostname regex patterns | CIDRs) and
@@ -73,8 +920,9 @@ def move_devices_to_automatic_assignment(hostnames):
     devices_to_move = []
 
     #Search the full device list and pull out those that match our search list
+    matcher = DeviceMatcher(hostnames)
     for device in devices:
-        if device['hostname'] in hostnames:
+        if matcher.matches(device):
             devices_to_move.append(device)
 
     #Iterate through the list of matching devices
@@ -88,18 +936,19 @@ def move_devices_to_automatic_assignment(hostnames):
 
 #Archives (hides from GUI and API) a list of devices
 def archive_devices(device_ids, unarchive=False):
+    client = get_client()
     # Calculate headers and URL
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
+    headers = {'Content-Type': 'application/json', 'Authorization': client.key}
     if unarchive:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/unarchive'
+        request_url = f'{client.base_url}/api/v1/devices/actions/unarchive'
     else:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/archive'
+        request_url = f'{client.base_url}/api/v1/devices/actions/archive'
 
     # Create payload with list of provided IDs as a Python dictionary
     payload = {'ids': device_ids}
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = client.post(request_url, json=payload, headers=headers)
 
     # Check response code
     if response.status_code == 200:
@@ -115,10 +964,12 @@ def unarchive_devices(device_ids):
     return archive_devices(device_ids=device_ids, unarchive=True)
 
 
-# Write Device Policy data to disk in MS Excel format.
-def export_policies(include_allow_deny_lists=True):
+# Export Policies to disk with one sheet (or file) per platform (Excel format by
+# default, see ExportWriter for the other formats and compression options)
+def export_policies(include_allow_deny_lists=True, format='xlsx', compression=None):
+    client = get_client()
     # Get all policies from server, including auxilary data
-    policies = get_policies(include_policy_data=True, include_allow_deny_lists=include_allow_deny_lists)
+    policies = get_policies(include_policy_data=True, include_allow_deny_lists=include_allow_deny_lists, parallel=True)
 
     # Divide the policies into platform-specific lists
     # --> This is done for purposes of cleaner/more usable exports, since
@@ -144,31 +995,22 @@ def export_policies(include_allow_deny_lists=True):
         elif policy['os'] == 'LINUX':
             linux_policies.append(policy)
 
-    #create dataframes to allow subsequent export to Excel
-    windows_policies_df = pandas.DataFrame(windows_policies)
-    mac_policies_df = pandas.DataFrame(mac_policies)
-    ios_policies_df = pandas.DataFrame(ios_policies)
-    android_policies_df = pandas.DataFrame(android_policies)
-    chrome_policies_df = pandas.DataFrame(chrome_policies)
-    network_agentless_policies_df = pandas.DataFrame(network_agentless_policies)
-    linux_policies_df = pandas.DataFrame(linux_policies)
-
-    #export dataframes to disk
+    #export to disk, one sheet per platform (empty platforms get an empty
+    #sheet in Excel and are skipped for the other formats)
     timestamp = datetime.datetime.today().strftime('%Y-%m-%d_%H.%M')
     folder_name = create_export_folder()
-    file_name = f'deepinstinct_policies_{timestamp}_{fqdn.split(".",1)[0]}.xlsx'
-    with pandas.ExcelWriter(f'{folder_name}/{file_name}') as writer:
-        windows_policies_df.to_excel(writer, sheet_name='Windows', index=False)
-        mac_policies_df.to_excel(writer, sheet_name='macOS', index=False)
-        ios_policies_df.to_excel(writer, sheet_name='iOS', index=False)
-        android_policies_df.to_excel(writer, sheet_name='Android', index=False)
-        chrome_policies_df.to_excel(writer, sheet_name='Chrome OS', index=False)
-        linux_policies_df.to_excel(writer, sheet_name='Linux', index=False)
-        network_agentless_policies_df.to_excel(writer, sheet_name='Agentless', index=False)
-    print(f'INFO: {str(len(policies))} policies exported to {folder_name}/{file_name}')
+    file_name = f'deepinstinct_policies_{timestamp}_{client.fqdn.split(".",1)[0]}'
+    sheets = {'Windows': windows_policies, 'macOS': mac_policies, 'iOS': ios_policies, 'Android': android_policies,
+              'Chrome OS': chrome_policies, 'Linux': linux_policies, 'Agentless': network_agentless_policies}
+    with ExportWriter(f'{folder_name}/{file_name}', format=format, compression=compression, sheet_name=None) as writer:
+        for sheet_name, sheet_policies in sheets.items():
+            if len(sheet_policies) > 0 or format == 'xlsx':
+                writer.write_rows(sheet_policies, sheet_name=sheet_name)
+    logger.info('%s policies exported to %s', len(policies), ', '.join(writer.files))
 
 # Enable automatic upgrade setting in policies
 def enable_upgrades(platforms=['WINDOWS','MAC'], automatic_upgrade=True, return_modified_policies_id_list=False):
+    client = get_client()
     # Get list of policies
     policies = get_policies()
 
@@ -179,7 +1021,7 @@ def enable_upgrades(platforms=['WINDOWS','MAC'], automatic_upgrade=True, return_
     modified_policies_id_list = []
 
     # Static headers for all requests in this function
-    headers = {'accept': 'application/json', 'Authorization': key}
+    headers = {'accept': 'application/json', 'Authorization': client.key}
 
     # Iterate through the polic0ies
     for policy in policies:
@@ -187,15 +1029,15 @@ def enable_upgrades(platforms=['WINDOWS','MAC'], automatic_upgrade=True, return_
         if policy['os'] in platforms:
             # If yes, get policy data from the server
             policy_id = policy['id']
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
-            response = requests.get(request_url, headers=headers)
+            request_url = f'{client.base_url}/api/v1/policies/{policy_id}/data'
+            response = client.get(request_url, headers=headers)
             policy_data = response.json()
             # Check if the upgrade setting needs changing
             if policy_data['data']['automatic_upgrade'] != automatic_upgrade:
                 # If yes, set it to desired setting
                 policy_data['data']['automatic_upgrade'] = automatic_upgrade
                 # Write modified policy data back to server (saving change)
-                response = requests.put(request_url, json=policy_data, headers=headers)
+                response = client.put(request_url, json=policy_data, headers=headers)
                 # Increment the counter of how many policies we have modified
                 modified_policy_counter += 1
                 modified_policies_id_list.append(policy['id'])
@@ -203,7 +1045,7 @@ def enable_upgrades(platforms=['WINDOWS','MAC'], automatic_upgrade=True, return_
     return_string = str(modified_policy_counter) + ' policies modified to set automatic_upgrade to ' + str(automatic_upgrade)
 
     if return_modified_policies_id_list:
-        print(return_string)
+        logger.info(return_string)
         return modified_policies_id_list
     else:
         return return_string
@@ -216,24 +1058,25 @@ def disable_upgrades(platforms=['WINDOWS','MAC'], return_modified_policies_id_li
 
 # Enables upgrades for a list of policy IDs
 def enable_upgrades_for_list_of_policy_ids(policy_ids, automatic_upgrade=True):
+    client = get_client()
 
     # Establish a counter of how many policies were modified (used in return)
     modified_policy_counter = 0
 
     # Static headers for all requests in this function
-    headers = {'accept': 'application/json', 'Authorization': key}
+    headers = {'accept': 'application/json', 'Authorization': client.key}
 
     # Iterate through the poliocy ids provided
     for policy_id in policy_ids:
-        request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
-        response = requests.get(request_url, headers=headers)
+        request_url = f'{client.base_url}/api/v1/policies/{policy_id}/data'
+        response = client.get(request_url, headers=headers)
         policy_data = response.json()
         # Check if the upgrade setting needs changing
         if policy_data['data']['automatic_upgrade'] != automatic_upgrade:
             # If yes, set it to desired setting
             policy_data['data']['automatic_upgrade'] = automatic_upgrade
             # Write modified policy data back to server (saving change)
-            request = requests.put(request_url, json=policy_data, headers=headers)
+            request = client.put(request_url, json=policy_data, headers=headers)
             # Increment the counter of how many policies we have modified
             modified_policy_counter += 1
 
@@ -242,10 +1085,11 @@ def enable_upgrades_for_list_of_policy_ids(policy_ids, automatic_upgrade=True):
 
 # Returns list of visible Tenants
 def get_tenants():
+    client = get_client()
     #get data
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/'
-    response = requests.get(request_url, headers=headers)
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/multitenancy/tenant/'
+    response = client.get(request_url, headers=headers)
 
     #return data
     if response.status_code == 200:
@@ -257,45 +1101,55 @@ def get_tenants():
 
 
 # Returns a list of all visible Devices
-def get_devices(include_deactivated=True):
+# --> With parallel=True, the device id range is split into after_device_id
+#     windows which are collected concurrently on a pool of max_workers threads
+#     (see get_devices_parallel below). Output is identical to serial mode.
+# --> If a page can't be collected (after the client's retries), serial mode
+#     returns the devices collected so far, unless raise_for_status is True,
+#     in which case requests.exceptions.HTTPError is raised. Parallel mode
+#     always raises.
+def get_devices(include_deactivated=True, parallel=False, max_workers=8, raise_for_status=False):
+    if parallel:
+        return get_devices_parallel(include_deactivated=include_deactivated, max_workers=max_workers)
+
+    client = get_client()
     # CREATE VARIABLES
     #cursor to keep track of highest device id returned
     last_id = 0
     #list to collect the devices
     collected_devices = []
     #static set of headers for requests in this method
-    headers = {'accept': 'application/json', 'Authorization': key}
+    headers = {'accept': 'application/json', 'Authorization': client.key}
 
     # The method we are using (/api/v1/devices) returns up to 50 devices at a
     # time, and the response includes a last_id which indicates the highest
     # device id returned. We will know we have all devices visible to our API
     # key when we get last_id=None in a response.
 
-    error_count = 0
     # COLLECT DATA
-    while last_id != None and error_count < 10: #loop until all visible devices have been collected
+    while last_id != None: #loop until all visible devices have been collected
         #calculate URL for request
-        request_url = f'https://{fqdn}/api/v1/devices?after_device_id={last_id}'
+        request_url = f'{client.base_url}/api/v1/devices?after_device_id={last_id}'
         #make request, store response
-        response = requests.get(request_url, headers=headers)
+        response = client.get(request_url, headers=headers)
         if response.status_code == 200:
             response = response.json() #convert to Python list
             if 'last_id' in response:
                 last_id = response['last_id'] #save returned last_id for reuse on next request
             else: #added this to handle issue where some server versions fail to return last_id on final batch of devices
                 last_id = None
-            print(request_url, 'returned 200 with last_id', last_id, end='\r')
+            logger.debug('%s returned 200 with last_id %s', request_url, last_id, extra={'last_id': last_id})
             if 'devices' in response:
                 devices = response['devices'] #extract devices from response
                 for device in devices: #iterate through the list of devices
                     if device['license_status'] == 'ACTIVATED' or include_deactivated:
                         collected_devices.append(device) #add to collected devices
         else:
-            print('WARNING: Unexpected return code', response.status_code,
-            'on request to\n', request_url, '\nwith headers\n', headers)
-            error_count += 1  #increment error counter
-            time.sleep(10) #wait before trying request again
-    print('\n')
+            #transient errors were already retried by the client, so give up
+            logger.error('Unexpected return code %s on request to %s', response.status_code, request_url)
+            if raise_for_status:
+                response.raise_for_status()
+            break
 
     # When while loop exists, we know we have collected all visible data
 
@@ -303,41 +1157,237 @@ def get_devices(include_deactivated=True):
     return collected_devices
 
 
-# Translates a list of device names, regex patterns, or CIDRs to a list of
-# device IDs
-def get_device_ids(search_list, regex_hostname_search=False, cidr_search=False):
-    # GET ALL DEVICES
-    devices = get_devices(include_deactivated=False)
+# Gets a single page (up to 50) of devices with id greater than after_device_id.
+# Returns a tuple of (devices, last_id), with last_id None after the final page.
+def _get_device_page(client, after_device_id, raise_for_status=False):
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/devices?after_device_id={after_device_id}'
 
-    # CREATE A LIST TO COLLECT SEARCH RESULTS
-    device_ids = []
+    response = client.get(request_url, headers=headers)
+    if response.status_code == 200:
+        response = response.json()
+        #some server versions fail to return last_id on final batch of devices
+        return response.get('devices', []), response.get('last_id')
+
+    #transient errors were already retried by the client, so give up
+    logger.error('Unexpected return code %s on request to %s', response.status_code, request_url)
+    if raise_for_status:
+        response.raise_for_status()
+    return [], None
+
+
+# Generator which yields all visible Devices one at a time (or one page of up
+# to 50 at a time if pages is True), fetching each page only when the previous
+# one has been consumed
+def iter_devices(include_deactivated=True, pages=False):
+    client = get_client()
+    last_id = 0
+    while last_id != None:
+        devices, last_id = _get_device_page(client, last_id)
+        logger.debug('%s/api/v1/devices returned %s devices with last_id %s', client.base_url, len(devices), last_id, extra={'last_id': last_id})
+        devices = [device for device in devices if device['license_status'] == 'ACTIVATED' or include_deactivated]
+        if pages:
+            if len(devices) > 0:
+                yield devices
+        else:
+            yield from devices
+
+
+# Learns the range of device ids visible to the API key. Returns a tuple of
+# (lowest_id, upper_bound), where upper_bound is an id known to have no
+# devices after it. Costs a handful of requests (exponential probe to find an
+# empty page, then a binary search to tighten the bound to within one page).
+def _get_device_id_range(client):
+    devices, last_id = _get_device_page(client, 0, raise_for_status=True)
+    if len(devices) == 0:
+        return 0, 0
+    lowest_id = devices[0]['id']
+    known_id = devices[-1]['id']
+    if last_id == None:
+        return lowest_id, known_id
+
+    #exponential probe for an id with no devices after it
+    upper_bound = known_id * 2
+    while True:
+        devices, last_id = _get_device_page(client, upper_bound, raise_for_status=True)
+        if len(devices) == 0:
+            break
+        known_id = devices[-1]['id']
+        upper_bound = known_id * 2
+
+    #binary search between the highest known id and the empty upper bound
+    while upper_bound - known_id > 50:
+        midpoint = (known_id + upper_bound) // 2
+        devices, last_id = _get_device_page(client, midpoint, raise_for_status=True)
+        if len(devices) == 0:
+            upper_bound = midpoint
+        else:
+            known_id = devices[-1]['id']
+            if last_id == None:
+                upper_bound = known_id
+
+    return lowest_id, upper_bound
 
-    # ITERATE THROUGH THE DEVICES, COLLECT MATCHES
 
-    # Regex-based matching on hostname
-    if regex_hostname_search:
+# Collects all devices with lowest_id < id <= highest_id by paging with
+# after_device_id, stopping as soon as the window has been passed
+def _get_devices_in_window(client, lowest_id, highest_id):
+    collected_devices = []
+    last_id = lowest_id
+    while last_id != None and last_id < highest_id:
+        try:
+            devices, last_id = _get_device_page(client, last_id, raise_for_status=True)
+        except requests.exceptions.HTTPError:
+            logger.error('Failed to collect devices with id %s to %s', lowest_id + 1, highest_id)
+            raise
+        if len(devices) == 0:
+            break
         for device in devices:
-            for regex in search_list: #for each regex...
-                if re.match(regex, device['hostname']): #check if hostname matches
-                    if device['id'] not in device_ids: #avoid duplicates
-                        device_ids.append(device['id']) #append id to search results
-
-    # IP range (CIDR) matching
-    elif cidr_search:
-        for cidr in search_list: #for each cidr in the search list...
-            for device in devices:
-                if ipaddress.ip_address(device['ip_address']) in ipaddress.ip_network(cidr):
-                    if device['id'] not in device_ids: #avoid duplicates
-                        device_ids.append(device['id']) #append id to search results
-
-    # Hostname search (exact match only)
-    else:
+            if device['id'] <= highest_id:
+                collected_devices.append(device)
+    return collected_devices
+
+
+# Returns a list of all visible Devices, collected concurrently. The id range
+# is learned first, split into after_device_id windows, and the windows are
+# fetched on a bounded thread pool, then merged in id order without duplicates.
+# Raises requests.exceptions.HTTPError if any page can't be collected (after
+# the client's retries), rather than returning an incomplete list.
+def get_devices_parallel(include_deactivated=True, max_workers=8):
+    client = get_client()
+
+    # LEARN THE ID RANGE AND SPLIT IT INTO WINDOWS
+    lowest_id, upper_bound = _get_device_id_range(client)
+    #aim for a few windows per worker so that sparse ranges still balance out
+    window_count = max_workers * 4
+    window_size = max(50, -(-(upper_bound - lowest_id + 1) // window_count))
+    windows = []
+    window_start = lowest_id - 1
+    while window_start < upper_bound:
+        windows.append((window_start, min(window_start + window_size, upper_bound)))
+        window_start += window_size
+    logger.info('Collecting devices with id %s to %s in %s windows using %s workers', lowest_id, upper_bound, len(windows), max_workers)
+
+    # COLLECT DATA
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_get_devices_in_window, client, window[0], window[1]) for window in windows]
+        results = [future.result() for future in futures]
+
+    # MERGE RESULTS IN WINDOW ORDER, DROPPING DUPLICATES
+    collected_devices = []
+    collected_device_ids = set()
+    for devices in results:
+        for device in devices:
+            if device['id'] not in collected_device_ids:
+                if device['license_status'] == 'ACTIVATED' or include_deactivated:
+                    collected_devices.append(device)
+                collected_device_ids.add(device['id'])
+
+    # RETURN COLLECTED DATA
+    return collected_devices
+
+
+# Matches devices against a list of exact hostnames, hostname regex patterns,
+# or CIDRs, with the search list prepared once so that each device is checked
+# in a single step however long the list is:
+# -regex patterns are compiled into one alternation (re.match semantics, so
+#  each pattern is anchored at the start of the hostname), except patterns
+#  with capturing groups or global inline flags, which are checked one by one
+# -CIDRs are merged into a sorted list of address ranges per IP version and
+#  looked up with a binary search
+# -exact hostnames are kept in a set
+#
+# Example usage:
+#   matcher = di.DeviceMatcher(['10.0.0.0/8', '192.168.1.0/24'], cidr_search=True)
+#   device_ids = matcher.get_device_ids(di.get_devices(include_deactivated=False))
+#
+class DeviceMatcher:
+
+    def __init__(self, search_list, regex_hostname_search=False, cidr_search=False):
+        self.regex_hostname_search = regex_hostname_search
+        self.cidr_search = cidr_search
+
+        if regex_hostname_search:
+            #a single alternation lets the regex engine check all patterns in
+            #one pass. Joining patterns renumbers their capturing groups (so a
+            #backreference like \1 would refer to another pattern's group) and
+            #global inline flags such as (?i) would apply to every pattern, so
+            #patterns with either are kept separate and checked one by one.
+            compiled_patterns = [re.compile(pattern) for pattern in search_list]
+            default_flags = re.compile('').flags
+            combinable = [pattern.pattern for pattern in compiled_patterns if pattern.groups == 0 and pattern.flags == default_flags]
+            self.patterns = [pattern for pattern in compiled_patterns if pattern.groups > 0 or pattern.flags != default_flags]
+            if len(combinable) > 0:
+                try:
+                    self.patterns.insert(0, re.compile('|'.join(f'(?:{pattern})' for pattern in combinable)))
+                except re.error:
+                    self.patterns[0:0] = [re.compile(pattern) for pattern in combinable]
+
+        elif cidr_search:
+            #sorted, non-overlapping (first, last) address ranges per IP version
+            ranges = {4: [], 6: []}
+            for cidr in search_list:
+                network = ipaddress.ip_network(cidr)
+                ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+            self.range_starts = {}
+            self.range_ends = {}
+            for version, version_ranges in ranges.items():
+                merged = []
+                for first, last in sorted(version_ranges):
+                    if len(merged) > 0 and first <= merged[-1][1] + 1:
+                        merged[-1][1] = max(merged[-1][1], last)
+                    else:
+                        merged.append([first, last])
+                self.range_starts[version] = [first for first, last in merged]
+                self.range_ends[version] = [last for first, last in merged]
+
+        else:
+            self.hostnames = set(search_list)
+
+    # Returns True if the device matches the search list
+    def matches(self, device):
+        if self.regex_hostname_search:
+            for pattern in self.patterns:
+                if pattern.match(device['hostname']):
+                    return True
+            return False
+
+        elif self.cidr_search:
+            try:
+                address = ipaddress.ip_address(device['ip_address'])
+            except (KeyError, TypeError, ValueError):
+                return False #devices without a valid IP address can't match
+            address_number = int(address)
+            #find the last range starting at or below the address
+            index = bisect.bisect_right(self.range_starts[address.version], address_number) - 1
+            return index >= 0 and address_number <= self.range_ends[address.version][index]
+
+        else:
+            return device['hostname'] in self.hostnames
+
+    # Returns the ids of the matching devices, without duplicates, in the
+    # order of the device list
+    def get_device_ids(self, devices):
+        device_ids = []
+        seen_device_ids = set()
         for device in devices:
-            if device['hostname'] in search_list:
-                device_ids.append(device['id']) #append id to search results
+            if device['id'] not in seen_device_ids and self.matches(device):
+                device_ids.append(device['id'])
+                seen_device_ids.add(device['id'])
+        return device_ids
+
+
+# Translates a list of device names, regex patterns, or CIDRs to a list of
+# device IDs. Pass devices to search an already collected device list instead
+# of getting it from the server.
+def get_device_ids(search_list, regex_hostname_search=False, cidr_search=False, devices=None):
+    # GET ALL DEVICES
+    if devices == None:
+        devices = get_devices(include_deactivated=False)
 
     # RETURN THE SEARCH RESULTS
-    return device_ids
+    matcher = DeviceMatcher(search_list, regex_hostname_search=regex_hostname_search, cidr_search=cidr_search)
+    return matcher.get_device_ids(devices)
 
 
 # Translate a Device Group name into a Device Group IP
@@ -355,18 +1405,19 @@ def get_group_id(group_name, exclude_default_groups=False):
 
 # Adds a list of Devices to a Device Group
 def add_devices_to_group(device_ids, group_id, remove=False):
+    client = get_client()
     # Calculate headers and URL
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
+    headers = {'Content-Type': 'application/json', 'Authorization': client.key}
     if remove:
-        request_url = f'https://{fqdn}/api/v1/groups/{group_id}/remove-devices'
+        request_url = f'{client.base_url}/api/v1/groups/{group_id}/remove-devices'
     else:
-        request_url = f'https://{fqdn}/api/v1/groups/{group_id}/add-devices'
+        request_url = f'{client.base_url}/api/v1/groups/{group_id}/add-devices'
 
     # Create payload
     payload = {'devices': device_ids}
 
     # Send to server, return confirmation if successful
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = client.post(request_url, json=payload, headers=headers)
     if response.status_code == 204: #expected return code
         if remove:
             return str(len(device_ids)) + ' devices removed from group ' + str(group_id)
@@ -382,15 +1433,24 @@ def remove_devices_from_group(device_ids, group_id):
 
 
 # Collect and return list of Device Policies.
-def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep_data_encapsulated=False, msp_id='ALL'):
+# --> With parallel=True, the per-policy sub-requests (policy data and the
+#     allow-list, deny-list and exclusion-list requests) are fanned out over a
+#     pool of max_workers threads. Output is identical to serial mode.
+# --> list_types limits which allow-list, deny-list and exclusion-list types
+#     are collected (default is all of policy_list_types).
+# --> platforms limits the output (and the sub-requests) to policies for the
+#     given operating systems, for example ['WINDOWS'].
+# --> policy_ids limits the output (and the sub-requests) to the given policies.
+def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep_data_encapsulated=False, msp_id='ALL', parallel=False, max_workers=8, list_types=None, platforms='ALL', policy_ids=None):
+    client = get_client()
     # GET POLICIES (basic data only)
 
     # Calculate headers and URL
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/policies/'
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/policies/'
 
     # Get data, convert to Python list
-    response = requests.get(request_url, headers=headers)
+    response = client.get(request_url, headers=headers)
     policies = response.json()
 
     # Apply filter based on msp, if enabled
@@ -401,59 +1461,74 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep
                 filtered_policies.append(policy)
         policies = filtered_policies
 
-    # APPEND POLICY DATA (IF ENABLED)
-    if include_policy_data:
+    # Apply filter based on platform, if enabled
+    if platforms != 'ALL':
+        policies = [policy for policy in policies if policy['os'] in platforms]
 
-        # Iterate through policy list
-        for policy in policies:
-            # Extract ID, calculate URL, and pull policy data from server
-            policy_id = policy['id']
-            request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/data'
-            response = requests.get(request_url, headers=headers)
-            print(request_url, 'returned', response.status_code, end='\r')
-            # Check response code (for some platforms, no policy data available)
-            if response.status_code == 200:
-                # Extract policy data from response and append it to policy
-                if keep_data_encapsulated:
-                    policy_data = response.json()
-                else:
-                    policy_data = response.json()['data']
-                policy.update(policy_data)
-        print('\n')
+    # Apply filter based on policy id, if enabled
+    if policy_ids != None:
+        policy_ids = {int(policy_id) for policy_id in policy_ids}
+        policies = [policy for policy in policies if policy['id'] in policy_ids]
 
-    # APPEND ALLOW-LIST, DENY-LIST, AND EXCLUSION DATA (IF ENABLED)
-    if include_allow_deny_lists:
+    # BUILD LIST OF PER-POLICY SUB-REQUESTS AS (policy, endpoint) PAIRS
 
-        allow_deny_and_exclusion_list_types = [
-            'allow-list/hashes',
-            'allow-list/paths',
-            'allow-list/certificates',
-            'allow-list/process_paths',
-            'allow-list/scripts',
-            'deny-list/hashes',
-            'exclusion-list/folder_path',
-            'exclusion-list/process_path'
-        ]
-
-        # Iterate through policy list
+    sub_requests = []
+    if include_policy_data:
+        for policy in policies:
+            sub_requests.append((policy, 'data'))
+    if include_allow_deny_lists:
+        if list_types == None:
+            list_types = policy_list_types
         for policy in policies:
+            for list_type in list_types:
+                sub_requests.append((policy, list_type))
+
+    # Fetches one sub-request, returns (status_code, data, seconds)
+    def get_policy_endpoint(sub_request):
+        policy, endpoint = sub_request
+        request_url = f'{client.base_url}/api/v1/policies/{policy["id"]}/{endpoint}'
+        start_time = time.perf_counter()
+        response = client.get(request_url, headers=headers)
+        runtime = time.perf_counter() - start_time
+        logger.debug('%s returned %s', request_url, response.status_code)
+        if response.status_code == 200:
+            return response.status_code, response.json(), runtime
+        return response.status_code, None, runtime
 
-            # Extract the policy id, which is used in subsequent requests
-            policy_id = policy['id']
+    # EXECUTE THE SUB-REQUESTS (serially, or fanned out over a thread pool)
+    if parallel and len(sub_requests) > 0:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(get_policy_endpoint, sub_requests))
+    else:
+        results = map(get_policy_endpoint, sub_requests)
 
+    # APPEND POLICY DATA, ALLOW-LIST, DENY-LIST, AND EXCLUSION DATA
+    endpoint_timing = {}
+    for (policy, endpoint), (status_code, data, runtime) in zip(sub_requests, results):
+        if endpoint != 'data':
             #create a dictionary in the policy to store this data
-            policy['allow_deny_and_exclusion_lists'] = {}
-
-            #iterate through list types to migrate
-            for list_type in allow_deny_and_exclusion_list_types:
-
-                request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/{list_type}'
-                response = requests.get(request_url, headers=headers)
-                print(request_url, 'returned', response.status_code, end='\r')
-                if response.status_code == 200:
-                    response = response.json()
-                    policy['allow_deny_and_exclusion_lists'][list_type] = response
-        print('\n')
+            policy.setdefault('allow_deny_and_exclusion_lists', {})
+        # Check response code (for some platforms, no data is available)
+        if status_code == 200:
+            if endpoint == 'data':
+                # Extract policy data from response and append it to policy
+                if keep_data_encapsulated:
+                    policy.update(data)
+                else:
+                    policy.update(data['data'])
+            else:
+                policy['allow_deny_and_exclusion_lists'][endpoint] = data
+        # Record timing for this endpoint
+        timing = endpoint_timing.setdefault(endpoint, {'requests': 0, 'total_seconds': 0, 'max_seconds': 0})
+        timing['requests'] += 1
+        timing['total_seconds'] += runtime
+        timing['max_seconds'] = max(timing['max_seconds'], runtime)
+
+    if len(sub_requests) > 0:
+        # Report per-endpoint timing
+        for endpoint, timing in endpoint_timing.items():
+            logger.info('policies/{id}/%s %s requests, avg %s ms, max %s ms', endpoint, timing['requests'],
+                        round(timing['total_seconds'] / timing['requests'] * 1000), round(timing['max_seconds'] * 1000))
 
     # RETURN THE COLLECTED DATA
     return policies
@@ -461,10 +1536,11 @@ def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep
 
 # Returns list of visible MSPs
 def get_msps():
+    client = get_client()
     #get data
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/'
-    response = requests.get(request_url, headers=headers)
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/multitenancy/msp/'
+    response = client.get(request_url, headers=headers)
 
     #return data
     if response.status_code == 200:
@@ -477,13 +1553,14 @@ def get_msps():
 
 # Create a new MSP
 def create_msp(msp_name, license_limit):
+    client = get_client()
     # Calculate headers, URL, and payload
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/'
+    headers = {'Content-Type': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/multitenancy/msp/'
     payload = {'name': msp_name, 'license_limit': license_limit}
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = client.post(request_url, json=payload, headers=headers)
 
     # Check return code and return Success or descriptive error
     if response.status_code == 200:
@@ -500,6 +1577,7 @@ def create_msp(msp_name, license_limit):
 
 # Delete an MSP based on provided name
 def delete_msp(msp_name):
+    client = get_client()
     # Get the list of MSPs
     msps = get_msps()
 
@@ -512,9 +1590,9 @@ def delete_msp(msp_name):
         return 'No match found for provided msp_name ' + msp_name
 
     # DELETE THE MSP
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp/{msp_id}'
-    headers = {'Authorization': key}
-    response = requests.delete(request_url, headers=headers)
+    request_url = f'{client.base_url}/api/v1/multitenancy/msp/{msp_id}'
+    headers = {'Authorization': client.key}
+    response = client.delete(request_url, headers=headers)
 
     # RETURN SUCCESS/FAILURE BASED ON RETURN CODE
     if response.status_code == 204:
@@ -530,6 +1608,7 @@ def delete_msp(msp_name):
 
 # Remotely uninstall a device
 def remove_device(device, device_id_only=False):
+    client = get_client()
 
     #PROCESS INPUT
     if device_id_only:
@@ -540,28 +1619,36 @@ def remove_device(device, device_id_only=False):
         device_id = device['id']
 
     #UNINSTALL THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/remove'
-    headers = {'Authorization': key}
-    response = requests.post(request_url, headers=headers)
+    request_url = f'{client.base_url}/api/v1/devices/{device_id}/actions/remove'
+    headers = {'Authorization': client.key}
+    response = client.post(request_url, headers=headers)
 
     #RETURN TRUE/FALSE BASED ON WHETHER WE GOT THE EXPECTED RETURN CODE
     if response.status_code == 204:
-        print('INFO: Successfully removed device', device)
+        logger.info('Successfully removed device %s', device)
         return True
     else:
-        print('INFO: Failed to remove device', device)
+        logger.error('Failed to remove device %s', device)
         return False
 
 
 # Return a list of events matching specified search parameters and/or minimum
 # event id. If neither are provided, all visible events are returned.
 def get_events(search={}, minimum_event_id=0, suspicious=False):
+    #collect everything yielded by iter_events into a list
+    return list(iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious))
 
-    #define HTTP headers for all requests in this method
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
 
-    #list to collect events
-    collected_events = []
+# Generator which yields events matching specified search parameters and/or
+# minimum event id, one at a time, fetching the next page from the server only
+# when the previous one has been consumed. Memory use stays flat no matter how
+# many events exist. With pages=True, yields each page (list of up to 50
+# events) instead of individual events.
+def iter_events(search={}, minimum_event_id=0, suspicious=False, pages=False):
+    client = get_client()
+
+    #define HTTP headers for all requests in this method
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
 
     #Note that the API method we are calling returns up to 50 events at a time,
     #and we know we have all events when we get last_id=None back in the response
@@ -571,35 +1658,34 @@ def get_events(search={}, minimum_event_id=0, suspicious=False):
 
         #calculate request url
         if suspicious:
-            request_url = f'https://{fqdn}/api/v1/suspicious-events/search?after_event_id={str(minimum_event_id)}'
+            request_url = f'{client.base_url}/api/v1/suspicious-events/search?after_event_id={str(minimum_event_id)}'
         else:
-            request_url = f'https://{fqdn}/api/v1/events/search?after_event_id={str(minimum_event_id)}'
+            request_url = f'{client.base_url}/api/v1/events/search?after_event_id={str(minimum_event_id)}'
 
-        try:
-            #make request to server, store response
-            response = requests.post(request_url, headers=headers, json=search, timeout=30)
-        except requests.exceptions.RequestException:
-            print('WARNING: Exception on', request_url, '. Will sleep for 10 seconds and try again.')
-            time.sleep(10)
+        #make request to server, store response (transient errors and
+        #timeouts are retried with backoff by the client)
+        response = client.post(request_url, headers=headers, json=search, timeout=30, idempotent=True)
 
-        if response.status_code == 200:
-            #store the returned last_id value
-            minimum_event_id = response.json()['last_id']
+        if response.status_code != 200:
+            logger.error('Unexpected return code %s on request to %s', response.status_code, request_url)
+            response.raise_for_status()
+            return
+
+        #convert to Python dictionary (once per page)
+        response = response.json()
 
-            #print result to console
-            print(request_url, 'returned', response.status_code, 'with last_id', minimum_event_id, end='\r')
+        #store the returned last_id value
+        minimum_event_id = response['last_id']
 
-            #if we got a none-null last_id back
-            if minimum_event_id != None:
-                #then extract the events
-                events = response.json()['events']
-                #append the event(s) from this response to collected_events
-                for event in events:
-                    collected_events.append(event)
-    print('\n')
+        #log progress
+        logger.debug('%s returned 200 with last_id %s', request_url, minimum_event_id, extra={'last_id': minimum_event_id})
 
-    #return the list of collected events
-    return collected_events
+        #if we got a none-null last_id back, then hand out the events
+        if minimum_event_id != None:
+            if pages:
+                yield response['events']
+            else:
+                yield from response['events']
 
 
 # Return a list of suspicious events matching specified search parameters
@@ -609,13 +1695,294 @@ def get_suspicious_events(search={}, minimum_event_id=0):
     return get_events(suspicious=True, search=search, minimum_event_id=minimum_event_id)
 
 
+# A local SQLite-backed copy of the server's events which is synced
+# incrementally. The first sync downloads the full history; after that only
+# events with an id above the stored high-water mark are downloaded, plus any
+# events closed since the previous sync (so that status stays current).
+# Queries are answered locally using the same search dictionary format as
+# get_events(). device_id, type, status, threat_severity and file_hash are
+# indexed columns; all other search fields are matched against the stored
+# event data.
+#
+# Known limitation: archiving an event hides it from the API, so events
+# archived after they were synced remain in the store. Use sync(full=True) to
+# rebuild the store from scratch when that matters.
+#
+# Example usage:
+#   store = di.EventStore()
+#   store.sync()
+#   events = store.get_events(search={'status': ['OPEN'], 'type': ['STATIC_ANALYSIS']})
+#
+class EventStore:
+
+    indexed_fields = ['device_id', 'type', 'status', 'threat_severity', 'file_hash']
+
+    def __init__(self, file_name=None):
+        #default to one store per server, kept in the server's export folder
+        if file_name == None:
+            file_name = f'{create_export_folder()}/event_store.sqlite'
+        self.file_name = file_name
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS events (
+                                        suspicious INTEGER NOT NULL,
+                                        id INTEGER NOT NULL,
+                                        device_id INTEGER,
+                                        type TEXT,
+                                        status TEXT,
+                                        threat_severity TEXT,
+                                        file_hash TEXT,
+                                        data TEXT NOT NULL,
+                                        PRIMARY KEY (suspicious, id))""")
+        for field in self.indexed_fields:
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS events_{field} ON events (suspicious, {field})')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sync_state (suspicious INTEGER PRIMARY KEY, last_sync_timestamp TEXT)')
+        self.connection.commit()
+
+    # Returns the highest event id currently in the store (0 if empty)
+    def high_water_mark(self, suspicious=False):
+        row = self.connection.execute('SELECT MAX(id) FROM events WHERE suspicious = ?', (int(suspicious),)).fetchone()
+        return row[0] or 0
+
+    # Writes a page of events to the store, replacing any older copies
+    def _save_events(self, events, suspicious):
+        rows = []
+        for event in events:
+            rows.append((int(suspicious), event['id'], event.get('device_id'), event.get('type'), event.get('status'),
+                         event.get('threat_severity'), event.get('file_hash'), json.dumps(event)))
+        self.connection.executemany('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+    # Downloads new (and recently closed) events from the server into the
+    # store. Returns the number of events written.
+    def sync(self, suspicious=False, full=False):
+        #taken before any query (with millisecond precision, like the server's
+        #timestamps), so the next sync re-checks anything closed from here on
+        sync_timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+        if full:
+            self.connection.execute('DELETE FROM events WHERE suspicious = ?', (int(suspicious),))
+            self.connection.execute('DELETE FROM sync_state WHERE suspicious = ?', (int(suspicious),))
+            self.connection.commit()
+
+        #new events since the high-water mark
+        minimum_event_id = self.high_water_mark(suspicious)
+        logger.info('Syncing events with id greater than %s to %s', minimum_event_id, self.file_name)
+        event_count = 0
+        for page in iter_events(minimum_event_id=minimum_event_id, suspicious=suspicious, pages=True):
+            self._save_events(page, suspicious)
+            event_count += len(page)
+
+        #events already in the store which were closed since the previous sync
+        #(no upper bound, so events closed while this sync runs are included)
+        row = self.connection.execute('SELECT last_sync_timestamp FROM sync_state WHERE suspicious = ?', (int(suspicious),)).fetchone()
+        if row != None and minimum_event_id > 0:
+            search = {'status': ['CLOSED'], 'close_timestamp': {'from': row[0]}}
+            for page in iter_events(search=search, suspicious=suspicious, pages=True):
+                self._save_events(page, suspicious)
+                event_count += len(page)
+
+        self.connection.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (int(suspicious), sync_timestamp))
+        self.connection.commit()
+        logger.info('%s events were written to the event store', event_count)
+        return event_count
+
+    # Generator which yields stored events matching the provided search
+    # parameters and minimum event id, in event id order
+    def iter_events(self, search={}, minimum_event_id=0, suspicious=False):
+        #indexed fields are filtered in SQL, everything else in Python
+        query = 'SELECT data FROM events WHERE suspicious = ? AND id > ?'
+        parameters = [int(suspicious), minimum_event_id]
+        remaining_search = {}
+        for field, value in search.items():
+            if field in self.indexed_fields and not isinstance(value, dict):
+                if not isinstance(value, list):
+                    value = [value]
+                query += f' AND {field} IN ({", ".join("?" * len(value))})'
+                parameters.extend(value)
+            else:
+                remaining_search[field] = value
+        query += ' ORDER BY id'
+
+        for row in self.connection.execute(query, parameters):
+            event = json.loads(row[0])
+            if _event_matches_search(event, remaining_search):
+                yield event
+
+    # Returns a list of stored events matching the provided search parameters
+    # and minimum event id (same arguments as get_events)
+    def get_events(self, search={}, minimum_event_id=0, suspicious=False):
+        return list(self.iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Checks an event against a search dictionary using the same rules as the
+# server's event search: lists match any value, dictionaries with from/to
+# match a range (timestamps), and anything else must match exactly
+def _event_matches_search(event, search):
+    for field, value in search.items():
+        if field not in event:
+            return False
+        if isinstance(value, list):
+            if event[field] not in value:
+                return False
+        elif isinstance(value, dict):
+            if event[field] == None:
+                return False
+            if 'from' in value and event[field] < value['from']:
+                return False
+            if 'to' in value and event[field] > value['to']:
+                return False
+        elif event[field] != value:
+            return False
+    return True
+
+
+# A local SQLite-backed snapshot of the server's devices. Each sync downloads
+# the current device list, compares it to the snapshot and returns what
+# changed since the previous sync, so that monitoring scripts can react to
+# deltas instead of reprocessing every device each cycle. Only devices which
+# changed are rewritten. The snapshot persists between runs, so the previous
+# state survives a restart.
+#
+# sync() returns a dictionary like this:
+#   {'added': [device, ...],                 #new since the previous sync
+#    'removed': [device, ...],               #last known data of devices no longer returned
+#    'changed': [{'id': 123, 'hostname': 'foo', 'device': device,
+#                 'changes': {'connectivity_status': {'old': 'ONLINE', 'new': 'OFFLINE'}}}, ...],
+#    'unchanged_count': 9876, 'device_count': 10000,
+#    'previous_sync_timestamp': '2022-01-01T00:00:00.000Z' (None on the first sync),
+#    'sync_timestamp': '2022-01-01T06:00:00.000Z'}
+#
+# Fields in ignored_fields (by default last_contact, which moves on every
+# check-in) are kept current in the snapshot but not reported as changes. If
+# tracked_fields is provided, only those fields are reported.
+#
+# If the device list can't be collected in full, sync raises
+# requests.exceptions.HTTPError and leaves the snapshot unchanged (a partial
+# list would otherwise report every missing device as removed).
+#
+# Example usage:
+#   with di.DeviceStore() as store:
+#       diff = store.sync()
+#       for change in diff['changed']:
+#           if 'connectivity_status' in change['changes']:
+#               print(change['hostname'], 'is now', change['device']['connectivity_status'])
+#
+class DeviceStore:
+
+    default_ignored_fields = ['last_contact']
+
+    def __init__(self, file_name=None):
+        #default to one store per server, kept in the server's export folder
+        if file_name == None:
+            file_name = f'{create_export_folder()}/device_store.sqlite'
+        self.file_name = file_name
+        self.connection = sqlite3.connect(file_name)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS devices (id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sync_state (id INTEGER PRIMARY KEY, last_sync_timestamp TEXT)')
+        self.connection.commit()
+
+    # Returns the timestamp of the previous sync (None if never synced)
+    def last_sync_timestamp(self):
+        row = self.connection.execute('SELECT last_sync_timestamp FROM sync_state WHERE id = 0').fetchone()
+        return row[0] if row != None else None
+
+    # Downloads the current device list from the server, updates the snapshot
+    # and returns the differences from the previous snapshot (see above)
+    def sync(self, include_deactivated=True, parallel=False, max_workers=8, tracked_fields=None, ignored_fields=None):
+        if ignored_fields == None:
+            ignored_fields = self.default_ignored_fields
+        ignored_fields = set(ignored_fields)
+        sync_timestamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        previous_sync_timestamp = self.last_sync_timestamp()
+
+        #previous state, kept serialized so that unchanged devices are detected
+        #with a single string comparison
+        previous_data = dict(self.connection.execute('SELECT id, data FROM devices'))
+
+        logger.info('Syncing devices to %s', self.file_name)
+        devices = get_devices(include_deactivated=include_deactivated, parallel=parallel, max_workers=max_workers, raise_for_status=True)
+
+        # COMPARE TO THE SNAPSHOT
+        diff = {'added': [], 'removed': [], 'changed': [], 'unchanged_count': 0, 'device_count': len(devices),
+                'previous_sync_timestamp': previous_sync_timestamp, 'sync_timestamp': sync_timestamp}
+        rows_to_write = []
+        for device in devices:
+            data = json.dumps(device, sort_keys=True)
+            old_data = previous_data.pop(device['id'], None)
+            if old_data == None:
+                diff['added'].append(device)
+                rows_to_write.append((device['id'], data))
+            elif old_data == data:
+                diff['unchanged_count'] += 1
+            else:
+                rows_to_write.append((device['id'], data))
+                old_device = json.loads(old_data)
+                changes = {}
+                for field in (tracked_fields if tracked_fields != None else [*device, *(old_device.keys() - device.keys())]):
+                    if field not in ignored_fields and old_device.get(field) != device.get(field):
+                        changes[field] = {'old': old_device.get(field), 'new': device.get(field)}
+                if len(changes) > 0:
+                    diff['changed'].append({'id': device['id'], 'hostname': device.get('hostname'), 'device': device, 'changes': changes})
+                else:
+                    diff['unchanged_count'] += 1
+        #anything left in the previous state was not returned this time
+        diff['removed'] = [json.loads(data) for data in previous_data.values()]
+
+        # UPDATE THE SNAPSHOT
+        self.connection.executemany('INSERT OR REPLACE INTO devices VALUES (?, ?)', rows_to_write)
+        self.connection.executemany('DELETE FROM devices WHERE id = ?', [(device_id,) for device_id in previous_data])
+        self.connection.execute('INSERT OR REPLACE INTO sync_state VALUES (0, ?)', (sync_timestamp,))
+        self.connection.commit()
+        logger.info('Device sync found %s added, %s removed and %s changed devices', len(diff['added']), len(diff['removed']), len(diff['changed']))
+        return diff
+
+    # Returns the devices in the snapshot, in id order
+    def get_devices(self):
+        return [json.loads(row[0]) for row in self.connection.execute('SELECT data FROM devices ORDER BY id')]
+
+    # Returns one device from the snapshot (None if not found)
+    def get_device(self, device_id):
+        row = self.connection.execute('SELECT data FROM devices WHERE id = ?', (device_id,)).fetchone()
+        return json.loads(row[0]) if row != None else None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Refreshes the persistent device snapshot for the current server (see
+# DeviceStore above) and returns the added, removed and changed devices
+# since the previous call
+def sync_devices(file_name=None, include_deactivated=True, parallel=False, max_workers=8, tracked_fields=None, ignored_fields=None):
+    with DeviceStore(file_name) as store:
+        return store.sync(include_deactivated=include_deactivated, parallel=parallel, max_workers=max_workers,
+                          tracked_fields=tracked_fields, ignored_fields=ignored_fields)
+
+
 #Return a list of all visible Device Groups
 def get_groups(exclude_default_groups=False):
+    client = get_client()
     # Calculate headers and URL
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/groups/'
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/groups/'
     # Get Device Groups from server
-    response = requests.get(request_url, headers=headers)
+    response = client.get(request_url, headers=headers)
     #Check response code
     if response.status_code == 200:
         groups = response.json() #convert to Python list
@@ -632,11 +1999,12 @@ def get_groups(exclude_default_groups=False):
 
 #Gets a single device
 def get_device(device_id):
+    client = get_client()
     # Calculate headers and URL
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}'
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/devices/{device_id}'
     # Get data on the requested device ID from the server
-    response = requests.get(request_url, headers=headers)
+    response = client.get(request_url, headers=headers)
     # Check response code
     if response.status_code == 200:
         device = response.json() #convert to Python list
@@ -645,42 +2013,111 @@ def get_device(device_id):
         #in case of error getting data, return None
         return None
 
-#hides a list of event ids from the GUI and REST API
-def archive_events (event_id_list, unarchive=False, suspicious=False, input_is_ids_only=True):
-
-    # if full events were provided, strip out just the ids before proceeding
-    if not input_is_ids_only:
-        event_ids = []
-        for event in event_id_list:
-            event_ids.append(event['id'])
-        event_id_list = event_ids
-
-    # set headers (same for all requests in this method)
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
-
-    # Create payload with list of event IDs as a Python dictionary
-    payload = {'ids': event_id_list}
-
-    # calculate the appropriate url based on configuration
-    if not suspicious and not unarchive:
-        request_url = f'https://{fqdn}/api/v1/events/actions/archive'
-    elif not suspicious and unarchive:
-        request_url = f'https://{fqdn}/api/v1/events/actions/unarchive'
-    elif suspicious and not unarchive:
-        request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/archive'
-    elif suspicious and unarchive:
-        request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/unarchive'
+# BULK EVENT ACTIONS
+#
+# Applies close, open, archive or unarchive to any number of events. The ids
+# are split into chunks of up to max_event_ids_per_request (the most the
+# server accepts in one action request), the chunks are sent concurrently on
+# max_workers threads (within the client's rate limit, and with the client's
+# retries on 429/5xx/connection errors), and chunks which still fail are
+# retried up to retries more times. A chunk rejected as too large (413) is
+# split in half and the halves retried.
+#
+# event_ids may be a list of ids or of events (dictionaries with an 'id').
+# Duplicates are sent once. Returns a report like this:
+#   {'action': 'close', 'suspicious': False, 'event_count': 1000,
+#    'succeeded_count': 1000, 'failed_count': 0, 'failed_event_ids': [],
+#    'chunks': [{'first_event_id': 1, 'last_event_id': 250, 'event_count': 250,
+#                'status_code': 204, 'attempts': 1, 'success': True, 'error': None}, ...]}
+#
+# Example usage:
+#   report = di.bulk_event_action(event_ids, 'archive')
+#
+event_actions = ['close', 'open', 'archive', 'unarchive']
+max_event_ids_per_request = 250
+
+
+def bulk_event_action(event_ids, action, suspicious=False, chunk_size=None, max_workers=8, retries=2):
+    client = get_client()
+    if action not in event_actions:
+        raise ValueError(f'Unsupported event action {action}. Choose from {", ".join(event_actions)}.')
+    if chunk_size == None:
+        chunk_size = max_event_ids_per_request
+
+    #accept events or ids, and send each id once
+    event_ids = list(dict.fromkeys(event['id'] if isinstance(event, dict) else event for event in event_ids))
+    request_url = f'{client.base_url}/api/v1/{"suspicious-events" if suspicious else "events"}/actions/{action}'
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
+
+    # SEND THE CHUNKS, THEN RETRY ANY WHICH FAILED
+    chunks = [_new_event_action_chunk(event_ids[i:i + chunk_size]) for i in range(0, len(event_ids), chunk_size)]
+    pending_chunks = chunks
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for attempt in range(retries + 1):
+            if len(pending_chunks) == 0:
+                break
+            if attempt > 0:
+                logger.warning('Retrying %s of %s chunks of %s events', len(pending_chunks), len(chunks), action)
+            list(executor.map(lambda chunk: _send_event_action_chunk(client, request_url, headers, chunk), pending_chunks))
+
+            #split chunks which were too large for the server, then collect failures
+            for chunk in pending_chunks:
+                if chunk['status_code'] == 413 and len(chunk['event_ids']) > 1:
+                    half = len(chunk['event_ids']) // 2
+                    chunk['split_into'] = [_new_event_action_chunk(chunk['event_ids'][:half]), _new_event_action_chunk(chunk['event_ids'][half:])]
+            chunks = [part for chunk in chunks for part in chunk.get('split_into', [chunk])]
+            pending_chunks = [chunk for chunk in chunks if not chunk['success']]
+
+    # BUILD THE REPORT
+    report = {'action': action, 'suspicious': suspicious, 'event_count': len(event_ids),
+              'succeeded_count': 0, 'failed_count': 0, 'failed_event_ids': [], 'chunks': []}
+    for chunk in chunks:
+        if chunk['success']:
+            report['succeeded_count'] += len(chunk['event_ids'])
+        else:
+            report['failed_count'] += len(chunk['event_ids'])
+            report['failed_event_ids'].extend(chunk['event_ids'])
+        report['chunks'].append({'first_event_id': chunk['event_ids'][0], 'last_event_id': chunk['event_ids'][-1], 'event_count': len(chunk['event_ids']),
+                                 'status_code': chunk['status_code'], 'attempts': chunk['attempts'], 'success': chunk['success'], 'error': chunk['error']})
+
+    if report['failed_count'] == 0:
+        logger.info('%s succeeded for %s events in %s requests', action, report['succeeded_count'], len(chunks))
+    else:
+        logger.error('%s failed for %s of %s events. See failed_event_ids in the returned report.', action, report['failed_count'], len(event_ids))
+    return report
+
+
+def _new_event_action_chunk(event_ids):
+    return {'event_ids': event_ids, 'attempts': 0, 'status_code': None, 'success': False, 'error': 'Not sent'}
 
-    #send request to server
-    response = requests.post(request_url, headers=headers, json=payload)
 
+# Sends one chunk of a bulk event action and records the outcome on the chunk
+def _send_event_action_chunk(client, request_url, headers, chunk):
+    chunk['attempts'] += 1
+    chunk['status_code'] = None
+    chunk['error'] = None
+    try:
+        response = client.post(request_url, headers=headers, json={'ids': chunk['event_ids']})
+        chunk['status_code'] = response.status_code
+        if response.status_code != 204:
+            chunk['error'] = f'Unexpected return code {response.status_code}'
+    except requests.exceptions.RequestException as e:
+        chunk['error'] = f'{type(e).__name__}: {e}'
+    chunk['success'] = chunk['error'] == None
+    logger.debug('%s returned %s for %s events', request_url, chunk['status_code'], len(chunk['event_ids']))
+
+
+#hides a list of event ids from the GUI and REST API
+def archive_events(event_id_list, unarchive=False, suspicious=False, input_is_ids_only=True):
+    #ids and full events are both accepted (input_is_ids_only is kept for compatibility)
+    report = bulk_event_action(event_id_list, 'unarchive' if unarchive else 'archive', suspicious=suspicious)
     #return true if successful, false otherwise
-    return (response.status_code == 204)
+    return report['failed_count'] == 0
 
 
 #hides a list of suspicious event ids from the GUI and REST API
 def archive_suspicious_events(event_id_list, unarchive=False, input_is_ids_only=True):
-    return archive_events(event_id_list=event_id_list, suspicious=True)
+    return archive_events(event_id_list=event_id_list, unarchive=unarchive, suspicious=True, input_is_ids_only=input_is_ids_only)
 
 
 #unhides a list of event ids from the GUI and REST API
@@ -695,7 +2132,8 @@ def unarchive_suspicious_events(event_id_list, input_is_ids_only=True):
 
 #allows organization of exported data by server-specific folders
 def create_export_folder():
-    exported_data_folder_name = f'exported_data_from_{fqdn}'
+    client = get_client()
+    exported_data_folder_name = f'exported_data_from_{client.fqdn}'
     # Check if a folder already exists for data exports from this server
     if not os.path.exists(exported_data_folder_name):
         # ...If not, then create it
@@ -703,119 +2141,128 @@ def create_export_folder():
     return exported_data_folder_name
 
 def get_event(event_id, suspicious=False):
+    client = get_client()
 
     #define headers
-    headers = {'accept': 'application/json', 'Authorization': key}
+    headers = {'accept': 'application/json', 'Authorization': client.key}
 
     #calculate request url
     if suspicious:
-        request_url = f'https://{fqdn}/api/v1/suspicious-events/{str(event_id)}'
+        request_url = f'{client.base_url}/api/v1/suspicious-events/{str(event_id)}'
     else:
-        request_url = f'https://{fqdn}/api/v1/events/{str(event_id)}'
+        request_url = f'{client.base_url}/api/v1/events/{str(event_id)}'
 
     #make request, store response
-    response = requests.get(request_url, headers=headers)
+    response = client.get(request_url, headers=headers)
 
     # based on response code, return event or alternately an error code
     if response.status_code == 200:
         return response.json()['event']
     elif response.status_code == 404:
-        print('ERROR: Event', str(event_id), 'not found')
+        logger.error('Event %s not found', event_id)
         return []
     else:
-        print('ERROR: Unexpected return code', str(response.status_code), 'on request to', request_url)
+        logger.error('Unexpected return code %s on request to %s', response.status_code, request_url)
         return []
 
 def create_policy(name, base_policy_id, comment='', quiet_mode=False):
+    client = get_client()
 
     #define headers
-    headers = {'accept': 'application/json', 'Authorization': key}
+    headers = {'accept': 'application/json', 'Authorization': client.key}
 
     #calculate request url
-    request_url = f'https://{fqdn}/api/v1/policies/'
+    request_url = f'{client.base_url}/api/v1/policies/'
 
     #create the payload
     payload = {'name': name, 'comment': comment, 'base_policy_id': base_policy_id}
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = client.post(request_url, json=payload, headers=headers)
 
     # Check response code
     if response.status_code == 200:
         response = response.json()
         if not quiet_mode:
-            print('INFO: Policy', response['id'], response['name'], 'created')
+            logger.info('Policy %s %s created', response['id'], response['name'])
         return response
     else:
-        print('ERROR: Unexpected return code', response.status_code,
-        'on POST to', request_url, 'with payload\n', payload)
+        logger.error('Unexpected return code %s on POST to %s with payload\n%s', response.status_code, request_url, payload)
         return None
 
 def delete_policy(policy_id):
+    client = get_client()
 
     #define headers
-    headers = {'accept': 'application/json', 'Authorization': key}
+    headers = {'accept': 'application/json', 'Authorization': client.key}
 
     #calculate request url
-    request_url = f'https://{fqdn}/api/v1/policies/{policy_id}'
+    request_url = f'{client.base_url}/api/v1/policies/{policy_id}'
 
     # Send request to server
-    response = requests.delete(request_url, headers=headers)
+    response = client.delete(request_url, headers=headers)
 
     # Check response code
     if response.status_code == 204:
-        print('INFO: Policy', policy_id, 'was deleted')
+        logger.info('Policy %s was deleted', policy_id)
         return True
     elif response.status_code == 404:
-        print('ERROR: Policy', policy_id, 'not found')
+        logger.error('Policy %s not found', policy_id)
         return False
     elif response.status_code == 422:
-        print('ERROR: Policy', policy_id, 'is a default policy. Default policies cannot be deleted.')
+        logger.error('Policy %s is a default policy. Default policies cannot be deleted.', policy_id)
         return False
     else:
-        print('ERROR: Unexpected return code', response.status_code,
-        'on DELETE to', request_url)
+        logger.error('Unexpected return code %s on DELETE to %s', response.status_code, request_url)
         return False
 
-def export_events(minimum_event_id=0, suspicious=False, flatten_device_info=True, search={}):
+# Export Events to disk (Excel format by default, see ExportWriter for the
+# other formats and compression options). Events are streamed page by page,
+# so exports larger than Excel's row limit roll over to additional sheets.
+def export_events(minimum_event_id=0, suspicious=False, flatten_device_info=True, search={}, format='xlsx', compression=None):
+    client = get_client()
 
-    events = get_events(minimum_event_id=minimum_event_id, suspicious=suspicious, search=search)
+    #this logic improves resiliency case the product API adds/removes columns from event data
+    export_column_names = ['id', 'status', 'action', 'type', 'trigger', 'threat_severity', 'file_hash', 'deep_classification', 'file_archive_hash', 'path', 'timestamp', 'insertion_timestamp', 'close_timestamp', 'close_trigger', 'last_reoccurrence', 'reoccurrence_count', 'last_action', 'device_id', 'recorded_device_info.os', 'recorded_device_info.mac_address', 'recorded_device_info.hostname', 'recorded_device_info.tag', 'recorded_device_info.group_name', 'recorded_device_info.policy_name', 'recorded_device_info.tenant_name', 'comment', 'mitre_classifications', 'file_size', 'file_status', 'sandbox_status', 'msp_name', 'msp_id', 'tenant_name', 'tenant_id']
 
-    if len(events) > 0:
-        if flatten_device_info:
-            #flattens recorded_device_info into discreet columns. Examples: recorded_device_info.hostname, recorded_device_info.policy_name
-            events = pandas.json_normalize(events)
-        events_df = pandas.DataFrame(events)
-        events_df.sort_values(by=['id'], inplace=True)
-        folder_name = create_export_folder()
-        file_name = f'events_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}.xlsx'
-        if suspicious:
-            file_name = f'suspicious_{file_name}'
-
-        #this logic improves resiliency case the product API adds/removes columns from event data
-        export_column_names = ['id', 'status', 'action', 'type', 'trigger', 'threat_severity', 'file_hash', 'deep_classification', 'file_archive_hash', 'path', 'timestamp', 'insertion_timestamp', 'close_timestamp', 'close_trigger', 'last_reoccurrence', 'reoccurrence_count', 'last_action', 'device_id', 'recorded_device_info.os', 'recorded_device_info.mac_address', 'recorded_device_info.hostname', 'recorded_device_info.tag', 'recorded_device_info.group_name', 'recorded_device_info.policy_name', 'recorded_device_info.tenant_name', 'comment', 'mitre_classifications', 'file_size', 'file_status', 'sandbox_status', 'msp_name', 'msp_id', 'tenant_name', 'tenant_id']
-        events_df_column_names = list(events_df.columns.values)
-        columns = []
-        for column_name in export_column_names:
-            if column_name in events_df_column_names:
-                columns.append(column_name)
-
-        #now that we have what we know is a valid list of coulmns, proceed
-        events_df.to_excel(f'{folder_name}/{file_name}', index=False, sheet_name='Event_Data', columns=columns)
-        print (f'INFO: {str(len(events))} events exported to {folder_name}/{file_name}')
+    folder_name = create_export_folder()
+    file_name = f'events_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{client.fqdn.split(".",1)[0]}'
+    if suspicious:
+        file_name = f'suspicious_{file_name}'
+
+    #the columns are fixed up front rather than learned from the first rows,
+    #since fields such as close_timestamp or comment may only appear on later
+    #events; events lacking a column get a blank value
+    if not flatten_device_info:
+        export_column_names = [column for column in export_column_names if not column.startswith('recorded_device_info.')]
+
+    #stream the events page by page (they arrive in id order) straight to disk
+    with ExportWriter(f'{folder_name}/{file_name}', format=format, compression=compression, columns=export_column_names, sheet_name='Event_Data') as writer:
+        for page in iter_events(minimum_event_id=minimum_event_id, suspicious=suspicious, search=search, pages=True):
+            if flatten_device_info:
+                #flattens recorded_device_info into discreet columns. Examples: recorded_device_info.hostname, recorded_device_info.policy_name
+                page = [_flatten_record(event) for event in page]
+            writer.write_rows(page)
+
+    if writer.row_count > 0:
+        logger.info('%s events exported to %s', writer.row_count, ', '.join(writer.files))
     else:
-        print('WARNING: No events were found on the server')
+        logger.warning('No events were found on the server')
 
-def export_groups(exclude_default_groups=False):
+# Export Device Groups to disk (Excel format by default, see ExportWriter for
+# the other formats and compression options)
+def export_groups(exclude_default_groups=False, format='xlsx', compression=None):
+    client = get_client()
     groups = get_groups(exclude_default_groups=exclude_default_groups)
-    groups_df = pandas.DataFrame(groups)
     folder_name = create_export_folder()
-    file_name = f'groups_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}.xlsx'
-    groups_df.to_excel(f'{folder_name}/{file_name}', index=False)
-    print (f'INFO: {str(len(groups))} groups exported to {folder_name}/{file_name}')
+    file_name = f'groups_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{client.fqdn.split(".",1)[0]}'
+    with ExportWriter(f'{folder_name}/{file_name}', format=format, compression=compression) as writer:
+        writer.write_rows(groups)
+    logger.info('%s groups exported to %s', len(groups), ', '.join(writer.files))
 
 
 def create_tenant(tenant_name, license_limit, msp_name):
+    client = get_client()
 
     #convert provided msp_name to msp_id
     msp_id = get_msp_id(msp_name)
@@ -826,13 +2273,13 @@ def create_tenant(tenant_name, license_limit, msp_name):
                 'license_limit': license_limit }
 
     #calculate headers
-    headers = {'Content-Type': 'application/json', 'Authorization': key}
+    headers = {'Content-Type': 'application/json', 'Authorization': client.key}
 
     #calculate URL
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/'
+    request_url = f'{client.base_url}/api/v1/multitenancy/tenant/'
 
     # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
+    response = client.post(request_url, json=payload, headers=headers)
 
     # Check return code and return success or descriptive error
     if response.status_code == 200: #tenant creation was successful
@@ -859,6 +2306,7 @@ def get_msp_id(msp_name):
 
 
 def delete_tenant(tenant_name, msp_name):
+    client = get_client()
 
     #convert provided msp_name to msp_id
     msp_id = get_msp_id(msp_name)
@@ -872,85 +2320,58 @@ def delete_tenant(tenant_name, msp_name):
                 tenant_id = tenant['id']
 
     #calculate URL and headers
-    request_url = f'https://{fqdn}/api/v1/multitenancy/tenant/{tenant_id}'
-    headers = {'Authorization': key}
+    request_url = f'{client.base_url}/api/v1/multitenancy/tenant/{tenant_id}'
+    headers = {'Authorization': client.key}
 
     #send request to server
-    response = requests.delete(request_url, headers=headers)
+    response = client.delete(request_url, headers=headers)
 
     # Check return code and return Success or descriptive error
     if response.status_code == 204:
-        print('INFO: Tenant', tenant_name, 'was deleted from MSP', msp_name)
+        logger.info('Tenant %s was deleted from MSP %s', tenant_name, msp_name)
         return True
     elif response.status_code == 403:
-        print('ERROR: Only Hub-Admin or MSP-Admin can delete tenants')
+        logger.error('Only Hub-Admin or MSP-Admin can delete tenants')
         return False
     elif response.status_code == 404:
-        print('ERROR: Tenant not found')
+        logger.error('Tenant not found')
         return False
     elif response.status_code == 409:
-        print('ERROR: Tried to delete a tenant but active devices still exist!')
+        logger.error('Tried to delete a tenant but active devices still exist!')
         return False
 
 def request_agent_logs(device_id, device_id_only=True):
+    client = get_client()
 
     if not device_id_only:
         device_id = device_id['id']
 
     #calculate URL and headers
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/upload-logs'
-    headers = {'Authorization': key, 'accept': 'application/json'}
+    request_url = f'{client.base_url}/api/v1/devices/{device_id}/actions/upload-logs'
+    headers = {'Authorization': client.key, 'accept': 'application/json'}
 
     # Send request to server
-    response = requests.post(request_url, headers=headers)
+    response = client.post(request_url, headers=headers)
 
     # Check return code and return Success or descriptive error
     if response.status_code == 204:
-        print('INFO: Device', device_id, 'set to upload logs')
+        logger.info('Device %s set to upload logs', device_id)
         return True
     elif response.status_code == 403:
-        print('WARN: Device', device_id, 'does not belong to connector’s msp')
+        logger.warning('Device %s does not belong to connector’s msp', device_id)
         return False
     elif response.status_code == 404:
-        print('WARN: Device', device_id, 'not found')
+        logger.warning('Device %s not found', device_id)
         return False
     else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url, 'with headers', headers)
+        logger.error('Unexpected return code %s on POST to %s with headers %s', response.status_code, request_url, headers)
         return False
 
+#closes (or reopens) a list of event ids
 def close_events(event_id_list, open=False, suspicious=False):
-
-    #calculate URL
-    if suspicious:
-        if open:
-            request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/open'
-        else:
-            request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/close'
-    else:
-        if open:
-            request_url = f'https://{fqdn}/api/v1/events/actions/open'
-        else:
-            request_url = f'https://{fqdn}/api/v1/events/actions/close'
-
-    #calculate headers and payload
-    headers = {'Authorization': key,
-                'accept': 'application/json',
-                'Content-Type': 'application/json'}
-    payload = {'ids': event_id_list}
-
-    # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
-
-    # Check return code and return Success or descriptive error
-    if response.status_code == 204:
-        if open:
-            print('INFO:', len(event_id_list), 'events were opened')
-        else:
-            print('INFO:', len(event_id_list), 'events were closed')
-        return True
-    else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
-        return False
+    report = bulk_event_action(event_id_list, 'open' if open else 'close', suspicious=suspicious)
+    #return true if successful, false otherwise
+    return report['failed_count'] == 0
 
 def close_suspicious_events(event_id_list):
     return close_events(event_id_list=event_id_list, suspicious=True)
@@ -961,42 +2382,9 @@ def open_events(event_id_list, suspicious=False):
 def open_suspicious_events(event_id_list):
     return open_events(event_id_list=event_id_list, suspicious=True)
 
-def archive_events(event_id_list, unarchive=False, suspicious=False):
-
-    #calculate URL
-    if suspicious:
-        if unarchive:
-            request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/unarchive'
-        else:
-            request_url = f'https://{fqdn}/api/v1/suspicious-events/actions/archive'
-    else:
-        if unarchive:
-            request_url = f'https://{fqdn}/api/v1/events/actions/unarchive'
-        else:
-            request_url = f'https://{fqdn}/api/v1/events/actions/archive'
-
-    #calculate headers and payload
-    headers = {'Authorization': key,
-                'accept': 'application/json',
-                'Content-Type': 'application/json'}
-    payload = {'ids': event_id_list}
-
-    # Send request to server
-    response = requests.post(request_url, json=payload, headers=headers)
-
-    # Check return code and return Success or descriptive error
-    if response.status_code == 204:
-        if unarchive:
-            print('INFO: Successfully unarchived up to ', len(event_id_list), 'events')
-        else:
-            print('INFO: Successfully archived up to ', len(event_id_list), 'events')
-        return True
-    else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
-        return False
-
 # Disable scanning and enforcement on a device
 def disable_device(device, device_id_only=False):
+    client = get_client()
 
     #PROCESS INPUT
     if device_id_only:
@@ -1007,21 +2395,22 @@ def disable_device(device, device_id_only=False):
         device_id = device['id']
 
     #DISABLE THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/disable'
-    headers = {'Authorization': key}
-    response = requests.post(request_url, headers=headers)
+    request_url = f'{client.base_url}/api/v1/devices/{device_id}/actions/disable'
+    headers = {'Authorization': client.key}
+    response = client.post(request_url, headers=headers)
 
     #RETURN TRUE/FALSE BASED ON WHETHER WE GOT THE EXPECTED RETURN CODE
     if response.status_code == 204:
-        print('INFO: Successfully set device', device, 'to be disabled')
+        logger.info('Successfully set device %s to be disabled', device)
         return True
     else:
-        print('INFO: Failed to disable device', device)
+        logger.error('Failed to disable device %s', device)
         return False
 
 
 # Enable scanning and enforcement on a device
 def enable_device(device, device_id_only=False):
+    client = get_client()
 
     #PROCESS INPUT
     if device_id_only:
@@ -1032,35 +2421,37 @@ def enable_device(device, device_id_only=False):
         device_id = device['id']
 
     #ENABLE THE DEVICE
-    request_url = f'https://{fqdn}/api/v1/devices/{device_id}/actions/enable'
-    headers = {'Authorization': key}
-    response = requests.post(request_url, headers=headers)
+    request_url = f'{client.base_url}/api/v1/devices/{device_id}/actions/enable'
+    headers = {'Authorization': client.key}
+    response = client.post(request_url, headers=headers)
 
     #RETURN TRUE/FALSE BASED ON WHETHER WE GOT THE EXPECTED RETURN CODE
     if response.status_code == 204:
-        print('INFO: Successfully set device', device, 'to be enabled')
+        logger.info('Successfully set device %s to be enabled', device)
         return True
     else:
-        print('INFO: Failed to enable device', device)
+        logger.error('Failed to enable device %s', device)
         return False
 
 
 def get_event_counts_by_device_id(minimum_event_id=0, event_filters={}):
 
-    #get event data from server
-    events = get_events(minimum_event_id=minimum_event_id, search=event_filters)
-
-    #convert to PivotTable style summary of event count by device id
-    event_counts = count_data_by_field(events, 'device_id')
+    #stream event data from server and convert to PivotTable style summary of
+    #event count by device id as it arrives
+    aggregator = aggregate_events(['device_id'], minimum_event_id=minimum_event_id, search=event_filters)
 
     #return the data
-    return event_counts
+    return aggregator.totals('device_id')
 
 
+# Exports event counts by device id, plus pivots of the same counts by event
+# type and by threat severity (one row per device, one column per value)
 def export_event_count_by_device_id(minimum_event_id=0, event_filters={}):
+    client = get_client()
 
-    #get events counts
-    event_counts = get_event_counts_by_device_id(minimum_event_id=minimum_event_id, event_filters=event_filters)
+    #count events by device id, type and severity in one pass over the events
+    aggregator = aggregate_events(['device_id', 'type', 'threat_severity'], minimum_event_id=minimum_event_id, search=event_filters)
+    event_counts = aggregator.totals('device_id')
 
     #above returns a dictionary; the syntax below flattens this into a 2-column dataframe
     event_counts_df = pandas.DataFrame(list(event_counts.items()),columns = ['device_id','event_count'])
@@ -1070,24 +2461,231 @@ def export_event_count_by_device_id(minimum_event_id=0, event_filters={}):
 
     #calculate (and create if necessary) export folder and file name
     folder_name = create_export_folder()
-    file_name = f'event_count_by_device_id_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{fqdn.split(".",1)[0]}.xlsx'
+    file_name = f'event_count_by_device_id_{datetime.datetime.today().strftime("%Y-%m-%d_%H.%M")}_{client.fqdn.split(".",1)[0]}.xlsx'
 
     #write data to disk
-    event_counts_df.to_excel(f'{folder_name}/{file_name}', index=False, sheet_name='Event_Counts')
-    print('INFO: event counts were exported to disk as:', f'{folder_name}/{file_name}')
+    with pandas.ExcelWriter(f'{folder_name}/{file_name}') as writer:
+        event_counts_df.to_excel(writer, index=False, sheet_name='Event_Counts')
+        aggregator.pivot(index='device_id', columns='type').to_excel(writer, sheet_name='Event_Counts_By_Type')
+        aggregator.pivot(index='device_id', columns='threat_severity').to_excel(writer, sheet_name='Event_Counts_By_Severity')
+    logger.info('Event counts were exported to disk as: %s/%s', folder_name, file_name)
 
     #return event_counts in case needed for further analysis in another method
     return event_counts
 
 def count_data_by_field(data, field_name):
+    return dict(collections.Counter(record[field_name] for record in data))
+
+
+# EVENT AGGREGATION
+#
+# EventAggregator counts events over any combination of fields, for example
+# ['device_id', 'type', 'threat_severity', 'week'], as they stream in from
+# iter_events (or EventStore.iter_events), so the raw events never need to be
+# kept in memory. Besides the event fields, these time buckets derived from the
+# event timestamp can be used as fields:
+#   'day' (YYYY-MM-DD), 'week' (YYYY-MM-DD of the Monday) and 'month' (YYYY-MM)
+# Events which lack a field are counted under None for that field.
+#
+# Example:
+#   aggregator = di.aggregate_events(['device_id', 'type', 'week'], search={'status': ['OPEN']})
+#   aggregator.totals('device_id')                       -> {device_id: event_count}
+#   aggregator.pivot(index='device_id', columns='type')  -> DataFrame of counts
+#   aggregator.to_dataframe()                            -> one row per combination
+
+time_bucket_fields = ['day', 'week', 'month']
+
+
+class EventAggregator:
+
+    def __init__(self, fields, timestamp_field='timestamp'):
+        self.fields = list(fields)
+        self.timestamp_field = timestamp_field
+        #event count per combination of field values (tuples in field order)
+        self.counts = collections.Counter()
+        self._time_buckets = {}
+        #pick the cheapest way to build the key for this combination of fields
+        if any(field in time_bucket_fields for field in self.fields):
+            self._get_key = self._get_key_with_time_buckets
+        elif len(self.fields) == 1:
+            field = self.fields[0]
+            self._get_key = lambda event: (event.get(field),)
+        else:
+            self._get_key = lambda event: tuple(map(event.get, self.fields))
+
+    # Returns the day, week and month buckets for a timestamp, cached per date
+    def _get_time_buckets(self, timestamp):
+        date = (timestamp or '')[:10]
+        buckets = self._time_buckets.get(date)
+        if buckets == None:
+            try:
+                day = datetime.date.fromisoformat(date)
+                buckets = {'day': date, 'week': (day - datetime.timedelta(days=day.weekday())).isoformat(), 'month': date[:7]}
+            except ValueError:
+                buckets = {'day': None, 'week': None, 'month': None}
+            self._time_buckets[date] = buckets
+        return buckets
+
+    # Returns the tuple of field values an event is counted under, when some
+    # of the fields are time buckets
+    def _get_key_with_time_buckets(self, event):
+        timestamp = event.get(self.timestamp_field)
+        buckets = self._time_buckets.get(timestamp[:10] if timestamp else '') or self._get_time_buckets(timestamp)
+        return tuple([buckets[field] if field in buckets else event.get(field) for field in self.fields])
+
+    # Counts one event
+    def add(self, event):
+        self.counts[self._get_key(event)] += 1
+
+    # Counts every event from an iterable (such as iter_events). Returns self.
+    def update(self, events):
+        self.counts.update(map(self._get_key, events))
+        return self
+
+    @property
+    def event_count(self):
+        return sum(self.counts.values())
+
+    # Returns {value: event_count} for one field, summed over all other fields
+    # (the same output as count_data_by_field)
+    def totals(self, field):
+        position = self.fields.index(field)
+        totals = collections.Counter()
+        for key, count in self.counts.items():
+            totals[key[position]] += count
+        return dict(totals)
+
+    # Returns {value: event rate} for one field, where the rate is the event
+    # count divided by the duration in days and multiplied by per_days (so
+    # per_days=7 gives a weekly rate). durations_in_days is a dictionary of
+    # {value: days}; values with no events get a rate of 0. Durations under a
+    # day are treated as one day.
+    def rates(self, field, durations_in_days, per_days=7):
+        totals = self.totals(field)
+        return {value: totals.get(value, 0) / max(days, 1) * per_days for value, days in durations_in_days.items()}
+
+    # Returns the counts as a DataFrame with one column per field plus
+    # event_count, highest count first
+    def to_dataframe(self):
+        records = [(*key, count) for key, count in self.counts.items()]
+        dataframe = pandas.DataFrame(records, columns=[*self.fields, 'event_count'])
+        return dataframe.sort_values(by=['event_count'], ascending=False, ignore_index=True)
+
+    # Returns a PivotTable style DataFrame of event counts with one row per
+    # value of index and one column per value of columns (both may also be
+    # lists of fields), summed over any other fields
+    def pivot(self, index, columns, fill_value=0):
+        dataframe = self.to_dataframe()
+        return dataframe.pivot_table(index=index, columns=columns, values='event_count', aggfunc='sum', fill_value=fill_value, dropna=False)
+
+
+# Streams events matching the search parameters (or from the provided events
+# iterable instead) into a new EventAggregator over fields and returns it
+def aggregate_events(fields, search={}, minimum_event_id=0, suspicious=False, events=None, timestamp_field='timestamp'):
+    if events == None:
+        events = iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious)
+    return EventAggregator(fields, timestamp_field=timestamp_field).update(events)
+
+
+# INDEXED JOINS
+# The methods below replace nested "for device in devices: for policy in
+# policies:" loops with hash lookups, so enriching N devices against M
+# policies/groups/tenants/msps costs O(N + M) instead of O(N x M).
+
+# Builds a dictionary of records keyed on the provided field (default 'id').
+# If several records share a key, the last one wins.
+def build_index(records, field='id'):
+    index = {}
+    for record in records:
+        index[record[field]] = record
+    return index
+
+
+# Copies fields from the matching record in index (looked up by the value of
+# key_field in each record) onto each record. fields is either a list of field
+# names, or a dictionary of {field_name_on_record: field_name_on_index_record}.
+# Records with no match are left unchanged unless fill_missing=True, in which
+# case the fields are set to default. Returns the (modified in place) records.
+def attach(records, index, key_field, fields, fill_missing=False, default=None):
+    if isinstance(fields, list):
+        fields = {field: field for field in fields}
+    for record in records:
+        match = index.get(record.get(key_field))
+        if match != None:
+            for target_field, source_field in fields.items():
+                record[target_field] = match.get(source_field, default)
+        elif fill_missing:
+            for target_field in fields:
+                record[target_field] = default
+    return records
+
+
+# Enriches devices with fields from their policy, group, tenant, and msp in a
+# single linear pass per data set. Each *_fields argument takes the same format
+# as attach() (list of names or {device_field: source_field}). Example:
+#   di.enrich_devices(devices, policies=policies, policy_fields={'in_prevention': 'prevention_mode'})
+def enrich_devices(devices, policies=None, policy_fields=[], groups=None, group_fields=[], tenants=None, tenant_fields=[], msps=None, msp_fields=[], fill_missing=False, default=None):
+    if policies != None:
+        attach(devices, build_index(policies), 'policy_id', policy_fields, fill_missing=fill_missing, default=default)
+    if groups != None:
+        attach(devices, build_index(groups), 'group_id', group_fields, fill_missing=fill_missing, default=default)
+    if tenants != None:
+        attach(devices, build_index(tenants), 'tenant_id', tenant_fields, fill_missing=fill_missing, default=default)
+    if msps != None:
+        attach(devices, build_index(msps), 'msp_id', msp_fields, fill_missing=fill_missing, default=default)
+    return devices
+
+
+# Groups records into a dictionary of lists keyed on the provided field
+def group_data_by_field(data, field_name):
     result = {}
     for record in data:
-        if record[field_name] in result.keys():
-            result[record[field_name]] += 1
-        else:
-            result[record[field_name]] = 1
+        result.setdefault(record[field_name], []).append(record)
     return result
 
+
+# TIME DERIVATION
+# The methods below parse the ISO 8601 timestamps returned by the server (such
+# as last_registration, last_contact or an event's timestamp) for a whole data
+# set at once with pandas, instead of one dateutil.parser.parse call per record,
+# and measure every record against one reference time.
+
+# Fields added by add_days_since by default, as {new_field: timestamp_field}
+device_age_fields = {'days_since_deployment': 'last_registration', 'last_contact_days_ago': 'last_contact'}
+
+
+# Parses a list of ISO 8601 timestamp strings into a UTC pandas DatetimeIndex.
+# Missing values (None or empty) become NaT. Works with pandas 1.0 or later:
+# pandas 2 needs format='ISO8601' to accept a mix of timestamps with and
+# without fractional seconds, while pandas 1.x (which has no such format)
+# parses each ISO 8601 string as-is.
+def parse_timestamps(values):
+    values = [value or None for value in values]
+    if int(pandas.__version__.split('.')[0]) >= 2:
+        return pandas.to_datetime(values, utc=True, format='ISO8601')
+    return pandas.to_datetime(values, utc=True)
+
+
+# Adds whole-day age fields to each record, where fields is a dictionary of
+# {new_field: timestamp_field}. The age is the number of full days between the
+# timestamp and reference_time (default is now, read once for all records),
+# matching (reference_time - timestamp).days. Records with no timestamp get
+# default. Returns the (modified in place) records. Example:
+#   di.add_days_since(devices)  -> adds days_since_deployment and last_contact_days_ago
+def add_days_since(records, fields=device_age_fields, reference_time=None, default=None):
+    if reference_time == None:
+        reference_time = datetime.datetime.now(datetime.timezone.utc)
+    reference_time = pandas.Timestamp(reference_time)
+    if reference_time.tzinfo == None:
+        reference_time = reference_time.tz_localize('UTC')
+
+    for target_field, source_field in fields.items():
+        timestamps = parse_timestamps([record.get(source_field) for record in records])
+        ages = (reference_time - timestamps).days
+        for record, age in zip(records, ages.tolist()):
+            record[target_field] = default if age != age else int(age)
+    return records
+
 def is_prevention_policy(policy, exclude_static_analysis=False, exclude_ransomware_behavior=False, exclude_remote_code_injection=False, exclude_arbritrary_shallcode_execution=False):
 
     verdict = False #start with false until proven otherwise
@@ -1108,74 +2706,81 @@ def is_prevention_policy(policy, exclude_static_analysis=False, exclude_ransomwa
     return verdict
 
 def download_uploaded_file(file_hash):
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/events/actions/download-uploaded-file/{file_hash}'
-    response = requests.get(request_url, headers=headers)
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/events/actions/download-uploaded-file/{file_hash}'
+    response = client.get(request_url, headers=headers)
     if response.status_code == 200:
         folder_name = create_export_folder()
         file_name = f'{file_hash}.zip'
         open(f'{folder_name}/{file_name}','wb').write(response.content)
         return True
     else:
-        print('ERROR: Unexpected status code', response.status_code, 'on GET', request_url)
+        logger.error('Unexpected status code %s on GET %s', response.status_code, request_url)
         return False
 
 def request_malware_sample(event_id):
+    client = get_client()
 
     #calculate URL and headers
-    headers = {'accept': 'application/json', 'Authorization': key}
-    request_url = f'https://{fqdn}/api/v1/devices/actions/request-remote-file-upload/{event_id}'
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/devices/actions/request-remote-file-upload/{event_id}'
 
     # Send request to server
-    response = requests.post(request_url, headers=headers)
+    response = client.post(request_url, headers=headers)
 
     # Check return code and return Success or descriptive error
     if response.status_code == 204:
-        print('INFO: Upload of malware sample for event', event_id, 'successfully queued')
+        logger.info('Upload of malware sample for event %s successfully queued', event_id)
         return True
     elif response.status_code == 404:
-        print('WARN: Event', event_id, 'not found')
+        logger.warning('Event %s not found', event_id)
         return False
     else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url, 'with headers', headers)
+        logger.error('Unexpected return code %s on POST to %s with headers %s', response.status_code, request_url, headers)
         return False
 
-def isolate_from_network(devices, release_from_isolation=False, input_is_hostnames=True):
+# Isolates devices from the network (or releases them from isolation). devices
+# is a list of hostnames, or of hostname regex patterns or CIDRs when the
+# matching search option is set (see get_device_ids), or of device ids when
+# input_is_hostnames is False.
+def isolate_from_network(devices, release_from_isolation=False, input_is_hostnames=True, regex_hostname_search=False, cidr_search=False):
+    client = get_client()
 
     if input_is_hostnames:
-        device_ids = get_device_ids(search_list=devices)
+        device_ids = get_device_ids(search_list=devices, regex_hostname_search=regex_hostname_search, cidr_search=cidr_search)
     else:
         device_ids = devices
 
-    if not remove_from_isolation:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/isolate-from-network'
+    if not release_from_isolation:
+        request_url = f'{client.base_url}/api/v1/devices/actions/isolate-from-network'
     else:
-        request_url = f'https://{fqdn}/api/v1/devices/actions/release-from-isolation'
+        request_url = f'{client.base_url}/api/v1/devices/actions/release-from-isolation'
 
     headers = {'accept': 'application/json',
                 'Content-Type': 'application/json',
-                'Authorization': key}
+                'Authorization': client.key}
     payload = {'ids': device_ids}
 
-    response = requests.post(request_url, headers=headers, json=payload)
+    response = client.post(request_url, headers=headers, json=payload)
 
     if response.status_code == 200:
-        if remove_from_isolation:
-            print('INFO: Removed', len(device_ids), 'devices from network isolation')
+        if release_from_isolation:
+            logger.info('Removed %s devices from network isolation', len(device_ids))
         else:
-            print('INFO: Network isolated', len(device_ids), 'devices')
+            logger.info('Network isolated %s devices', len(device_ids))
         return True
     else:
-        print('ERROR: Unexpected return code', response.status_code,
-                'on POST to', request_url, 'with payload', payload)
+        logger.error('Unexpected return code %s on POST to %s with payload %s', response.status_code, request_url, payload)
         return False
 
 
-def remove_from_isolation(device_ids, input_is_hostnames=True):
-    return isolate_from_network(device_ids=device_ids, release_from_isolation=True, input_is_hostnames=input_is_hostnames)
+def remove_from_isolation(devices, input_is_hostnames=True, regex_hostname_search=False, cidr_search=False):
+    return isolate_from_network(devices, release_from_isolation=True, input_is_hostnames=input_is_hostnames, regex_hostname_search=regex_hostname_search, cidr_search=cidr_search)
 
 
 def add_hashes_to_deny_list(hash_list, policy_id=0, all_policies=False, platforms=['WINDOWS','MAC','LINUX','NETWORK_AGENTLESS']):
+    client = get_client()
 
     policies = get_policies(include_policy_data=False)
     policy_id_list = []
@@ -1191,117 +2796,302 @@ def add_hashes_to_deny_list(hash_list, policy_id=0, all_policies=False, platform
 
     headers = {'accept': 'application/json',
                 'Content-Type': 'application/json',
-                'Authorization': key}
+                'Authorization': client.key}
 
     error_count = 0
     for policy_id in policy_id_list:
-        request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/deny-list/hashes'
-        response = requests.post(request_url, headers=headers, json=payload)
+        request_url = f'{client.base_url}/api/v1/policies/{policy_id}/deny-list/hashes'
+        response = client.post(request_url, headers=headers, json=payload)
         if response.status_code == 204:
-            print('INFO: Successfully added', len(payload['items']), 'hashes to the deny list for policy', policy_id)
+            logger.info('Successfully added %s hashes to the deny list for policy %s', len(payload['items']), policy_id)
         else:
-            print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
+            logger.error('Unexpected return code %s on POST to %s', response.status_code, request_url)
             error_count += 1
     if error_count > 0:
         return False
     else:
         return True
 
-# Method to copy policies from one MSP to another on a multi-tenancy server
-def migrate_policies(source_msp_id, destination_msp_id, platforms_to_migrate=['WINDOWS', 'MAC'], allow_deny_and_exclusion_list_types = ['allow-list/hashes', 'allow-list/paths', 'allow-list/certificates', 'allow-list/process_paths', 'allow-list/scripts', 'deny-list/hashes', 'exclusion-list/folder_path', 'exclusion-list/process_path'] , null_comment_workaround_enabled=True):
-
-    #get policies from each of the MSPs
-    source_msp_policies = get_policies(include_policy_data=True, keep_data_encapsulated=True, include_allow_deny_lists=True, msp_id=source_msp_id)
-    destination_msp_policies = get_policies(include_policy_data=True, keep_data_encapsulated=True, include_allow_deny_lists=True, msp_id=destination_msp_id)
-
-    #build list of policy names in destination MSP (so as to avoid collissions)
-    destination_msp_policy_names = []
-    for policy in destination_msp_policies:
-        destination_msp_policy_names.append(policy['name'])
-
-    #build a dictionary of default policy IDs in destination MSP (used for policy creation)
-    destination_default_policy_ids = {}
-    for policy in destination_msp_policies:
-        if policy['is_default_policy']:
-            destination_default_policy_ids[policy['os']] = policy['id']
-
-    #build list of policies to migrate
-    policies_to_migrate = []
-    for source_msp_policy in source_msp_policies:
-        if source_msp_policy['os'] in platforms_to_migrate:
-            policies_to_migrate.append(source_msp_policy)
-
-    #Migrate the policies
-    for policy in policies_to_migrate:
-
-        #first step is to create the base policy, which we'll base on the platform-specific default policy
-        if policy['name'] in destination_msp_policy_names:
-            for destination_msp_policy in destination_msp_policies:
-                if policy['name'] == destination_msp_policy['name']:
-                    new_policy = destination_msp_policy
+# POLICY DIFF ENGINE
+#
+# Compares policies as returned by get_policies(include_policy_data=True,
+# keep_data_encapsulated=True, include_allow_deny_lists=True) and works out the
+# fewest requests needed to make a destination policy match a source policy:
+#   -one PUT of the policy data, only if any setting differs
+#   -one POST per list type, with only the list items missing on the destination
+#   -one DELETE per list type, with only the items not on the source (only if
+#    delete_extra_list_items is enabled, otherwise extra items are left alone)
+# List items are matched on their 'item' value, so an item whose comment
+# differs is considered present. Re-running a migration which already
+# succeeded results in an empty plan and no write requests at all.
+
+policy_list_types = ['allow-list/hashes', 'allow-list/paths', 'allow-list/certificates', 'allow-list/process_paths', 'allow-list/scripts', 'deny-list/hashes', 'exclusion-list/folder_path', 'exclusion-list/process_path']
+
+
+# Returns the value used to match a list item between policies
+def _get_list_item_key(item):
+    if 'item' in item:
+        return item['item']
+    return json.dumps(item, sort_keys=True)
+
+
+# Returns the plan (a list of operations) which makes destination_policy match
+# source_policy. Pass destination_policy=None for a policy which does not exist
+# yet; base_policy (the policy it will be created from) is then used for the
+# comparison of policy data. Each operation looks like this:
+#   {'method': 'PUT' | 'POST' | 'DELETE', 'endpoint': 'data' or a list type,
+#    'payload': {...}, 'description': 'human readable summary'}
+def diff_policy(source_policy, destination_policy, base_policy=None, list_types=policy_list_types, delete_extra_list_items=False, null_comment_workaround_enabled=True):
+    operations = []
+    if destination_policy == None:
+        destination_policy = {'data': (base_policy or {}).get('data', {}), 'allow_deny_and_exclusion_lists': {}}
+
+    # POLICY DATA
+    if 'data' in source_policy:
+        source_data = source_policy['data']
+        destination_data = destination_policy.get('data', {})
+        changed_settings = [setting for setting, value in source_data.items() if destination_data.get(setting) != value]
+        if len(changed_settings) > 0:
+            operations.append({'method': 'PUT', 'endpoint': 'data', 'payload': {'data': source_data},
+                               'description': f'PUT data ({len(changed_settings)} settings differ: {", ".join(changed_settings)})'})
+
+    # ALLOW LISTS, DENY LISTS AND EXCLUSIONS
+    source_lists = source_policy.get('allow_deny_and_exclusion_lists', {})
+    destination_lists = destination_policy.get('allow_deny_and_exclusion_lists', {})
+    for list_type in list_types:
+        if list_type not in source_lists:
+            continue
+        source_items = source_lists[list_type].get('items', [])
+        destination_items = destination_lists.get(list_type, {}).get('items', [])
+        source_keys = {_get_list_item_key(item) for item in source_items}
+        destination_keys = {_get_list_item_key(item) for item in destination_items}
+
+        missing_items = []
+        for item in source_items:
+            if _get_list_item_key(item) not in destination_keys:
+                item = dict(item)
+                #workaround to issue where entries with {'comment': None} trigger HTTP 400 error when writing data
+                if null_comment_workaround_enabled and 'comment' in item and item['comment'] == None:
+                    item['comment'] = ''
+                missing_items.append(item)
+        if len(missing_items) > 0:
+            operations.append({'method': 'POST', 'endpoint': list_type, 'payload': {'items': missing_items},
+                               'description': f'POST {list_type} ({len(missing_items)} items)'})
+
+        if delete_extra_list_items:
+            extra_items = [item for item in destination_items if _get_list_item_key(item) not in source_keys]
+            if len(extra_items) > 0:
+                operations.append({'method': 'DELETE', 'endpoint': list_type, 'payload': {'items': extra_items},
+                                   'description': f'DELETE {list_type} ({len(extra_items)} items)'})
+
+    return operations
+
+
+# Sends the operations of a plan for one policy, in order. Returns a list of
+# (operation, status_code) tuples.
+def apply_policy_plan(policy_id, operations):
+    client = get_client()
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
+    results = []
+    for operation in operations:
+        request_url = f'{client.base_url}/api/v1/policies/{policy_id}/{operation["endpoint"]}'
+        response = client.request(operation['method'], request_url, headers=headers, json=operation['payload'])
+        if response.status_code == 404 and operation['endpoint'] != 'data':
+            logger.warning('Response 404 on %s to %s. This list type is not available for this policy on this server.', operation['method'], request_url)
+        elif response.status_code != 204:
+            logger.error('Unexpected response %s on %s to %s', response.status_code, operation['method'], request_url)
+        results.append((operation, response.status_code))
+    return results
+
+
+# Makes the policies on the current server match source_policies (which may
+# come from this server or another one), matching policies by name. Policies
+# missing from the destination are created from the destination's default
+# policy for their platform. Only the differences are written (see
+# diff_policy), and policies are processed concurrently on max_workers threads.
+# With dry_run enabled, the plan is logged and nothing is written.
+#
+# Both lists must be in the format returned by get_policies(include_policy_data=True,
+# keep_data_encapsulated=True, include_allow_deny_lists=True). Returns a list
+# with one entry per source policy:
+#   {'name', 'os', 'source_policy_id', 'destination_policy_id' (None if not
+#    created yet), 'operations': [...], 'results': [(operation, status_code), ...],
+#    'error': None or a description}
+def replicate_policies(source_policies, destination_policies, platforms_to_migrate=['WINDOWS', 'MAC'], list_types=policy_list_types, delete_extra_list_items=False, null_comment_workaround_enabled=True, dry_run=False, max_workers=8):
+    client = get_client()
+
+    #index destination policies by name, and default policies by platform
+    destination_policies_by_name = {policy['name']: policy for policy in destination_policies}
+    destination_default_policies = {policy['os']: policy for policy in destination_policies if policy['is_default_policy']}
+
+    # BUILD THE PLAN
+    plans = []
+    for source_policy in source_policies:
+        if source_policy['os'] not in platforms_to_migrate:
+            continue
+        destination_policy = destination_policies_by_name.get(source_policy['name'])
+        base_policy = destination_default_policies.get(source_policy['os'])
+        plan = {'name': source_policy['name'], 'os': source_policy['os'], 'source_policy_id': source_policy['id'],
+                'destination_policy_id': destination_policy['id'] if destination_policy != None else None,
+                'operations': [], 'results': [], 'error': None}
+        if destination_policy != None and destination_policy['os'] != source_policy['os']:
+            plan['error'] = f'a {destination_policy["os"]} policy with the same name exists on the destination'
+        elif destination_policy == None and base_policy == None:
+            plan['error'] = f'no default {source_policy["os"]} policy exists on the destination to create it from'
         else:
-            new_policy = create_policy(policy['name'], destination_default_policy_ids[policy['os']], quiet_mode=True, )
-
-        #next step is to overwrite the policy data on the newly-create policy with data from source policy
-        new_policy_id = new_policy['id']
-        request_url = f'https://{fqdn}/api/v1/policies/{new_policy_id}/data'
-        headers = {'accept': 'application/json', 'Authorization': key}
-        payload = {'data': policy['data']}
-        response = requests.put(request_url, json=payload, headers=headers)
-        if response.status_code != 204:
-            print('ERROR: Unexpected response', response.status_code, 'on PUT to', request_url)
-
-        #last step is to migrate the associated allow list, deny list, and exclusion lists for the policy
-        headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
-        for list_type in allow_deny_and_exclusion_list_types:
-            if list_type in policy['allow_deny_and_exclusion_lists']:
-                if len(policy['allow_deny_and_exclusion_lists'][list_type]['items']) > 0:
+            plan['operations'] = diff_policy(source_policy, destination_policy, base_policy=base_policy, list_types=list_types,
+                                             delete_extra_list_items=delete_extra_list_items, null_comment_workaround_enabled=null_comment_workaround_enabled)
+        plans.append(plan)
+
+    # LOG THE PLAN
+    write_count = 0
+    for plan in plans:
+        summary = f'{plan["os"]} policy {plan["source_policy_id"]} {plan["name"]}'
+        if plan['error'] != None:
+            logger.error('Skipping %s because %s', summary, plan['error'])
+            continue
+        steps = [operation['description'] for operation in plan['operations']]
+        if plan['destination_policy_id'] == None:
+            steps.insert(0, 'create policy')
+        write_count += len(steps)
+        if len(steps) > 0:
+            logger.info('%s -> %s', summary, '; '.join(steps))
+        else:
+            logger.info('%s already matches destination policy %s', summary, plan['destination_policy_id'])
+    logger.info('Plan has %s write requests for %s policies', write_count, len(plans))
+    if dry_run:
+        return plans
+
+    # APPLY THE PLAN, ONE POLICY PER WORKER
+    def apply_plan(plan):
+        with client.activate():
+            if plan['destination_policy_id'] == None:
+                new_policy = create_policy(plan['name'], destination_default_policies[plan['os']]['id'], quiet_mode=True)
+                if new_policy == None:
+                    plan['error'] = 'policy creation failed'
+                    return
+                plan['destination_policy_id'] = new_policy['id']
+            plan['results'] = apply_policy_plan(plan['destination_policy_id'], plan['operations'])
+
+    pending_plans = [plan for plan in plans if plan['error'] == None and (len(plan['operations']) > 0 or plan['destination_policy_id'] == None)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(apply_plan, pending_plans))
+
+    return plans
+
+
+# Copies policies from one MSP to another on the same server. Only the
+# differences are written (see replicate_policies above), so re-running a
+# migration is cheap. With dry_run enabled, the plan is logged and nothing is
+# written. Returns the per-policy plans and results from replicate_policies.
+def migrate_policies(source_msp_id, destination_msp_id, platforms_to_migrate=['WINDOWS', 'MAC'], allow_deny_and_exclusion_list_types = ['allow-list/hashes', 'allow-list/paths', 'allow-list/certificates', 'allow-list/process_paths', 'allow-list/scripts', 'deny-list/hashes', 'exclusion-list/folder_path', 'exclusion-list/process_path'] , null_comment_workaround_enabled=True, delete_extra_list_items=False, dry_run=False, max_workers=8):
 
-                    #workaround to issue where entries with {'comment': None} trigger HTTP 400 error when writing data
-                    if null_comment_workaround_enabled:
-                        for item in policy['allow_deny_and_exclusion_lists'][list_type]['items']:
-                            if 'comment' in item.keys():
-                                if item['comment'] == None:
-                                    item['comment'] = ''
+    #get policies from each of the MSPs
+    source_msp_policies = get_policies(include_policy_data=True, keep_data_encapsulated=True, include_allow_deny_lists=True, msp_id=source_msp_id, parallel=True)
+    destination_msp_policies = get_policies(include_policy_data=True, keep_data_encapsulated=True, include_allow_deny_lists=True, msp_id=destination_msp_id, parallel=True)
 
-                    payload = policy['allow_deny_and_exclusion_lists'][list_type]
-                    request_url = f'https://{fqdn}/api/v1/policies/{new_policy_id}/{list_type}'
-                    response = requests.post(request_url, headers=headers, json=payload)
-                    if response.status_code != 204:
-                        print('ERROR: Unexpected response', response.status_code, 'on POST to', request_url, 'with payload', payload)
+    #write only the differences
+    plans = replicate_policies(source_msp_policies, destination_msp_policies, platforms_to_migrate=platforms_to_migrate, list_types=allow_deny_and_exclusion_list_types,
+                               delete_extra_list_items=delete_extra_list_items, null_comment_workaround_enabled=null_comment_workaround_enabled, dry_run=dry_run, max_workers=max_workers)
 
-    print('INFO: Done migrating', len(policies_to_migrate), 'policies from MSP', source_msp_id , 'to MSP', destination_msp_id)
+    if not dry_run:
+        logger.info('Done migrating %s policies from MSP %s to MSP %s', len(plans), source_msp_id, destination_msp_id)
+    return plans
 
 def health_check(minimum_event_id=0):
+    client = get_client()
     export_devices()
-    print()
     export_policies()
-    print()
     export_groups()
-    print()
     export_events(minimum_event_id=minimum_event_id)
-    print()
     import warranty_compliance_check as wcs
-    wcs.do_warranty_compliance_check(fqdn=fqdn, key=key, exclude_empty_policies=True)
+    wcs.do_warranty_compliance_check(fqdn=client.fqdn, key=client.key, exclude_empty_policies=True)
 
 def add_process_exclusion(exclusion, comment, policy_id, exclusion_type='process_path'):
-    request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/exclusion-list/{exclusion_type}'
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
+    client = get_client()
+    request_url = f'{client.base_url}/api/v1/policies/{policy_id}/exclusion-list/{exclusion_type}'
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
     payload = {'items': [ {'item': exclusion, 'comment': comment} ]}
-    response = requests.post(request_url, headers=headers, json=payload)
+    response = client.post(request_url, headers=headers, json=payload)
     if response.status_code == 204:
-        print('Successfully added', exclusion_type, 'exclusion', exclusion, 'to policy', policy_id)
+        logger.info('Successfully added %s exclusion %s to policy %s', exclusion_type, exclusion, policy_id)
         return True
     else:
-        print('ERROR: Unexpected response', response.status_code, 'on POST to', request_url, 'with payload', payload)
+        logger.error('Unexpected response %s on POST to %s with payload %s', response.status_code, request_url, payload)
         return False
 
 def add_folder_exclusion(exclusion, comment, policy_id):
     return add_process_exclusion(exclusion=exclusion, comment=comment, policy_id=policy_id, exclusion_type='folder_path')
 
+# BATCHED EXCLUSION IMPORT
+#
+# Adds many exclusions to many policies with one POST per policy and exclusion
+# type, rather than one POST per exclusion per policy. Each exclusion is a
+# dictionary like this:
+#   {'item': 'C:\\Program Files\\Vendor\\', 'comment': 'Vendor software',
+#    'exclusion_type': 'folder_path' | 'process_path', 'policies': ['All'] or a list of policy names}
+# Exclusions which a policy already has (matched on item, see diff_policy) are
+# skipped, so re-running an import writes nothing. Policies are processed
+# concurrently on max_workers threads. Pass policy_ids to limit the import to
+# specific policies. With dry_run enabled, the plan is logged and nothing is
+# written. Returns a list with one entry per policy:
+#   {'policy_id', 'name', 'operations': [...], 'results': [(operation, status_code), ...]}
+
+exclusion_types = ['process_path', 'folder_path']
+
+
+def import_exclusions(exclusions, platforms=['WINDOWS'], msp_id='ALL', policy_ids=None, dry_run=False, max_workers=8):
+    client = get_client()
+    list_types = [f'exclusion-list/{exclusion_type}' for exclusion_type in exclusion_types]
+
+    for exclusion in exclusions:
+        if exclusion['exclusion_type'] not in exclusion_types:
+            raise ValueError(f'Unsupported exclusion type {exclusion["exclusion_type"]}. Choose from {", ".join(exclusion_types)}.')
+
+    #get the in-scope policies with their current exclusion lists
+    policies = get_policies(include_allow_deny_lists=True, msp_id=msp_id, parallel=True, max_workers=max_workers, list_types=list_types, platforms=platforms, policy_ids=policy_ids)
+
+    # BUILD THE PLAN
+    plans = []
+    for policy in policies:
+        #collect the exclusions which apply to this policy, one list per type
+        source_lists = {}
+        for exclusion in exclusions:
+            if exclusion['policies'] == ['All'] or policy['name'] in exclusion['policies']:
+                items = source_lists.setdefault(f'exclusion-list/{exclusion["exclusion_type"]}', {'items': []})['items']
+                items.append({'item': exclusion['item'], 'comment': exclusion.get('comment', '')})
+        #remove duplicates within the input, keeping the first occurrence
+        for source_list in source_lists.values():
+            unique_items = {}
+            for item in source_list['items']:
+                unique_items.setdefault(_get_list_item_key(item), item)
+            source_list['items'] = list(unique_items.values())
+        operations = diff_policy({'allow_deny_and_exclusion_lists': source_lists}, policy, list_types=list_types)
+        plans.append({'policy_id': policy['id'], 'name': policy['name'], 'operations': operations, 'results': []})
+
+    # LOG THE PLAN
+    for plan in plans:
+        if len(plan['operations']) > 0:
+            logger.info('Policy %s %s -> %s', plan['policy_id'], plan['name'], '; '.join(operation['description'] for operation in plan['operations']))
+    pending_plans = [plan for plan in plans if len(plan['operations']) > 0]
+    logger.info('Plan has %s write requests for %s of %s policies', sum(len(plan['operations']) for plan in pending_plans), len(pending_plans), len(plans))
+    if dry_run:
+        return plans
+
+    # APPLY THE PLAN, ONE POLICY PER WORKER
+    def apply_plan(plan):
+        with client.activate():
+            plan['results'] = apply_policy_plan(plan['policy_id'], plan['operations'])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(apply_plan, pending_plans))
+
+    return plans
+
 def add_allow_list_hashes(hash_list, policy_id, comment='', delete=False):
-    request_url = f'https://{fqdn}/api/v1/policies/{policy_id}/allow-list/hashes'
-    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': key}
+    client = get_client()
+    request_url = f'{client.base_url}/api/v1/policies/{policy_id}/allow-list/hashes'
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
 
     item_list = []
     for hash in hash_list:
@@ -1310,26 +3100,27 @@ def add_allow_list_hashes(hash_list, policy_id, comment='', delete=False):
     payload = {'items': item_list}
 
     if not delete:
-        response = requests.post(request_url, headers=headers, json=payload)
+        response = client.post(request_url, headers=headers, json=payload)
     else:
-        response = requests.delete(request_url, headers=headers, json=payload)
+        response = client.delete(request_url, headers=headers, json=payload)
 
     if response.status_code == 204:
         if not delete:
-            print('Successfully added', len(hash_list), 'hashes to allow list for policy', policy_id)
+            logger.info('Successfully added %s hashes to allow list for policy %s', len(hash_list), policy_id)
         else:
-            print('Successfully removed', len(hash_list), 'hashes from allow list for policy', policy_id)
+            logger.info('Successfully removed %s hashes from allow list for policy %s', len(hash_list), policy_id)
         return True
     else:
-        print('ERROR: Unexpected response', response.status_code, 'on POST to', request_url, 'with payload', payload)
+        logger.error('Unexpected response %s on POST to %s with payload %s', response.status_code, request_url, payload)
         return False
 
 def remove_allow_list_hashes(hash_list, policy_id):
     return add_allow_list_hashes(hash_list, policy_id, delete=True)
 
 def is_server_multitenancy_enabled():
-    request_url = f'https://{fqdn}/api/v1/multitenancy/msp'
-    response = requests.get(request_url)
+    client = get_client()
+    request_url = f'{client.base_url}/api/v1/multitenancy/msp'
+    response = client.get(request_url)
     if response.status_code == 404:
         return False
     else:
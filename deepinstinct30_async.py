@@ -0,0 +1,646 @@
+# Deep Instinct v3.0 REST API Wrapper - asyncio version
+#
+# Compatibility:
+# -Same D-Appliance versions as deepinstinct30.py, which it imports
+# -Requires aiohttp ('pip install aiohttp')
+#
+# An asyncio counterpart to deepinstinct30.py with the same function names,
+# arguments and return values, for use in asyncio services. Every function is
+# a coroutine (await it), and paginated endpoints are also available as async
+# generators (iter_devices, iter_events).
+#
+# Requests are sent by an AsyncDeepInstinctClient, which owns a pooled
+# aiohttp session, limits how many of its requests are in flight at once
+# (max_concurrency), and applies the same rate limiting, retries with backoff
+# and instrumentation as deepinstinct30 (so di.stats(), di.prometheus_text()
+# and di.start_trace() include async requests too).
+#
+# Example usage, driving several servers from one event loop:
+#
+#   import asyncio, deepinstinct30_async as adi
+#
+#   async def count_devices(client):
+#       async with client:
+#           with client.activate():
+#               return len(await adi.get_devices())
+#
+#   async def main():
+#       clients = [adi.AsyncDeepInstinctClient(fqdn, key) for fqdn, key in servers]
+#       print(await asyncio.gather(*(count_devices(client) for client in clients)))
+#
+#   asyncio.run(main())
+#
+# As with deepinstinct30, setting adi.fqdn = 'SERVER-NAME' and
+# adi.key = 'API-KEY' is enough for simple scripts; a shared default client is
+# then built from them. Call 'await adi.close()' before the event loop ends to
+# close its session. A client can only be used on one event loop at a time;
+# close it before reusing it from another (e.g. a second asyncio.run()).
+#
+# Disclaimer: This code is provided as an example of how to build code against
+# and interact with the Deep Instinct REST API. It is provided AS-IS/NO
+# WARRANTY. It has limited error checking and logging, and likely contains
+# defects or other deficiencies. Test thoroughly first, and use at your own
+# risk. This API Wrapper is not a Deep Instinct commercial product and is not
+# officially supported, although the underlying REST API is.
+#
+
+# Import various libraries used by one or more method below.
+import asyncio, contextlib, contextvars, json, time
+import aiohttp
+import deepinstinct30 as di
+
+# Default number of requests a client keeps in flight at once
+max_concurrency = 50
+
+# Progress and warning messages share deepinstinct30's logger
+logger = di.logger
+
+
+# Async version of deepinstinct30.RateLimiter: acquire() awaits instead of
+# blocking the event loop. One per server, shared by every async client.
+class AsyncRateLimiter(di.RateLimiter):
+
+    async def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait_time)
+
+
+# Same rules as deepinstinct30: an explicit requests_per_second sets the rate
+# for every async client of that server
+_rate_limiters = {}
+
+def _get_rate_limiter(fqdn, rate=None):
+    if fqdn not in _rate_limiters:
+        _rate_limiters[fqdn] = AsyncRateLimiter(rate or di.max_requests_per_second)
+    elif rate != None:
+        _rate_limiters[fqdn].set_max_rate(rate)
+    return _rate_limiters[fqdn]
+
+
+# The parts of a response the wrapper uses, read in full before the
+# connection is returned to the pool. Mirrors requests.Response.
+class Response:
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    def json(self):
+        return json.loads(self.content)
+
+    #raises the same exception type as the synchronous wrapper
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise di.requests.exceptions.HTTPError(f'{self.status_code} Error for url: {self.url}', response=self)
+
+
+# Async counterpart to deepinstinct30.DeepInstinctClient. Holds the server
+# name and API key plus a pooled aiohttp session, which is created on first
+# use inside the running event loop. At most max_concurrency requests from
+# this client are in flight at once; further requests wait their turn.
+class AsyncDeepInstinctClient:
+
+    def __init__(self, fqdn, key, max_concurrency=None, pool_size=100, protocol='https', requests_per_second=None, retries=None):
+        self.fqdn = fqdn
+        self.key = key
+        self.protocol = protocol
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency or globals()['max_concurrency']
+        self.rate_limiter = _get_rate_limiter(fqdn, requests_per_second)
+        self.max_retries = di.max_retries if retries == None else retries
+        self.retry_budget = di.RetryBudget(di.retry_budget_ratio)
+        self.session = None
+        self.semaphore = None
+        self.loop = None
+
+    # Root URL of the server, used by all methods to calculate request URLs
+    @property
+    def base_url(self):
+        return f'{self.protocol}://{self.fqdn}'
+
+    # Returns the session for the running event loop, creating it if needed.
+    # A session can only be used (and closed) on the loop it was created on, so
+    # a client whose session is still open can't be reused on another loop.
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self.session != None and not self.session.closed and self.loop is not loop:
+            raise RuntimeError(f'AsyncDeepInstinctClient for {self.fqdn} is still open on another event loop. '
+                               'Close it at the end of that loop (async with client, or await client.close()) before reusing it.')
+        if self.session == None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.loop = loop
+        return self.session
+
+    # Send a request (same arguments as deepinstinct30's client: headers,
+    # json, data, timeout in seconds), with concurrency limiting, rate
+    # limiting and retries. Returns the final Response, or raises the final
+    # exception if every attempt failed to get a response at all. Requests
+    # which are not idempotent (by default anything but GET and HEAD) are
+    # retried only when the server cannot have processed them, as in
+    # deepinstinct30.
+    async def request(self, method, request_url, idempotent=None, **kwargs):
+        session = self._get_session()
+        if idempotent == None:
+            idempotent = method.upper() in di.idempotent_methods
+        kwargs['timeout'] = aiohttp.ClientTimeout(total=kwargs.get('timeout', di.request_timeout))
+        request_bytes = len(json.dumps(kwargs['json']).encode()) if 'json' in kwargs else len(kwargs.get('data') or b'')
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            self.retry_budget.deposit()
+            start_time = time.time()
+            try:
+                async with self.semaphore:
+                    async with session.request(method, request_url, **kwargs) as raw_response:
+                        response = Response(raw_response.status, raw_response.headers, await raw_response.read(), request_url)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                di._record_request(self, method, request_url, attempt, start_time, time.time() - start_time, error=e, request_bytes=request_bytes)
+                #only a failed connect guarantees the request was never sent
+                if not idempotent and not isinstance(e, aiohttp.ClientConnectorError):
+                    raise
+                if attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    raise
+                delay = di._get_retry_delay(attempt)
+                logger.warning('%s on %s %s . Retrying in %.1f seconds.', type(e).__name__, method, request_url, delay)
+            else:
+                di._record_request(self, method, request_url, attempt, start_time, time.time() - start_time, response=response, request_bytes=request_bytes)
+                if response.status_code not in (di.retryable_status_codes if idempotent else di.unprocessed_status_codes):
+                    self.rate_limiter.reward()
+                    return response
+                if response.status_code == 429:
+                    self.rate_limiter.penalize()
+                if attempt >= self.max_retries or not self.retry_budget.withdraw():
+                    return response
+                delay = di._get_retry_delay(attempt, response)
+                logger.warning('Return code %s on %s %s . Retrying in %.1f seconds.', response.status_code, method, request_url, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, request_url, **kwargs):
+        return await self.request('GET', request_url, **kwargs)
+
+    async def post(self, request_url, **kwargs):
+        return await self.request('POST', request_url, **kwargs)
+
+    async def put(self, request_url, **kwargs):
+        return await self.request('PUT', request_url, **kwargs)
+
+    async def delete(self, request_url, **kwargs):
+        return await self.request('DELETE', request_url, **kwargs)
+
+    # Make this client the one used by the module-level methods (in the
+    # current task, and tasks created from it) for the duration of a with block
+    @contextlib.contextmanager
+    def activate(self):
+        token = _active_client.set(self)
+        try:
+            yield self
+        finally:
+            _active_client.reset(token)
+
+    # Request statistics for this client's server (see deepinstinct30.stats)
+    def stats(self):
+        return di.stats(self.fqdn)
+
+    # Close the pooled connections
+    async def close(self):
+        if self.session != None and not self.session.closed:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+# Client bound via AsyncDeepInstinctClient.activate() (if any)
+_active_client = contextvars.ContextVar('deepinstinct30_async_active_client', default=None)
+
+# Shared client built from the module-level fqdn and key
+_default_client = None
+_closing_tasks = set()
+
+
+# Returns the client that the module-level methods should use
+def get_client():
+    global _default_client
+
+    #an explicitly activated client takes precedence
+    client = _active_client.get()
+    if client != None:
+        return client
+
+    #otherwise use the shared client for fqdn/key, replacing it if they changed
+    if _default_client == None or _default_client.fqdn != fqdn or _default_client.key != key:
+        #close the replaced client's session rather than leaking it
+        if _default_client != None and _default_client.session != None and not _default_client.session.closed \
+                and _default_client.loop is asyncio.get_running_loop():
+            task = asyncio.get_running_loop().create_task(_default_client.close())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+        _default_client = AsyncDeepInstinctClient(fqdn, key)
+    return _default_client
+
+
+# Closes the shared client built from fqdn and key (if any). Scripts which use
+# adi.fqdn/adi.key rather than their own client should await this before their
+# event loop ends, for example at the end of the coroutine passed to
+# asyncio.run().
+async def close():
+    if _default_client != None:
+        await _default_client.close()
+
+
+# DEVICES
+
+# Gets a single page (up to 50) of devices with id greater than after_device_id.
+# Returns a tuple of (devices, last_id), with last_id None after the final page.
+async def _get_device_page(client, after_device_id, raise_for_status=False):
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/devices?after_device_id={after_device_id}'
+
+    response = await client.get(request_url, headers=headers)
+    if response.status_code == 200:
+        response = response.json()
+        #some server versions fail to return last_id on final batch of devices
+        return response.get('devices', []), response.get('last_id')
+
+    #transient errors were already retried by the client, so give up
+    logger.error('Unexpected return code %s on request to %s', response.status_code, request_url)
+    if raise_for_status:
+        response.raise_for_status()
+    return [], None
+
+
+# Async generator which yields all visible Devices one at a time, fetching
+# the next page only when the previous one has been consumed
+async def iter_devices(include_deactivated=True):
+    client = get_client()
+    last_id = 0
+    while last_id != None:
+        devices, last_id = await _get_device_page(client, last_id)
+        logger.debug('%s/api/v1/devices returned %s devices with last_id %s', client.base_url, len(devices), last_id, extra={'last_id': last_id})
+        for device in devices:
+            if device['license_status'] == 'ACTIVATED' or include_deactivated:
+                yield device
+
+
+# Learns the range of device ids visible to the API key, see
+# deepinstinct30._get_device_id_range
+async def _get_device_id_range(client):
+    devices, last_id = await _get_device_page(client, 0, raise_for_status=True)
+    if len(devices) == 0:
+        return 0, 0
+    lowest_id = devices[0]['id']
+    known_id = devices[-1]['id']
+    if last_id == None:
+        return lowest_id, known_id
+
+    #exponential probe for an id with no devices after it
+    upper_bound = known_id * 2
+    while True:
+        devices, last_id = await _get_device_page(client, upper_bound, raise_for_status=True)
+        if len(devices) == 0:
+            break
+        known_id = devices[-1]['id']
+        upper_bound = known_id * 2
+
+    #binary search between the highest known id and the empty upper bound
+    while upper_bound - known_id > 50:
+        midpoint = (known_id + upper_bound) // 2
+        devices, last_id = await _get_device_page(client, midpoint, raise_for_status=True)
+        if len(devices) == 0:
+            upper_bound = midpoint
+        else:
+            known_id = devices[-1]['id']
+            if last_id == None:
+                upper_bound = known_id
+
+    return lowest_id, upper_bound
+
+
+# Collects all devices with lowest_id < id <= highest_id
+async def _get_devices_in_window(client, lowest_id, highest_id):
+    collected_devices = []
+    last_id = lowest_id
+    while last_id != None and last_id < highest_id:
+        try:
+            devices, last_id = await _get_device_page(client, last_id, raise_for_status=True)
+        except di.requests.exceptions.HTTPError:
+            logger.error('Failed to collect devices with id %s to %s', lowest_id + 1, highest_id)
+            raise
+        if len(devices) == 0:
+            break
+        for device in devices:
+            if device['id'] <= highest_id:
+                collected_devices.append(device)
+    return collected_devices
+
+
+# Returns a list of all visible Devices
+# --> With parallel=True, the device id range is split into windows which are
+#     collected concurrently (windows count = max_workers * 4). Output is
+#     identical to serial mode, and HTTPError is raised if any page can't be
+#     collected (after the client's retries).
+async def get_devices(include_deactivated=True, parallel=False, max_workers=8):
+    if not parallel:
+        return [device async for device in iter_devices(include_deactivated=include_deactivated)]
+
+    client = get_client()
+
+    # LEARN THE ID RANGE AND SPLIT IT INTO WINDOWS
+    lowest_id, upper_bound = await _get_device_id_range(client)
+    window_size = max(50, -(-(upper_bound - lowest_id + 1) // (max_workers * 4)))
+    windows = []
+    window_start = lowest_id - 1
+    while window_start < upper_bound:
+        windows.append((window_start, min(window_start + window_size, upper_bound)))
+        window_start += window_size
+
+    # COLLECT DATA
+    results = await asyncio.gather(*(_get_devices_in_window(client, window[0], window[1]) for window in windows))
+
+    # MERGE RESULTS IN WINDOW ORDER, DROPPING DUPLICATES
+    collected_devices = []
+    collected_device_ids = set()
+    for devices in results:
+        for device in devices:
+            if device['id'] not in collected_device_ids:
+                if device['license_status'] == 'ACTIVATED' or include_deactivated:
+                    collected_devices.append(device)
+                collected_device_ids.add(device['id'])
+    return collected_devices
+
+
+# Gets a single device, or None if it was not found
+async def get_device(device_id):
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/devices/{device_id}'
+    response = await client.get(request_url, headers=headers)
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+
+# Archives (hides from GUI and API) a list of devices
+async def archive_devices(device_ids, unarchive=False):
+    client = get_client()
+    headers = {'Content-Type': 'application/json', 'Authorization': client.key}
+    if unarchive:
+        request_url = f'{client.base_url}/api/v1/devices/actions/unarchive'
+    else:
+        request_url = f'{client.base_url}/api/v1/devices/actions/archive'
+    response = await client.post(request_url, json={'ids': device_ids}, headers=headers)
+    return response.status_code == 200
+
+
+async def unarchive_devices(device_ids):
+    return await archive_devices(device_ids, unarchive=True)
+
+
+# GROUPS
+
+# Return a list of all visible Device Groups
+async def get_groups(exclude_default_groups=False):
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/groups/'
+    response = await client.get(request_url, headers=headers)
+    if response.status_code == 200:
+        groups = response.json()
+        if exclude_default_groups:
+            groups = [group for group in groups if not group['is_default_group']]
+        return groups
+    #in case of error getting data, return empty list
+    return []
+
+
+# Adds a list of Devices to a Device Group
+async def add_devices_to_group(device_ids, group_id, remove=False):
+    client = get_client()
+    headers = {'Content-Type': 'application/json', 'Authorization': client.key}
+    if remove:
+        request_url = f'{client.base_url}/api/v1/groups/{group_id}/remove-devices'
+    else:
+        request_url = f'{client.base_url}/api/v1/groups/{group_id}/add-devices'
+    response = await client.post(request_url, json={'devices': device_ids}, headers=headers)
+    if response.status_code == 204: #expected return code
+        if remove:
+            return str(len(device_ids)) + ' devices removed from group ' + str(group_id)
+        else:
+            return str(len(device_ids)) + ' devices added to group ' + str(group_id)
+    return None #something went wrong
+
+
+# Removes a list of Devices from a Device Group
+async def remove_devices_from_group(device_ids, group_id):
+    return await add_devices_to_group(device_ids=device_ids, group_id=group_id, remove=True)
+
+
+# POLICIES
+
+allow_deny_and_exclusion_list_types = ['allow-list/hashes', 'allow-list/paths', 'allow-list/certificates', 'allow-list/process_paths',
+                                       'allow-list/scripts', 'deny-list/hashes', 'exclusion-list/folder_path', 'exclusion-list/process_path']
+
+# Collect and return list of Device Policies. The per-policy sub-requests
+# (policy data and the allow-list, deny-list and exclusion-list requests) are
+# always sent concurrently, bounded by the client's max_concurrency.
+async def get_policies(include_policy_data=False, include_allow_deny_lists=False, keep_data_encapsulated=False, msp_id='ALL'):
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    request_url = f'{client.base_url}/api/v1/policies/'
+    response = await client.get(request_url, headers=headers)
+    policies = response.json()
+
+    # Apply filter based on msp, if enabled
+    if msp_id != 'ALL':
+        policies = [policy for policy in policies if policy['msp_id'] == msp_id]
+
+    # BUILD LIST OF PER-POLICY SUB-REQUESTS AS (policy, endpoint) PAIRS
+    sub_requests = []
+    if include_policy_data:
+        for policy in policies:
+            sub_requests.append((policy, 'data'))
+    if include_allow_deny_lists:
+        for policy in policies:
+            for list_type in allow_deny_and_exclusion_list_types:
+                sub_requests.append((policy, list_type))
+
+    async def get_policy_endpoint(policy, endpoint):
+        response = await client.get(f'{client.base_url}/api/v1/policies/{policy["id"]}/{endpoint}', headers=headers)
+        return response.json() if response.status_code == 200 else None
+
+    results = await asyncio.gather(*(get_policy_endpoint(policy, endpoint) for policy, endpoint in sub_requests))
+
+    # APPEND POLICY DATA, ALLOW-LIST, DENY-LIST, AND EXCLUSION DATA
+    for (policy, endpoint), data in zip(sub_requests, results):
+        if endpoint != 'data':
+            policy.setdefault('allow_deny_and_exclusion_lists', {})
+        if data != None:
+            if endpoint == 'data':
+                if keep_data_encapsulated:
+                    policy.update(data)
+                else:
+                    policy.update(data['data'])
+            else:
+                policy['allow_deny_and_exclusion_lists'][endpoint] = data
+    return policies
+
+
+# Adds (or with delete=True removes) a list of hashes on a policy's allow list
+async def add_allow_list_hashes(hash_list, policy_id, comment='', delete=False):
+    client = get_client()
+    request_url = f'{client.base_url}/api/v1/policies/{policy_id}/allow-list/hashes'
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
+    payload = {'items': [{'item': hash, 'comment': comment} for hash in hash_list]}
+    if not delete:
+        response = await client.post(request_url, headers=headers, json=payload)
+    else:
+        response = await client.delete(request_url, headers=headers, json=payload)
+    if response.status_code != 204:
+        logger.error('Unexpected response %s on %s to %s', response.status_code, 'DELETE' if delete else 'POST', request_url)
+    return response.status_code == 204
+
+
+# MULTI-TENANCY
+
+# Returns list of visible MSPs
+async def get_msps():
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    response = await client.get(f'{client.base_url}/api/v1/multitenancy/msp/', headers=headers)
+    if response.status_code == 200:
+        return response.json()['msps']
+    return []
+
+
+# Returns list of visible Tenants
+async def get_tenants():
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    response = await client.get(f'{client.base_url}/api/v1/multitenancy/tenant/', headers=headers)
+    if response.status_code == 200:
+        return response.json()['tenants']
+    return []
+
+
+# EVENTS
+
+# Async generator which yields events matching specified search parameters
+# and/or minimum event id, one at a time (or a page at a time with
+# pages=True), fetching the next page only when the previous one has been
+# consumed. Same arguments as deepinstinct30.iter_events.
+async def iter_events(search={}, minimum_event_id=0, suspicious=False, pages=False):
+    client = get_client()
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
+
+    #loop until we get last_id=None back, which means we have all the events
+    while minimum_event_id != None:
+        if suspicious:
+            request_url = f'{client.base_url}/api/v1/suspicious-events/search?after_event_id={str(minimum_event_id)}'
+        else:
+            request_url = f'{client.base_url}/api/v1/events/search?after_event_id={str(minimum_event_id)}'
+
+        response = await client.post(request_url, headers=headers, json=search, timeout=30, idempotent=True)
+        if response.status_code != 200:
+            logger.error('Unexpected return code %s on request to %s', response.status_code, request_url)
+            response.raise_for_status()
+            return
+
+        response = response.json()
+        minimum_event_id = response['last_id']
+        logger.debug('%s returned 200 with last_id %s', request_url, minimum_event_id, extra={'last_id': minimum_event_id})
+
+        if minimum_event_id != None:
+            if pages:
+                yield response['events']
+            else:
+                for event in response['events']:
+                    yield event
+
+
+# Return a list of events matching specified search parameters and/or minimum
+# event id. If neither are provided, all visible events are returned.
+async def get_events(search={}, minimum_event_id=0, suspicious=False):
+    return [event async for event in iter_events(search=search, minimum_event_id=minimum_event_id, suspicious=suspicious)]
+
+
+async def get_suspicious_events(search={}, minimum_event_id=0):
+    return await get_events(suspicious=True, search=search, minimum_event_id=minimum_event_id)
+
+
+# Gets a single event, or None if it was not found
+async def get_event(event_id, suspicious=False):
+    client = get_client()
+    headers = {'accept': 'application/json', 'Authorization': client.key}
+    if suspicious:
+        request_url = f'{client.base_url}/api/v1/suspicious-events/{str(event_id)}'
+    else:
+        request_url = f'{client.base_url}/api/v1/events/{str(event_id)}'
+    response = await client.get(request_url, headers=headers)
+    if response.status_code == 200:
+        return response.json()['event']
+    return None
+
+
+# Closes (or with open=True re-opens) a list of events
+async def close_events(event_id_list, open=False, suspicious=False):
+    client = get_client()
+    action = 'open' if open else 'close'
+    if suspicious:
+        request_url = f'{client.base_url}/api/v1/suspicious-events/actions/{action}'
+    else:
+        request_url = f'{client.base_url}/api/v1/events/actions/{action}'
+    headers = {'Authorization': client.key, 'accept': 'application/json', 'Content-Type': 'application/json'}
+    response = await client.post(request_url, json={'ids': event_id_list}, headers=headers)
+    if response.status_code == 204:
+        logger.info('%s events were %s', len(event_id_list), 'opened' if open else 'closed')
+        return True
+    logger.error('Unexpected return code %s on POST to %s', response.status_code, request_url)
+    return False
+
+
+async def close_suspicious_events(event_id_list):
+    return await close_events(event_id_list=event_id_list, suspicious=True)
+
+
+async def open_events(event_id_list, suspicious=False):
+    return await close_events(event_id_list=event_id_list, open=True, suspicious=suspicious)
+
+
+# Archives (or with unarchive=True un-archives) a list of events, given as ids
+# or (with input_is_ids_only=False) as full events
+async def archive_events(event_id_list, unarchive=False, suspicious=False, input_is_ids_only=True):
+    client = get_client()
+    if not input_is_ids_only:
+        event_id_list = [event['id'] for event in event_id_list]
+    headers = {'accept': 'application/json', 'Content-Type': 'application/json', 'Authorization': client.key}
+    action = 'unarchive' if unarchive else 'archive'
+    if suspicious:
+        request_url = f'{client.base_url}/api/v1/suspicious-events/actions/{action}'
+    else:
+        request_url = f'{client.base_url}/api/v1/events/actions/{action}'
+    response = await client.post(request_url, headers=headers, json={'ids': event_id_list})
+    return response.status_code == 204
+
+
+async def unarchive_events(event_id_list, suspicious=False, input_is_ids_only=True):
+    return await archive_events(event_id_list, unarchive=True, suspicious=suspicious, input_is_ids_only=input_is_ids_only)
+
+
+async def archive_suspicious_events(event_id_list, unarchive=False, input_is_ids_only=True):
+    return await archive_events(event_id_list, unarchive=unarchive, suspicious=True, input_is_ids_only=input_is_ids_only)
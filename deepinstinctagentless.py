@@ -1,102 +1,413 @@
-# Disclaimer:
-# This code is provided as an example of how to build code against and interact
-# with the Deep Instinct Agentless Connector over REST API. It is provided
-# AS-IS/NO WARRANTY. It has limited error checking and logging, and likely
-# contains defects or other deficiencies. Test thoroughly first, and use at your
-# own risk. This sample is not a Deep Instinct commercial product and is not
-# officially supported, although the API that it calls is.
-#
-
-#Import required libraries
-import requests, base64, json, urllib3
-
-#Disable SSL warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-#Primary method which accepts file name and optional config data, submits scan, simplifies it, and returns result
-def scan_file(file_name, scanner_ip, simplified=False, encoded=False, scanner_port=5000, protocol='https'):
-
-    # read file from disk (rb means opens the file in binary format for reading)
-    with open(file_name, 'rb') as f:
-        #read file
-        data = f.read()
-        #close file
-        f.close()
-
-    if encoded:
-        #encode data and set URL to match
-        data = base64.b64encode(data)
-        request_url = f'{protocol}://{scanner_ip}:{scanner_port}/scan/base64'
-    else:
-        #leave data as-is and set URL to match
-        request_url = f'{protocol}://{scanner_ip}:{scanner_port}/scan/binary'
-
-    # send scan request, capture response
-    response = requests.post(request_url, data=data, timeout=20, verify=False)
-
-    # validate response code and proceed if expected value 200
-    if response.status_code == 200:
-        #convert to Python dictionary
-        verdict = response.json()
-        if simplified:
-            #Call function to simplify the verdict
-            verdict = simplify_verdict(verdict)
-        #Return [simplified] verdict
-        return verdict
-    else:
-        print('ERROR: Unexpected return code', response.status_code, 'on POST to', request_url)
-        return None
-
-
-#Wrapper which invokes scan_file with the parameter to use encoding
-def scan_file_encoded(file_name, scanner_ip, simplified=False):
-    return scan_file(file_name=file_name, scanner_ip=scanner_ip, simplified=simplified, encoded=True)
-
-
-# A method used to convert the raw verdict received from DI Agentless into a simplified/more user-friendly format
-# --> Recommend to use this with an Agentless Policy where "prevention" is enabled at Threat Severity "Low" and above
-# --> This method introduces the concept of a "Suspicious" verdict, which is for files that score Low or Moderate
-def simplify_verdict(verdict):
-
-    if 'verdict' not in verdict.keys():
-        print('ERROR: The verdict passed to simplify_verdict is missing or corrupt:\n', verdict)
-        return None
-
-    else:
-        #remove the redundent text 'filetype' from the file type value, if present
-        if 'file_type' in verdict.keys():
-            verdict['file_type'] = verdict['file_type'].replace('FileType','')
-
-        if verdict['verdict'] == 'Malicious':
-
-            if verdict['severity'] in ['VERY_HIGH', 'HIGH']:
-
-                return {'verdict': 'Malicious',
-                        'file_type': verdict['file_type'],
-                        'threat_severity': verdict['severity'],
-                        'file_hash': verdict['file_hash'],
-                        'scan_guid': verdict['scan_guid']}
-
-            else:
-
-                return {'verdict': 'Suspicious',
-                        'file_type': verdict['file_type'],
-                        'threat_severity': verdict['severity'],
-                        'file_hash': verdict['file_hash'],
-                        'scan_guid': verdict['scan_guid']}
-
-        elif verdict['verdict'] == 'Benign':
-
-            return {'verdict': 'Benign',
-                    'file_type': verdict['file_type'],
-                    'file_hash': verdict['file_hash'],
-                    'scan_guid': verdict['scan_guid']}
-
-        elif verdict['verdict'] == 'Not Classified':
-            return {'verdict': 'Unsupported',
-                    'file_type': 'Other',
-                    'scan_guid': verdict['scan_guid']}
-
-        else:
-            print('WARNING: Error in processing verfict passed to simplify_verdict:\n', verdict)
-            return None
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct Agentless Connector over REST API. It is provided
+# AS-IS/NO WARRANTY. It has limited error checking and logging, and likely
+# contains defects or other deficiencies. Test thoroughly first, and use at your
+# own risk. This sample is not a Deep Instinct commercial product and is not
+# officially supported, although the API that it calls is.
+#
+
+#Import required libraries
+import requests, base64, json, urllib3, threading, itertools, concurrent.futures, hashlib, sqlite3, time, collections, os, logging, sys
+
+#Disable SSL warnings
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+#Errors and warnings are logged to the 'deepinstinctagentless' logger. As in
+#deepinstinct30, they are printed to stdout unless the application configures
+#logging (adds a handler to the root logger).
+logger = logging.getLogger('deepinstinctagentless')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout)
+    _log_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    _log_handler.addFilter(lambda record: len(logging.getLogger().handlers) == 0)
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+
+#Size of the connection pool kept open to each scanner
+pool_maxsize = 32
+
+#Size of each read when streaming an upload (a multiple of 3 so base64 chunks
+#can be encoded independently)
+upload_chunk_size = 3 * 256 * 1024
+
+#Pooled keep-alive sessions, one per scanner, so repeated scans reuse connections
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+#Returns the pooled session for a scanner, creating it on first use
+def get_session(scanner_ip, scanner_port=5000, protocol='https'):
+    session_key = (protocol, scanner_ip, scanner_port)
+    with _sessions_lock:
+        if session_key not in _sessions:
+            session = requests.Session()
+            session.verify = False
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount(f'{protocol}://', adapter)
+            _sessions[session_key] = session
+        return _sessions[session_key]
+
+#Optional VerdictCache used by scan_file when no cache is passed explicitly.
+#Example: di.verdict_cache = di.VerdictCache('verdict_cache.sqlite')
+verdict_cache = None
+
+
+#Cache of verdicts keyed by the SHA-256 of the file contents. Recently used
+#verdicts are kept in memory (LRU, up to max_entries), and all verdicts are
+#optionally persisted on disk in SQLite so they survive restarts. Entries
+#older than ttl_seconds are treated as misses. Both the raw verdict and the
+#simplify_verdict output are stored.
+class VerdictCache:
+
+    def __init__(self, file_name=None, max_entries=10000, ttl_seconds=86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'bytes_saved': 0}
+        self.connection = None
+        if file_name != None:
+            self.connection = sqlite3.connect(file_name, check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS verdicts (file_hash TEXT PRIMARY KEY, verdict TEXT, simplified_verdict TEXT, created REAL)')
+            self.connection.commit()
+
+    #Returns the cached verdict (or simplified verdict) for a hash, or None
+    def get(self, file_hash, simplified=False, file_size=0):
+        with self.lock:
+            self.stats['lookups'] += 1
+            entry = self.entries.get(file_hash)
+            if entry != None:
+                self.entries.move_to_end(file_hash)
+            elif self.connection != None:
+                row = self.connection.execute('SELECT verdict, simplified_verdict, created FROM verdicts WHERE file_hash = ?', (file_hash,)).fetchone()
+                if row != None:
+                    entry = row
+                    self._remember(file_hash, entry)
+            if entry == None or time.time() - entry[2] > self.ttl_seconds:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += file_size
+        #hand out a fresh copy so callers can modify it freely
+        if simplified:
+            return json.loads(entry[1])
+        return json.loads(entry[0])
+
+    #Stores a raw verdict (and its simplified form) for a hash
+    def put(self, file_hash, verdict):
+        simplified_verdict = simplify_verdict(json.loads(json.dumps(verdict)))
+        entry = (json.dumps(verdict), json.dumps(simplified_verdict), time.time())
+        with self.lock:
+            self._remember(file_hash, entry)
+            if self.connection != None:
+                self.connection.execute('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)', (file_hash,) + entry)
+                self.connection.commit()
+
+    #Adds an entry to the in-memory LRU, evicting the least recently used
+    def _remember(self, file_hash, entry):
+        self.entries[file_hash] = entry
+        self.entries.move_to_end(file_hash)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    #Returns a copy of the stats plus the hit ratio
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['hit_ratio'] = stats['hits'] / stats['lookups'] if stats['lookups'] > 0 else 0
+        return stats
+
+    def close(self):
+        if self.connection != None:
+            self.connection.close()
+
+
+#Read-only, seekable view over an in-memory buffer (bytes, bytearray,
+#memoryview, mmap) which hands out chunks without copying the whole buffer
+class _BufferReader:
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.view) if size == None or size < 0 else min(self.position + size, len(self.view))
+        chunk = bytes(self.view[self.position:end])
+        self.position = end
+        return chunk
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        self.position = [0, self.position, len(self.view)][whence] + offset
+        return self.position
+
+
+#File-like request body which streams from another file-like object, optionally
+#base64 encoding on the fly and/or feeding the raw bytes to a hash, so that
+#memory use stays constant regardless of the payload size. When the length is
+#known it is exposed as .len so requests sends a Content-Length header,
+#otherwise the body is sent with chunked transfer encoding.
+class _UploadStream:
+
+    def __init__(self, stream, length=None, encoded=False, file_hash=None):
+        self.stream = stream
+        self.encoded = encoded
+        self.file_hash = file_hash
+        self.pending = b''
+        if length != None:
+            self.len = (length + 2) // 3 * 4 if encoded else length
+
+    #reads up to size raw bytes from the underlying stream
+    def _read_raw(self, size):
+        chunk = self.stream.read(size)
+        if self.file_hash != None and chunk:
+            self.file_hash.update(chunk)
+        return chunk
+
+    def read(self, size=-1):
+        if size == None or size < 0:
+            size = upload_chunk_size
+        if not self.encoded:
+            return self._read_raw(size)
+        #collect whole 3-byte groups so each chunk encodes without padding,
+        #except for the final one
+        wanted = max(3, size // 4 * 3)
+        raw = self.pending
+        while len(raw) < wanted:
+            chunk = self._read_raw(wanted - len(raw))
+            if not chunk:
+                self.pending = b''
+                return base64.b64encode(raw)
+            raw += chunk
+        usable = len(raw) - len(raw) % 3
+        self.pending = raw[usable:]
+        return base64.b64encode(raw[:usable])
+
+    def __iter__(self):
+        return iter(lambda: self.read(upload_chunk_size), b'')
+
+
+#Returns the number of bytes remaining in a stream, or None if it can't tell
+def _get_stream_length(stream):
+    try:
+        return os.fstat(stream.fileno()).st_size - stream.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        if stream.seekable():
+            position = stream.tell()
+            length = stream.seek(0, 2) - position
+            stream.seek(position)
+            return length
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
+
+
+#Returns the SHA-256 of the rest of a seekable stream, then rewinds it
+def _hash_stream(stream):
+    position = stream.tell()
+    file_hash = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(upload_chunk_size), b''):
+        file_hash.update(chunk)
+    stream.seek(position)
+    return file_hash.hexdigest()
+
+
+#Scans the contents of a readable file-like object (an open file, a socket
+#file, a response.raw, ...). The data is streamed to the scanner in chunks
+#rather than loaded into memory. length is the number of bytes to send, and is
+#detected automatically for files and other seekable streams.
+#If a VerdictCache is provided (or di.verdict_cache is set) and the stream is
+#seekable, it is hashed in a first streaming pass and the upload is skipped when
+#a cached verdict exists. For non-seekable streams the hash is computed while
+#uploading and the verdict is cached afterwards.
+def scan_stream(stream, scanner_ip, simplified=False, encoded=False, scanner_port=5000, protocol='https', cache=None, length=None):
+
+    if cache == None:
+        cache = verdict_cache
+    if length == None:
+        length = _get_stream_length(stream)
+
+    # check the verdict cache before uploading anything
+    file_hash = None
+    hash_while_uploading = None
+    if cache != None:
+        if hasattr(stream, 'seekable') and stream.seekable():
+            file_hash = _hash_stream(stream)
+            verdict = cache.get(file_hash, simplified=simplified, file_size=length or 0)
+            if verdict != None:
+                return verdict
+        else:
+            hash_while_uploading = hashlib.sha256()
+
+    if encoded:
+        #set URL to match, data is encoded as it is streamed
+        request_url = f'{protocol}://{scanner_ip}:{scanner_port}/scan/base64'
+    else:
+        #set URL to match, data is streamed as-is
+        request_url = f'{protocol}://{scanner_ip}:{scanner_port}/scan/binary'
+
+    # stream scan request over the scanner's pooled session, capture response
+    data = _UploadStream(stream, length=length, encoded=encoded, file_hash=hash_while_uploading)
+    response = get_session(scanner_ip, scanner_port, protocol).post(request_url, data=data, timeout=20)
+
+    # validate response code and proceed if expected value 200
+    if response.status_code == 200:
+        #convert to Python dictionary
+        verdict = response.json()
+        if cache != None:
+            if hash_while_uploading != None:
+                file_hash = hash_while_uploading.hexdigest()
+            cache.put(file_hash, verdict)
+        if simplified:
+            #Call function to simplify the verdict
+            verdict = simplify_verdict(verdict)
+        #Return [simplified] verdict
+        return verdict
+    else:
+        logger.error('Unexpected return code %s on POST to %s', response.status_code, request_url)
+        return None
+
+
+#Scans an in-memory payload (bytes, bytearray, memoryview or mmap) without
+#writing it to disk and without copying the whole buffer
+def scan_bytes(data, scanner_ip, simplified=False, encoded=False, scanner_port=5000, protocol='https', cache=None):
+    return scan_stream(_BufferReader(data), scanner_ip, simplified=simplified, encoded=encoded, scanner_port=scanner_port, protocol=protocol, cache=cache, length=len(memoryview(data).cast('B')))
+
+
+#Primary method which accepts file name and optional config data, submits scan, simplifies it, and returns result
+#The file is streamed from disk, so memory use does not grow with file size.
+#If a VerdictCache is provided (or di.verdict_cache is set), the file is hashed
+#locally first and the upload is skipped when a cached verdict exists.
+def scan_file(file_name, scanner_ip, simplified=False, encoded=False, scanner_port=5000, protocol='https', cache=None):
+
+    # open file from disk (rb means opens the file in binary format for reading)
+    with open(file_name, 'rb') as f:
+        return scan_stream(f, scanner_ip, simplified=simplified, encoded=encoded, scanner_port=scanner_port, protocol=protocol, cache=cache)
+
+
+#Wrapper which invokes scan_file with the parameter to use encoding
+def scan_file_encoded(file_name, scanner_ip, simplified=False):
+    return scan_file(file_name=file_name, scanner_ip=scanner_ip, simplified=simplified, encoded=True)
+
+
+#Chooses which scanner to send each scan to when several are available
+# --> 'round_robin' rotates through the scanners in order
+# --> 'least_outstanding' picks the scanner with the fewest scans in flight
+class ScannerBalancer:
+
+    def __init__(self, scanner_ips, balancing='round_robin'):
+        if isinstance(scanner_ips, str):
+            scanner_ips = [scanner_ips]
+        if balancing not in ('round_robin', 'least_outstanding'):
+            raise ValueError(f'Unsupported balancing mode {balancing}')
+        self.scanner_ips = list(scanner_ips)
+        self.balancing = balancing
+        self.outstanding = {scanner_ip: 0 for scanner_ip in self.scanner_ips}
+        self.rotation = itertools.cycle(self.scanner_ips)
+        self.lock = threading.Lock()
+
+    #reserve a scanner for one scan
+    def acquire(self):
+        with self.lock:
+            if self.balancing == 'round_robin':
+                scanner_ip = next(self.rotation)
+            else:
+                scanner_ip = min(self.scanner_ips, key=lambda ip: self.outstanding[ip])
+            self.outstanding[scanner_ip] += 1
+            return scanner_ip
+
+    #release a scanner after the scan completes
+    def release(self, scanner_ip):
+        with self.lock:
+            self.outstanding[scanner_ip] -= 1
+
+
+#Scans many files concurrently over pooled connections to one or more scanners.
+#This is a generator which yields (file_name, verdict) tuples in the order the
+#scans complete (not the order of file_names). verdict is None if the scan
+#failed for any reason; the error is logged and the remaining scans carry on.
+#At most concurrency scans are in flight at any time.
+def scan_files(file_names, scanner_ips, concurrency=8, simplified=False, encoded=False, scanner_port=5000, protocol='https', balancing='round_robin', cache=None):
+
+    balancer = ScannerBalancer(scanner_ips, balancing=balancing)
+
+    #scan a single file on whichever scanner the balancer picks
+    def scan_one(file_name):
+        scanner_ip = balancer.acquire()
+        try:
+            return scan_file(file_name, scanner_ip, simplified=simplified, encoded=encoded, scanner_port=scanner_port, protocol=protocol, cache=cache)
+        except Exception as e:
+            logger.error('%s scanning %s on %s: %s', type(e).__name__, file_name, scanner_ip, e)
+            return None
+        finally:
+            balancer.release(scanner_ip)
+
+    file_names = iter(file_names)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        #keep the pool full without queueing the whole input up front
+        in_flight = {}
+        for file_name in itertools.islice(file_names, concurrency):
+            in_flight[executor.submit(scan_one, file_name)] = file_name
+        while len(in_flight) > 0:
+            done, pending = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                file_name = in_flight.pop(future)
+                for next_file_name in itertools.islice(file_names, 1):
+                    in_flight[executor.submit(scan_one, next_file_name)] = next_file_name
+                yield file_name, future.result()
+
+
+# A method used to convert the raw verdict received from DI Agentless into a simplified/more user-friendly format
+# --> Recommend to use this with an Agentless Policy where "prevention" is enabled at Threat Severity "Low" and above
+# --> This method introduces the concept of a "Suspicious" verdict, which is for files that score Low or Moderate
+def simplify_verdict(verdict):
+
+    if 'verdict' not in verdict.keys():
+        logger.error('The verdict passed to simplify_verdict is missing or corrupt:\n%s', verdict)
+        return None
+
+    else:
+        #remove the redundent text 'filetype' from the file type value, if present
+        if 'file_type' in verdict.keys():
+            verdict['file_type'] = verdict['file_type'].replace('FileType','')
+
+        if verdict['verdict'] == 'Malicious':
+
+            if verdict['severity'] in ['VERY_HIGH', 'HIGH']:
+
+                return {'verdict': 'Malicious',
+                        'file_type': verdict['file_type'],
+                        'threat_severity': verdict['severity'],
+                        'file_hash': verdict['file_hash'],
+                        'scan_guid': verdict['scan_guid']}
+
+            else:
+
+                return {'verdict': 'Suspicious',
+                        'file_type': verdict['file_type'],
+                        'threat_severity': verdict['severity'],
+                        'file_hash': verdict['file_hash'],
+                        'scan_guid': verdict['scan_guid']}
+
+        elif verdict['verdict'] == 'Benign':
+
+            return {'verdict': 'Benign',
+                    'file_type': verdict['file_type'],
+                    'file_hash': verdict['file_hash'],
+                    'scan_guid': verdict['scan_guid']}
+
+        elif verdict['verdict'] == 'Not Classified':
+            return {'verdict': 'Unsupported',
+                    'file_type': 'Other',
+                    'scan_guid': verdict['scan_guid']}
+
+        else:
+            logger.warning('Error in processing verdict passed to simplify_verdict:\n%s', verdict)
+            return None
@@ -12,7 +12,6 @@
 
 # import required libraries
 import deepinstinct30 as di, json, datetime, pandas, re
-from dateutil import parser
 
 # Calculates deployment phase for a Windows policy. Non-conforming and non-Windows policies return 0.
 def classify_policy(policy):
@@ -107,20 +106,23 @@ def run_deployment_phase_progression_readiness(fqdn, key, config):
     print('INFO: Calculating event search parameters')
     search_parameters = get_event_search_parameters(config['deployment_phase'])
     print('INFO: Querying server for events matching the following criteria:\n', json.dumps(search_parameters, indent=4))
-    events = di.get_events(search=search_parameters)
-    print('INFO:', len(events), 'events were returned')
+    if config.get('use_local_event_store', False):
+        print('INFO: Syncing local event store, then querying it')
+        with di.EventStore() as event_store:
+            event_store.sync()
+            event_aggregator = di.aggregate_events(['device_id'], events=event_store.iter_events(search=search_parameters))
+    else:
+        event_aggregator = di.aggregate_events(['device_id'], search=search_parameters)
+    print('INFO:', event_aggregator.event_count, 'events were returned')
     print('INFO: Summarizing event data by device id')
-    event_counts = di.count_data_by_field(events, 'device_id')
+    event_counts = event_aggregator.totals('device_id')
 
     #collect device data
     print('INFO: Getting device list from server')
     devices = di.get_devices(include_deactivated=False)
     print('INFO:', len(devices), 'devices were returned')
     print('INFO: Appending deployment phase data to device list')
-    for device in devices:
-        for policy in policies:
-            if policy['id'] == device['policy_id']:
-                device['deployment_phase'] = policy['deployment_phase']
+    di.enrich_devices(devices, policies=policies, policy_fields=['deployment_phase'], fill_missing=True, default=0)
 
     print('INFO: Filtering device data to remove devices not in a phase', config['deployment_phase'], 'policy')
     filtered_devices = []
@@ -137,14 +139,9 @@ def run_deployment_phase_progression_readiness(fqdn, key, config):
         else:
             device['event_count'] = event_counts[device['id']]
 
-    print('INFO: Calculating days since last contact and adding results to device list')
-    for device in devices:
-        device['last_contact_days_ago'] = (datetime.datetime.now(datetime.timezone.utc) - parser.parse(device['last_contact'])).days
-
-    #add days_since_deployment field to devices
-    print('INFO: Adding days_since_deployment to device data by comparing last_registration to current datetime')
-    for device in devices:
-        device['days_since_deployment'] = (datetime.datetime.now(datetime.timezone.utc) - parser.parse(device['last_registration'])).days
+    #add last_contact_days_ago and days_since_deployment fields to devices
+    print('INFO: Calculating days since last contact and days since deployment and adding results to device list')
+    di.add_days_since(devices, {'last_contact_days_ago': 'last_contact', 'days_since_deployment': 'last_registration'})
 
     print('INFO: Evaluating devices to determine which are ready to progress to the next phase')
     for device in devices:
@@ -219,6 +216,12 @@ def main():
     if config['max_open_event_quantity'] == '':
         config['max_open_event_quantity'] = 0
 
+    user_response = input('Use local event store (incremental sync instead of downloading all events)? Enter YES or NO, or press enter to accept the default [NO]: ')
+    if user_response.lower() == 'yes':
+        config['use_local_event_store'] = True
+    else:
+        config['use_local_event_store'] = False
+
     return run_deployment_phase_progression_readiness(fqdn=fqdn, key=key, config=config)
 
 if __name__ == "__main__":
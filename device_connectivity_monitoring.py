@@ -1,60 +1,87 @@
-# Disclaimer:
-# This code is provided as an example of how to build code against and interact
-# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
-# limited error checking and logging, and likely contains defects or other
-# deficiencies. Test thoroughly first, and use at your own risk. The API
-# Wrapper and associated samples are not Deep Instinct commercial products and
-# are not officially supported, although he underlying REST API is. This means
-# that to report an issue to tech support you must remove the API Wrapper layer
-# and recreate the problem with a reproducible test case against the raw/pure
-# DI REST API.
-#
-
-import deepinstinct25 as di, time, json
-
-# Optional hardcoded config - if not provided, you'll be prompted at runtime
-di.fqdn = 'SERVER-NAME.customers.deepinstinctweb.com'
-di.key = 'API-KEY'
-
-# Validate config and prompt if not provided above
-while di.fqdn == '' or di.fqdn == 'SERVER-NAME.customers.deepinstinctweb.com':
-    di.fqdn = input('FQDN of DI Server? ')
-while di.key == '' or di.key == 'API-KEY':
-    di.key = input('API Key? ')
-
-# Run indefinitely
-while True:
-
-    # Get device data from server
-    devices = di.get_devices()
-
-    # Create counters for each category of devices
-    results = {}
-    results['online_count'] = 0
-    results['offline_count'] = 0
-
-    # Iterate through all devices, count devices
-    for device in devices:
-        # Count devices consuming a license only
-        if device['license_status'] == 'ACTIVATED':
-            # Check connectivity status and increment the matching counter
-            if device['connectivity_status'] == 'ONLINE':
-                results['online_count'] += 1
-            elif device['connectivity_status'] == 'OFFLINE':
-                results['offline_count'] += 1
-
-    # Calculate ratio of offline devices
-    results['ratio_offline'] = results['offline_count'] / (results['offline_count'] + results['online_count'])
-
-    # Print results to console
-    print(json.dumps(results, indent=4))
-
-    # Define warning trigger here
-    if results['ratio_offline']  > 0.3:
-        print('WARNING: More than 30% of devices are offline')
-        # TODO:
-        # Add code here to send an e-mail alert or take other desired action
-
-    # Sleep for 6 hours (21600 seconds) before repeating
-    time.sleep(21600)
- 
+# Disclaimer:
+# This code is provided as an example of how to build code against and interact
+# with the Deep Instinct REST API. It is provided AS-IS/NO WARRANTY. It has
+# limited error checking and logging, and likely contains defects or other
+# deficiencies. Test thoroughly first, and use at your own risk. The API
+# Wrapper and associated samples are not Deep Instinct commercial products and
+# are not officially supported, although he underlying REST API is. This means
+# that to report an issue to tech support you must remove the API Wrapper layer
+# and recreate the problem with a reproducible test case against the raw/pure
+# DI REST API.
+#
+
+import deepinstinct30 as di, time, json, requests
+
+# Optional hardcoded config - if not provided, you'll be prompted at runtime
+di.fqdn = 'SERVER-NAME.customers.deepinstinctweb.com'
+di.key = 'API-KEY'
+
+# Validate config and prompt if not provided above
+while di.fqdn == '' or di.fqdn == 'SERVER-NAME.customers.deepinstinctweb.com':
+    di.fqdn = input('FQDN of DI Server? ')
+while di.key == '' or di.key == 'API-KEY':
+    di.key = input('API Key? ')
+
+# Counters for each category of devices, kept up to date from the changes
+# reported by each sync rather than recounted from every device
+counts = {'ONLINE': 0, 'OFFLINE': 0}
+
+# Adds (increment=1) or removes (increment=-1) a device from the counters
+def count_device(device, increment):
+    # Count devices consuming a license only
+    if device['license_status'] == 'ACTIVATED':
+        # Check connectivity status and adjust the matching counter
+        if device['connectivity_status'] in counts:
+            counts[device['connectivity_status']] += increment
+
+# The device snapshot persists on disk, so each sync only reports what changed
+with di.DeviceStore() as store:
+
+    # Start from the snapshot left by any previous run
+    for device in store.get_devices():
+        count_device(device, 1)
+
+    # Run indefinitely
+    while True:
+
+        # Refresh the snapshot from the server and get the changes. If the
+        # device list can't be collected in full, the snapshot is left as it
+        # was and we try again next cycle.
+        try:
+            diff = store.sync()
+        except requests.exceptions.RequestException as e:
+            print('ERROR: Device sync failed, will retry next cycle:', e)
+            time.sleep(21600)
+            continue
+
+        # Apply the changes to the counters
+        for device in diff['added']:
+            count_device(device, 1)
+        for device in diff['removed']:
+            count_device(device, -1)
+        for change in diff['changed']:
+            previous_device = {**change['device'], **{field: values['old'] for field, values in change['changes'].items()}}
+            count_device(previous_device, -1)
+            count_device(change['device'], 1)
+            # Report devices which went offline since the previous check
+            if change['changes'].get('connectivity_status', {}).get('new') == 'OFFLINE':
+                print('INFO:', change['hostname'], 'went offline')
+
+        # Calculate ratio of offline devices
+        results = {}
+        results['online_count'] = counts['ONLINE']
+        results['offline_count'] = counts['OFFLINE']
+        results['ratio_offline'] = results['offline_count'] / (results['offline_count'] + results['online_count'])
+
+        # Print results to console
+        print(json.dumps(results, indent=4))
+
+        # Define warning trigger here
+        if results['ratio_offline']  > 0.3:
+            print('WARNING: More than 30% of devices are offline')
+            # TODO:
+            # Add code here to send an e-mail alert or take other desired action
+
+        # Sleep for 6 hours (21600 seconds) before repeating
+        time.sleep(21600)
+ 
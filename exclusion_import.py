@@ -39,12 +39,16 @@
 # This input file syntax is identical to what is created if you use the GUI to
 # export the exclusion lists. I suggest to take an export and then use that as
 # your template.
+#
+# Exclusions are added with one request per policy and exclusion type (see
+# di.import_exclusions). Exclusions which a policy already has are skipped, so
+# the import can safely be re-run.
 
 import deepinstinct30 as di
 import pandas
 import time
 
-def run_exclusion_import(fqdn, key, process_exclusions_file_name, folder_exclusions_file_name):
+def run_exclusion_import(fqdn, key, process_exclusions_file_name, folder_exclusions_file_name, max_workers=8):
 
     start_time = time.perf_counter()
 
@@ -69,62 +73,22 @@ def run_exclusion_import(fqdn, key, process_exclusions_file_name, folder_exclusi
     for exclusion in folder_exclusions:
         exclusion['Policies'] = exclusion['Policies'].split(", ")
 
-    #get policy list, then filter it to get a list of just Windows policies
-    all_policies = di.get_policies()
-    windows_policies = []
-    for policy in all_policies:
-        if policy['os'] == 'WINDOWS':
-            windows_policies.append(policy)
-
-    #iterate through each of the Windows policies
-    for policy in windows_policies:
-
-        print('INFO: Beginning processing of policy', policy['id'], policy['name'])
-
-
-        #PROCESS EXCLUSIONS
-
-        #create a list to store process exclusions that apply to this policy
-        process_exclusions_this_policy = []
-
-        #iterate though the imported process exclusion list
-        for exclusion in process_exclusions:
-            #check if the exclusion applies to all policies
-            if exclusion['Policies'] == ['All']:
-                process_exclusions_this_policy.append(exclusion)
-            #check if the exclusion applies to this specific policy
-            elif policy['name'] in exclusion['Policies']:
-                process_exclusions_this_policy.append(exclusion)
-
-        #if we found some exclusions applicable to this policy, create them
-        if len(process_exclusions_this_policy) > 0:
-            print('INFO: Adding', len(process_exclusions_this_policy), 'process exclusions to policy', policy['id'], policy['name'])
-            for exclusion in process_exclusions_this_policy:
-                di.add_process_exclusion(exclusion['Process'], exclusion['Comment'], policy['id'])
-
-
-        #FOLDER EXCLUSIONS
-
-        #create a list to store folder exclusions that apply to this policy
-        folder_exclusions_this_policy = []
-
-        #iterate though the imported folder exclusion list
-        for exclusion in folder_exclusions:
-            #check if the exclusion applies to all policies
-            if exclusion['Policies'] == ['All']:
-                folder_exclusions_this_policy.append(exclusion)
-            #check if the exclusion applies to this specific policy
-            elif policy['name'] in exclusion['Policies']:
-                folder_exclusions_this_policy.append(exclusion)
-
-        #if we found some exclusions applicable to this policy, create them
-        if len(folder_exclusions_this_policy) > 0:
-            print('INFO: Adding', len(folder_exclusions_this_policy), 'folder exclusions to policy', policy['id'], policy['name'])
-            for exclusion in folder_exclusions_this_policy:
-                di.add_folder_exclusion(exclusion['Folder'], exclusion['Comment'], policy['id'])
+    #combine both lists into the format accepted by di.import_exclusions
+    exclusions = []
+    for exclusion in process_exclusions:
+        exclusions.append({'item': exclusion['Process'], 'comment': exclusion['Comment'], 'exclusion_type': 'process_path', 'policies': exclusion['Policies']})
+    for exclusion in folder_exclusions:
+        exclusions.append({'item': exclusion['Folder'], 'comment': exclusion['Comment'], 'exclusion_type': 'folder_path', 'policies': exclusion['Policies']})
 
+    #add the exclusions to the Windows policies with one request per policy and
+    #exclusion type, skipping exclusions which a policy already has
+    plans = di.import_exclusions(exclusions, platforms=['WINDOWS'], max_workers=max_workers)
 
-        print('INFO: Done with policy', policy['id'], policy['name'])
+    #summarize the results
+    failed_plans = [plan for plan in plans if any(status_code != 204 for operation, status_code in plan['results'])]
+    print('INFO: Updated', len([plan for plan in plans if len(plan['operations']) > 0]), 'of', len(plans), 'Windows policies')
+    for plan in failed_plans:
+        print('ERROR: Failed to update policy', plan['policy_id'], plan['name'])
 
     runtime_in_seconds = time.perf_counter() - start_time
     print('Runtime was', runtime_in_seconds, 'seconds.')
@@ -9,6 +9,11 @@
 # and recreate the problem with a reproducible test case against the raw/pure
 # DI REST API.
 #
+# Note on use_local_event_store: the local event store only downloads new
+# events and events closed since its previous sync, so events it already holds
+# may be stale (reopened, archived, reoccurrence and close fields are not
+# updated). Leave it disabled when the export must reflect current state.
+#
 
 import pandas, datetime
 
@@ -26,23 +31,35 @@ else:
 di.fqdn = 'SERVER-NAME.customers.deepinstinctweb.com'
 di.key = 'API-KEY'
 
+# When enabled (3.0 only), events are read from a local event store which is
+# synced incrementally, and the get_events calls below are answered locally
+# (see note at top about stale events)
+use_local_event_store = False
+
 # Validate config and prompt if not provided above
 while di.fqdn == '' or di.fqdn == 'SERVER-NAME.customers.deepinstinctweb.com':
     di.fqdn = input('FQDN of DI Server? ')
 while di.key == 'API-KEY':
     di.key = input('API Key? ')
 
+# The examples below call get_events, which reads from the server or the store
+get_events = di.get_events
+if di_version == '3.0' and use_local_event_store:
+    event_store = di.EventStore()
+    event_store.sync()
+    get_events = event_store.get_events
+
 # ==============================================================================
 # THIS SECTION SHOWS A SERIES OF EXAMPLES OF HOW TO USE di.get_events TO GET
 # ALL OR SOME OF THE EVENTS VISIBLE TO THE PROVIDED API KEY FROM THE SERVER
 # --> Leave exactly 1 call to di.get_events uncommented
 
 # All events
-events = di.get_events()
+events = get_events()
 #events = di.get_all_events(max_event_id=9999) #use alternate method to include Script Control events if desired
 
 # Example of how to filter on minimum event_id
-#events = di.get_events(minimum_event_id=1001)
+#events = get_events(minimum_event_id=1001)
 
 # Example of how to build a set of search search parameters
 # --> All provided parameters must match (AND operation, not OR)
@@ -77,11 +94,11 @@ events = di.get_events()
 #search_parameters['file_status'] = ['UPLOADED', 'NOT_UPLOADED']
 #search_parameters['sandbox_status'] = ['NOT_READY_TO_GENERATE', 'READY_TO_GENERATE']
 #search_parameters['file_size'] = 12345
-#events = di.get_events(search=search_parameters)
+#events = get_events(search=search_parameters)
 
 # Example of combining search parameters plus minimum event_id
 #TODO: Build search_parameters dictionary based upon example above
-#events = di.get_events(search=search_parameters, minimum_event_id=5001)
+#events = get_events(search=search_parameters, minimum_event_id=5001)
 
 # ==============================================================================
 
@@ -1,94 +1,85 @@
-import pandas, datetime, deepinstinct30 as di, sys
+import pandas, datetime, os, deepinstinct30 as di, sys
 
 # Optional hardcoded config - if not provided, you'll be prompted at runtime
 di.fqdn = 'SERVER-NAME.customers.deepinstinctweb.com'
 di.key = 'API-KEY'
 include_policy_mode_counts = ''
 
-# Validate config and prompt if not provided above
-while di.fqdn in ('SERVER-NAME.customers.deepinstinctweb.com', ''):
-    di.fqdn = input('FQDN of [multi-tenancy] DI Server? [foo.bar.deepinstinctweb.com] ')
-while di.key in ('API-KEY', ''):
-    di.key = input('API Key with visibility into all MSPs and Tenants on the server? ')
-while include_policy_mode_counts not in (True, False):
-    input_response = input('Include prevention/detection mode counts? [Yes | No] ')
-    if input_response.lower() == 'yes':
-        include_policy_mode_counts = True
-    elif input_response.lower() == 'no':
-        include_policy_mode_counts = False
-    else:
-        print('ERROR: Invalid response:', input_response)
-        sys.exit(0)
+# Optional fleet config - to report on several servers at once, list them here
+# instead of setting di.fqdn and di.key above. The servers are processed
+# concurrently and combined into a single report with a server column.
+# Example: [{'name': 'us', 'fqdn': 'us.customers.deepinstinctweb.com', 'key': 'API-KEY'}]
+servers = []
 
-#get tenant data from server
-print('INFO: Getting Tenant data from server')
-tenants = di.get_tenants()
 
-#confirm that we got valid data back; if not, abort script
-if len(tenants) == 0:
-    print('ERROR: No Tenants returned. Check that server is multi-tenancy enabled and that your API key has the appropriate permissions.')
-    sys.exit(0)
+# Calculates license usage for each tenant on the current server (plus
+# prevention/detection counts if enabled) and returns the tenant list
+def get_license_usage_by_tenant(include_policy_mode_counts):
 
-#get msp data from server
-print('INFO: Getting MSP data from server')
-msps = di.get_msps()
+    #get tenant data from server
+    print('INFO: Getting Tenant data from server')
+    tenants = di.get_tenants()
 
-# get device data from server
-print('INFO: Getting Device data from server')
-devices = di.get_devices(include_deactivated=False)
+    #confirm that we got valid data back; if not, return nothing
+    if len(tenants) == 0:
+        print('ERROR: No Tenants returned from', di.get_client().fqdn, '. Check that server is multi-tenancy enabled and that your API key has the appropriate permissions.')
+        return tenants
 
-# add msp_name to tenant data
-print('INFO: Adding MSP names to Tenant data')
-for tenant in tenants:
-    for msp in msps:
-        if tenant['msp_id'] == msp['id']:
-            tenant['msp_name'] = msp['name']
+    #get msp data from server
+    print('INFO: Getting MSP data from server')
+    msps = di.get_msps()
 
-# If option to include policy mode counts is enabled, get policy details,
-# then parse policies to calculate mode, then add that data to devices
-if include_policy_mode_counts:
-    print('INFO: Getting policy data from server')
-    policies = di.get_policies(include_policy_data=True)
+    # get device data from server
+    print('INFO: Getting Device data from server')
+    devices = di.get_devices(include_deactivated=False, parallel=True)
 
-    print('INFO: Parsing policy data to determine policy mode')
+    # add msp_name to tenant data
+    print('INFO: Adding MSP names to Tenant data')
+    di.attach(tenants, di.build_index(msps), 'msp_id', {'msp_name': 'name'})
 
-    for policy in policies:
+    # If option to include policy mode counts is enabled, get policy details,
+    # then parse policies to calculate mode, then add that data to devices
+    if include_policy_mode_counts:
+        print('INFO: Getting policy data from server')
+        policies = di.get_policies(include_policy_data=True)
 
-        policy['prevention_mode'] = False
+        print('INFO: Parsing policy data to determine policy mode')
 
-        if policy['os'] == 'WINDOWS':
-            if policy['prevention_level'] in ('LOW', 'MEDIUM', 'HIGH'):
-                if policy['ransomware_behavior'] == 'PREVENT':
-                    if policy['remote_code_injection'] == 'PREVENT':
-                        if policy['arbitrary_shellcode_execution'] == 'PREVENT':
-                            policy['prevention_mode'] = True
+        for policy in policies:
 
-        elif 'prevention_level' in policy.keys():
-            if policy['prevention_level'] in ('LOW', 'MEDIUM', 'HIGH'):
-                policy['prevention_mode'] = True
+            policy['prevention_mode'] = False
 
-    print('INFO: Adding policy mode to device data')
-    for device in devices:
-        for policy in policies:
-            if policy['id'] == device['policy_id']:
-                device['prevention_mode'] = policy['prevention_mode']
+            if policy['os'] == 'WINDOWS':
+                if policy['prevention_level'] in ('LOW', 'MEDIUM', 'HIGH'):
+                    if policy['ransomware_behavior'] == 'PREVENT':
+                        if policy['remote_code_injection'] == 'PREVENT':
+                            if policy['arbitrary_shellcode_execution'] == 'PREVENT':
+                                policy['prevention_mode'] = True
 
-# Calculate license usage for each tenant (plus prevention/detection data, if enabled in config)
-if include_policy_mode_counts:
-    print('INFO: Parsing device data to calculate licenses used plus prevention/detection counts for each tenant')
-else:
-    print('INFO: Parsing device data to calculate licenses used for each tenant')
-for tenant in tenants:
-    tenant['licenses_used'] = 0
+            elif 'prevention_level' in policy.keys():
+                if policy['prevention_level'] in ('LOW', 'MEDIUM', 'HIGH'):
+                    policy['prevention_mode'] = True
+
+        print('INFO: Adding policy mode to device data')
+        di.enrich_devices(devices, policies=policies, policy_fields=['prevention_mode'])
+
+    # Calculate license usage for each tenant (plus prevention/detection data, if enabled in config)
     if include_policy_mode_counts:
-        tenant['devices_in_prevention_mode'] = 0
-        tenant['devices_in_detection_mode'] = 0
-for device in devices:
-    # Check if the device has an activated license (if not skip it)
-    if device['license_status'] == 'ACTIVATED':
-        # If yes, then find the Tenant that this device belongs to
-        for tenant in tenants:
-            if tenant['id'] == device['tenant_id']:
+        print('INFO: Parsing device data to calculate licenses used plus prevention/detection counts for each tenant')
+    else:
+        print('INFO: Parsing device data to calculate licenses used for each tenant')
+    for tenant in tenants:
+        tenant['licenses_used'] = 0
+        if include_policy_mode_counts:
+            tenant['devices_in_prevention_mode'] = 0
+            tenant['devices_in_detection_mode'] = 0
+    tenants_by_id = di.build_index(tenants)
+    for device in devices:
+        # Check if the device has an activated license (if not skip it)
+        if device['license_status'] == 'ACTIVATED':
+            # If yes, then find the Tenant that this device belongs to
+            tenant = tenants_by_id.get(device['tenant_id'])
+            if tenant != None:
                 # ...and increment the licenses_used counter in the matching tenant by 1
                 tenant['licenses_used'] += 1
                 # If enabled, also increment the prevention/detection counter
@@ -98,22 +89,63 @@ for device in devices:
                     else:
                         tenant['devices_in_detection_mode'] += 1
 
-# Calculate percent_of_licenses_used for reach tenant and add results to tenants data
-print('INFO: Calculating percentage of licenses used for each tenant')
-for tenant in tenants:
-    if tenant['license_limit'] == 0:  #avoids a divisiion by zero error for tenants with no assigned licenses
-        tenant['percent_of_licenses_used'] = 0
+    # Calculate percent_of_licenses_used for reach tenant and add results to tenants data
+    print('INFO: Calculating percentage of licenses used for each tenant')
+    for tenant in tenants:
+        if tenant['license_limit'] == 0:  #avoids a divisiion by zero error for tenants with no assigned licenses
+            tenant['percent_of_licenses_used'] = 0
+        else:
+            tenant['percent_of_licenses_used'] = (tenant['licenses_used'] / tenant['license_limit'])
+
+    # If enabled in config, calculate percentage of devices in prevention mode and add to tenant data
+    if include_policy_mode_counts:
+        print('INFO: Calculating percentage of devices in prevention mode for each tenant')
+        for tenant in tenants:
+            if tenant['licenses_used'] == 0:  #avoid division by zero for empty tenants
+                tenant['percent_of_devices_in_prevention'] = 0
+            else:
+                tenant['percent_of_devices_in_prevention'] = (tenant['devices_in_prevention_mode'] / tenant['licenses_used'])
+
+    return tenants
+
+
+# Validate config and prompt if not provided above
+if len(servers) == 0:
+    while di.fqdn in ('SERVER-NAME.customers.deepinstinctweb.com', ''):
+        di.fqdn = input('FQDN of [multi-tenancy] DI Server? [foo.bar.deepinstinctweb.com] ')
+    while di.key in ('API-KEY', ''):
+        di.key = input('API Key with visibility into all MSPs and Tenants on the server? ')
+while include_policy_mode_counts not in (True, False):
+    input_response = input('Include prevention/detection mode counts? [Yes | No] ')
+    if input_response.lower() == 'yes':
+        include_policy_mode_counts = True
+    elif input_response.lower() == 'no':
+        include_policy_mode_counts = False
     else:
-        tenant['percent_of_licenses_used'] = (tenant['licenses_used'] / tenant['license_limit'])
+        print('ERROR: Invalid response:', input_response)
+        sys.exit(0)
 
-# If enabled in config, calculate percentage of devices in prevention mode and add to tenant data
+# Collect the data, either from the single server or from all servers in the fleet concurrently
+report_columns = ['msp_name', 'name', 'licenses_used', 'license_limit', 'percent_of_licenses_used']
 if include_policy_mode_counts:
-    print('INFO: Calculating percentage of devices in prevention mode for each tenant')
-    for tenant in tenants:
-        if tenant['licenses_used'] == 0:  #avoid division by zero for empty tenants
-            tenant['percent_of_devices_in_prevention'] = 0
-        else:
-            tenant['percent_of_devices_in_prevention'] = (tenant['devices_in_prevention_mode'] / tenant['licenses_used'])
+    report_columns += ['devices_in_prevention_mode', 'devices_in_detection_mode', 'percent_of_devices_in_prevention']
+if len(servers) == 0:
+    tenants = get_license_usage_by_tenant(include_policy_mode_counts)
+    report_name = di.fqdn
+    sort_columns = ['msp_name', 'name']
+else:
+    print('INFO: Collecting data from', len(servers), 'servers')
+    results = di.run_on_servers(servers, get_license_usage_by_tenant, include_policy_mode_counts)
+    for result in results:
+        print('INFO:', result['server'], 'returned', 'an error' if result['error'] != None else f'{len(result["result"])} tenants', 'in', result['runtime_in_seconds'], 'seconds')
+    tenants = di.merge_server_results(results)
+    report_name = 'fleet'
+    sort_columns = ['server', 'msp_name', 'name']
+    report_columns = ['server'] + report_columns
+
+#if we got no valid data back, abort script
+if len(tenants) == 0:
+    sys.exit(0)
 
 # Convert the data to a Pandas data frame for easier manipulation and export
 print('INFO: Preparing data for export')
@@ -121,15 +153,13 @@ tenants_df = pandas.DataFrame(tenants)
 
 # Sort the data frame alphabetically by msp name and then by tenant name
 print('INFO: Sorting data for export')
-tenants_df.sort_values(by=['msp_name', 'name'], inplace=True)
+tenants_df.sort_values(by=sort_columns, inplace=True)
 
 # Export the sorted data frame to disk in Excel format
 print('INFO: Calculating export folder name and file name')
-folder_name = di.create_export_folder()
-file_name = f'license_usage_report_by_tenant_{di.fqdn}_{datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d_%H.%M")}_UTC.xlsx'
+folder_name = di.create_export_folder() if len(servers) == 0 else 'exported_data_from_fleet'
+os.makedirs(folder_name, exist_ok=True)
+file_name = f'license_usage_report_by_tenant_{report_name}_{datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d_%H.%M")}_UTC.xlsx'
 print('INFO: Exporting data to disk')
-if include_policy_mode_counts:
-    tenants_df.to_excel(f'{folder_name}/{file_name}', index=False, columns=['msp_name', 'name', 'licenses_used', 'license_limit', 'percent_of_licenses_used', 'devices_in_prevention_mode', 'devices_in_detection_mode', 'percent_of_devices_in_prevention'])
-else:
-    tenants_df.to_excel(f'{folder_name}/{file_name}', index=False, columns=['msp_name', 'name', 'licenses_used', 'license_limit', 'percent_of_licenses_used'])
+tenants_df.to_excel(f'{folder_name}/{file_name}', index=False, columns=report_columns)
 print('INFO: Data was exported to disk as', f'{folder_name}/{file_name}')
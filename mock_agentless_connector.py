@@ -0,0 +1,118 @@
+# mock_agentless_connector.py
+#
+# A local stand-in for the Deep Instinct Agentless Connector scan API, used to
+# benchmark and test deepinstinctagentless.py without a real connector. It
+# implements POST /scan/binary and POST /scan/base64 and returns verdicts in
+# the same format as the connector. Files whose contents include the EICAR
+# test string are reported as Malicious; everything else is Benign.
+#
+# Scan time is simulated as base_latency_ms plus per_megabyte_latency_ms for
+# each MB of file data, and error_rate (0 to 1) of scans return HTTP 500.
+#
+# Usage:
+#   python mock_agentless_connector.py [--port 5000] [--base-latency-ms 5]
+# or from code:
+#   server = mock_agentless_connector.start_server(port=0)
+#   port = server.server_address[1]
+#   ...
+#   server.shutdown()
+
+import argparse, base64, hashlib, http.server, json, random, threading, time, uuid
+
+eicar_signature = b'EICAR-STANDARD-ANTIVIRUS-TEST-FILE'
+
+
+class MockConnectorHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    #simulation settings (overridden by start_server)
+    base_latency_ms = 5
+    per_megabyte_latency_ms = 20
+    error_rate = 0
+
+    def do_POST(self):
+        if self.path not in ('/scan/binary', '/scan/base64'):
+            return self.send_json(404, {'error': 'not found'})
+
+        #read the body, which may be chunked when the client streams it
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            data = self.read_chunked_body()
+        else:
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/scan/base64':
+            data = base64.b64decode(data)
+
+        start_time = time.perf_counter()
+        time.sleep((self.base_latency_ms + self.per_megabyte_latency_ms * len(data) / 1000000) / 1000)
+        if random.random() < self.error_rate:
+            return self.send_json(500, {'error': 'simulated failure'})
+
+        verdict = {'scan_guid': str(uuid.uuid4()),
+                   'file_hash': hashlib.sha256(data).hexdigest(),
+                   'file_type': 'PEFileType' if data[:2] == b'MZ' else 'OtherFileType',
+                   'file_size_in_bytes': len(data),
+                   'scan_duration_in_microseconds': int((time.perf_counter() - start_time) * 1000000)}
+        if eicar_signature in data:
+            verdict['verdict'] = 'Malicious'
+            verdict['severity'] = 'VERY_HIGH'
+        else:
+            verdict['verdict'] = 'Benign'
+        self.send_json(200, verdict)
+
+    def read_chunked_body(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().strip().split(b';')[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return b''.join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def send_json(self, status_code, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Starts the mock connector on a background thread and returns the server.
+# Use port=0 to pick a free port (see server.server_address[1]).
+def start_server(host='127.0.0.1', port=0, base_latency_ms=5, per_megabyte_latency_ms=20, error_rate=0):
+    handler = type('ConfiguredMockConnectorHandler', (MockConnectorHandler,),
+                   {'base_latency_ms': base_latency_ms,
+                    'per_megabyte_latency_ms': per_megabyte_latency_ms,
+                    'error_rate': error_rate})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local mock of the Deep Instinct Agentless Connector scan API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--base-latency-ms', type=float, default=5)
+    parser.add_argument('--per-megabyte-latency-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0)
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, args.base_latency_ms, args.per_megabyte_latency_ms, args.error_rate)
+    print('INFO: Mock agentless connector listening on', f'http://{args.host}:{server.server_address[1]}', '(Ctrl+C to stop)')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,522 @@
+# mock_d_appliance.py
+#
+# A local stand-in for the Deep Instinct D-Appliance (management server) REST
+# API, used to benchmark and test deepinstinct30.py without a live server. It
+# serves a synthetic, reproducible fleet (MSPs, tenants, groups, policies,
+# devices, events and suspicious events) generated from a seed, and implements
+# the endpoints the wrapper uses, including:
+#   GET  /api/v1/devices?after_device_id=N   (50 per page, like the real API)
+#   GET  /api/v1/devices/{id}
+#   GET  /api/v1/events/{id} and /api/v1/suspicious-events/{id}
+#   POST /api/v1/events/search?after_event_id=N and /suspicious-events/search
+#   POST /api/v1/[suspicious-]events/actions/archive|unarchive|open|close
+#   GET  /api/v1/policies/ , POST /api/v1/policies/ , DELETE /api/v1/policies/{id}
+#   GET/PUT /api/v1/policies/{id}/data
+#   GET/POST/DELETE /api/v1/policies/{id}/allow-list|deny-list|exclusion-list/{type}
+#   GET  /api/v1/groups/ , POST /api/v1/groups/{id}/add-devices|remove-devices
+#   GET  /api/v1/multitenancy/msp/ and /api/v1/multitenancy/tenant/
+#
+# Devices and events are generated on demand from their id, so large fleets
+# (100k+ devices) start instantly and use little memory. Changes made through
+# the API (moves, event actions, list edits) are kept in memory for the life of
+# the server.
+#
+# Latency (latency_ms plus up to latency_jitter_ms), random errors (error_rate,
+# returned as HTTP 503) and throttling (rate_limit_per_second, returned as
+# HTTP 429 with Retry-After) can be injected. Request, connection and byte
+# counters are kept in server.appliance.stats.
+#
+# Usage:
+#   python mock_d_appliance.py --devices 10000 --port 8080
+# or from code:
+#   server = mock_d_appliance.start_server(device_count=10000)
+#   client = di.DeepInstinctClient(server.fqdn, server.appliance.key, protocol='http')
+#   ...
+#   server.shutdown()
+
+import argparse, datetime, hashlib, http.server, json, random, re, threading, time, urllib.parse, bisect
+
+page_size = 50
+
+operating_systems = ['WINDOWS', 'MAC', 'LINUX']
+
+allow_deny_and_exclusion_list_types = ['allow-list/hashes', 'allow-list/paths', 'allow-list/certificates', 'allow-list/process_paths',
+                                       'allow-list/scripts', 'deny-list/hashes', 'exclusion-list/folder_path', 'exclusion-list/process_path']
+
+event_types = ['STATIC_ANALYSIS', 'RANSOMWARE_FILE_ENCRYPTION', 'SCRIPT_CONTROL', 'MALICIOUS_POWERSHELL_COMMAND_EXECUTION', 'ARBITRARY_SHELLCODE']
+
+threat_severities = ['LOW', 'MODERATE', 'HIGH', 'VERY_HIGH']
+
+
+#Formats a datetime the way the D-Appliance does
+def format_timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f'{value.microsecond // 1000:03d}Z'
+
+
+# Checks an event against a search dictionary: lists match any value,
+# dictionaries with from/to match a range (timestamps), and anything else must
+# match exactly
+def matches_search(event, search):
+    for field, value in search.items():
+        if isinstance(value, list):
+            if event.get(field) not in value:
+                return False
+        elif isinstance(value, dict):
+            if event.get(field) == None:
+                return False
+            if 'from' in value and event[field] < value['from']:
+                return False
+            if 'to' in value and event[field] > value['to']:
+                return False
+        elif event.get(field) != value:
+            return False
+    return True
+
+
+# The synthetic server state. Static objects (MSPs, tenants, groups, policies)
+# are built up front; devices and events are derived from their id and the
+# seed, with any changes stored as overrides.
+class MockDAppliance:
+
+    def __init__(self, device_count=1000, event_count=None, suspicious_event_count=None, msp_count=1, tenants_per_msp=2,
+                 groups_per_os=2, policies_per_os=2, deactivated_ratio=0.05, id_gap_ratio=0.1, seed=0, key='mock-api-key',
+                 latency_ms=0, latency_jitter_ms=0, error_rate=0, rate_limit_per_second=None):
+        self.seed = seed
+        self.key = key
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_per_second = rate_limit_per_second
+        self.deactivated_ratio = deactivated_ratio
+        self.now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.lock = threading.Lock()
+        self.rate_limit_window = (0, 0)
+        self.reset_stats()
+        generator = random.Random(seed)
+
+        # MSPs and tenants
+        self.msps = [{'id': n, 'name': f'MSP {n}', 'license_limit': device_count * 2} for n in range(1, msp_count + 1)]
+        self.tenants = []
+        for msp in self.msps:
+            for n in range(tenants_per_msp):
+                self.tenants.append({'id': len(self.tenants) + 1, 'name': f'{msp["name"]} Tenant {n + 1}', 'msp_id': msp['id'],
+                                     'msp_name': msp['name'], 'license_limit': device_count})
+
+        # policies (a default plus policies_per_os per OS per MSP) and a
+        # default group plus groups_per_os per OS per MSP
+        self.policies = {}
+        self.policy_data = {}
+        self.lists = {}
+        self.groups = []
+        for msp in self.msps:
+            for os in operating_systems:
+                os_policies = []
+                for n in range(policies_per_os + 1):
+                    policy = self._add_policy(msp, os, f'{os.title()} Default Policy' if n == 0 else f'{os.title()} Policy {n}', n == 0, generator)
+                    os_policies.append(policy)
+                for n in range(groups_per_os + 1):
+                    policy = os_policies[min(n, len(os_policies) - 1)]
+                    self.groups.append({'id': len(self.groups) + 1, 'name': f'{os.title()} Default Group' if n == 0 else f'{os.title()} Group {n}',
+                                        'os': os, 'is_default_group': n == 0, 'msp_id': msp['id'], 'msp_name': msp['name'],
+                                        'policy_id': policy['id'], 'priority': n, 'comment': ''})
+        self.groups_by_id = {group['id']: group for group in self.groups}
+        self.groups_by_msp_and_os = {}
+        for group in self.groups:
+            self.groups_by_msp_and_os.setdefault((group['msp_id'], group['os']), []).append(group)
+
+        # device ids are sparse (gaps where devices were removed), like a real fleet
+        self.device_ids = []
+        next_id = 0
+        while len(self.device_ids) < device_count:
+            next_id += 1
+            if generator.random() >= id_gap_ratio:
+                self.device_ids.append(next_id)
+        self.device_overrides = {}
+
+        # events (ids are consecutive); state changes are stored as overrides
+        self.event_counts = {False: device_count // 2 if event_count == None else event_count,
+                             True: device_count // 20 if suspicious_event_count == None else suspicious_event_count}
+        self.event_overrides = {False: {}, True: {}}
+        self.archived_events = {False: set(), True: set()}
+
+    def _add_policy(self, msp, os, name, is_default_policy, generator):
+        policy = {'id': max(self.policies, default=0) + 1, 'name': name, 'os': os, 'is_default_policy': is_default_policy,
+                  'msp_id': msp['id'], 'msp_name': msp['name'], 'comment': ''}
+        self.policies[policy['id']] = policy
+        prevent_or_detect = lambda: generator.choice(['PREVENT', 'DETECT', 'DISABLED'])
+        self.policy_data[policy['id']] = {'prevention_level': generator.choice(['LOW', 'MEDIUM', 'HIGH', 'DISABLED']),
+                                          'detection_level': 'LOW', 'prevention_mode': generator.random() < 0.5,
+                                          'in_memory_protection': generator.random() < 0.8,
+                                          'remote_code_injection': prevent_or_detect(), 'arbitrary_shellcode_execution': prevent_or_detect(),
+                                          'reflective_dll_loading': prevent_or_detect(), 'reflective_dotnet_injection': prevent_or_detect(),
+                                          'amsi_bypass': prevent_or_detect(), 'credentials_dump': prevent_or_detect(),
+                                          'ransomware_behavior': prevent_or_detect(), 'deployment_phase': generator.randint(1, 3)}
+        for list_type in allow_deny_and_exclusion_list_types:
+            self.lists[(policy['id'], list_type)] = [{'item': hashlib.sha256(f'{policy["id"]}{list_type}{n}'.encode()).hexdigest()
+                                                       if list_type.endswith('hashes') else f'C:\\Program Files\\Vendor{n}\\',
+                                                       'comment': None if n == 0 else f'synthetic {n}'}
+                                                      for n in range(generator.randint(0, 3))]
+        return policy
+
+    def reset_stats(self):
+        self.stats = {'requests': 0, 'connections': 0, 'bytes_sent': 0, 'bytes_received': 0, 'status_codes': {}, 'endpoints': {}}
+
+    # DEVICES
+
+    def get_device(self, device_id):
+        index = bisect.bisect_left(self.device_ids, device_id)
+        if index == len(self.device_ids) or self.device_ids[index] != device_id:
+            return None
+        generator = random.Random(f'{self.seed}-device-{device_id}')
+        tenant = generator.choice(self.tenants)
+        os = generator.choices(operating_systems, weights=[80, 15, 5])[0]
+        group = generator.choice(self.groups_by_msp_and_os[(tenant['msp_id'], os)])
+        registered = self.now - datetime.timedelta(days=generator.randint(0, 400), seconds=generator.randint(0, 86399))
+        last_contact = max(registered, self.now - datetime.timedelta(minutes=generator.choice([1, 5, 60, 1440, 4320, 20160])))
+        device = {'id': device_id, 'hostname': f'{os[:3]}-HOST{device_id:07d}', 'os': os,
+                  'osv': {'WINDOWS': 'Windows 10', 'MAC': 'macOS 13', 'LINUX': 'Ubuntu 22.04'}[os],
+                  'ip_address': f'10.{device_id >> 16 & 255}.{device_id >> 8 & 255}.{device_id & 255}',
+                  'mac_address': ':'.join(f'{b:02x}' for b in generator.randbytes(6)),
+                  'group_id': group['id'], 'group_name': group['name'],
+                  'policy_id': group['policy_id'], 'policy_name': self.policies[group['policy_id']]['name'],
+                  'tenant_id': tenant['id'], 'tenant_name': tenant['name'], 'msp_id': tenant['msp_id'], 'msp_name': tenant['msp_name'],
+                  'license_status': 'DEACTIVATED' if generator.random() < self.deactivated_ratio else 'ACTIVATED',
+                  'connectivity_status': 'ONLINE' if self.now - last_contact < datetime.timedelta(hours=1) else 'OFFLINE',
+                  'deployment_status': 'REGISTERED', 'last_registration': format_timestamp(registered),
+                  'last_contact': format_timestamp(last_contact), 'agent_version': generator.choice(['3.3.0.1', '3.4.1.12', '3.5.0.7']),
+                  'comment': '', 'tag': '', 'logged_in_users': f'user{device_id % 997}', 'scanned_files': generator.randint(0, 100000),
+                  'distinguished_name': '', 'distribution_name': ''}
+        device.update(self.device_overrides.get(device_id, {}))
+        return device
+
+    def get_devices_page(self, after_device_id):
+        start = bisect.bisect_right(self.device_ids, after_device_id)
+        devices = [self.get_device(device_id) for device_id in self.device_ids[start:start + page_size]]
+        return {'last_id': devices[-1]['id'] if len(devices) > 0 else None, 'devices': devices}
+
+    def move_devices(self, device_ids, group_id):
+        with self.lock:
+            for device_id in device_ids:
+                device = self.get_device(device_id)
+                if device == None:
+                    continue
+                group = self.groups_by_id.get(group_id) or self.groups_by_msp_and_os[(device['msp_id'], device['os'])][0]
+                self.device_overrides.setdefault(device_id, {}).update({'group_id': group['id'], 'group_name': group['name'],
+                                                                         'policy_id': group['policy_id'],
+                                                                         'policy_name': self.policies[group['policy_id']]['name']})
+
+    # EVENTS
+
+    def get_event(self, event_id, suspicious=False):
+        if event_id < 1 or event_id > self.event_counts[suspicious]:
+            return None
+        generator = random.Random(f'{self.seed}-{"suspicious" if suspicious else "event"}-{event_id}')
+        device = self.get_device(self.device_ids[generator.randrange(len(self.device_ids))])
+        #events are spread over the last 90 days in id order
+        age = datetime.timedelta(days=90) * (1 - event_id / (self.event_counts[suspicious] + 1))
+        timestamp = self.now - age
+        closed = generator.random() < 0.6
+        event = {'id': event_id, 'device_id': device['id'], 'type': generator.choice(event_types),
+                 'trigger': 'BRAIN', 'action': 'PREVENTED' if generator.random() < 0.7 else 'DETECTED',
+                 'status': 'CLOSED' if closed else 'OPEN', 'threat_severity': generator.choice(threat_severities),
+                 'file_hash': hashlib.sha256(f'{self.seed}-{event_id % 5000}'.encode()).hexdigest(),
+                 'path': f'C:\\Users\\user{event_id % 97}\\Downloads\\file{event_id % 5000}.exe',
+                 'file_size': generator.randint(1000, 10000000), 'file_type': 'PE', 'deep_classification': None,
+                 'file_archive_hash': None, 'file_status': 'NOT_UPLOADED', 'sandbox_status': 'NOT_READY_TO_GENERATE',
+                 'timestamp': format_timestamp(timestamp), 'insertion_timestamp': format_timestamp(timestamp + datetime.timedelta(seconds=2)),
+                 'close_timestamp': format_timestamp(timestamp + datetime.timedelta(hours=generator.randint(1, 48))) if closed else None,
+                 'close_trigger': 'CLOSED_BY_ADMIN' if closed else None, 'last_action': None, 'last_reoccurrence': None,
+                 'reoccurrence_count': 0, 'comment': None, 'mitre_classifications': [],
+                 'recorded_device_info': {'hostname': device['hostname'], 'os': device['os'], 'mac_address': device['mac_address'],
+                                          'tag': device['tag'], 'group_name': device['group_name'], 'policy_name': device['policy_name'],
+                                          'tenant_name': device['tenant_name']},
+                 'msp_id': device['msp_id'], 'msp_name': device['msp_name'], 'tenant_id': device['tenant_id'], 'tenant_name': device['tenant_name']}
+        event.update(self.event_overrides[suspicious].get(event_id, {}))
+        return event
+
+    def search_events(self, after_event_id, search, suspicious=False):
+        events = []
+        event_id = max(after_event_id, 0)
+        while len(events) < page_size and event_id < self.event_counts[suspicious]:
+            event_id += 1
+            if event_id in self.archived_events[suspicious]:
+                continue
+            event = self.get_event(event_id, suspicious)
+            if matches_search(event, search):
+                events.append(event)
+        return {'last_id': events[-1]['id'] if len(events) > 0 else None, 'events': events}
+
+    def apply_event_action(self, event_ids, action, suspicious=False):
+        with self.lock:
+            for event_id in event_ids:
+                if event_id < 1 or event_id > self.event_counts[suspicious]:
+                    continue
+                if action == 'archive':
+                    self.archived_events[suspicious].add(event_id)
+                elif action == 'unarchive':
+                    self.archived_events[suspicious].discard(event_id)
+                elif action == 'close':
+                    self.event_overrides[suspicious].setdefault(event_id, {}).update({'status': 'CLOSED', 'close_timestamp': format_timestamp(datetime.datetime.now(datetime.timezone.utc))})
+                elif action == 'open':
+                    self.event_overrides[suspicious].setdefault(event_id, {}).update({'status': 'OPEN', 'close_timestamp': None})
+
+    # POLICIES
+
+    def create_policy(self, name, base_policy_id, comment=''):
+        with self.lock:
+            base_policy = self.policies.get(base_policy_id)
+            if base_policy == None:
+                return None
+            msp = {'id': base_policy['msp_id'], 'name': base_policy['msp_name']}
+            policy = self._add_policy(msp, base_policy['os'], name, False, random.Random(self.seed))
+            policy['comment'] = comment
+            self.policy_data[policy['id']] = dict(self.policy_data[base_policy_id])
+            for list_type in allow_deny_and_exclusion_list_types:
+                self.lists[(policy['id'], list_type)] = []
+            return policy
+
+    def delete_policy(self, policy_id):
+        with self.lock:
+            if self.policies.pop(policy_id, None) == None:
+                return False
+            self.policy_data.pop(policy_id, None)
+            for list_type in allow_deny_and_exclusion_list_types:
+                self.lists.pop((policy_id, list_type), None)
+            return True
+
+    def update_list(self, policy_id, list_type, items, delete=False):
+        with self.lock:
+            existing_items = self.lists[(policy_id, list_type)]
+            if delete:
+                values = {item['item'] for item in items}
+                existing_items[:] = [item for item in existing_items if item['item'] not in values]
+            else:
+                #like the real server, reject the whole request if any comment is null
+                if any(item.get('comment', '') == None for item in items):
+                    return False
+                values = {item['item'] for item in existing_items}
+                for item in items:
+                    if item['item'] not in values:
+                        existing_items.append({'item': item['item'], 'comment': item.get('comment', '')})
+                        values.add(item['item'])
+            return True
+
+
+# Routes requests to a MockDAppliance; the appliance is attached by start_server
+class MockDApplianceHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    appliance = None
+
+    routes = [('GET', r'/api/v1/devices/?', 'get_devices'),
+              ('GET', r'/api/v1/devices/(\d+)', 'get_device'),
+              ('GET', r'/api/v1/(events|suspicious-events)/(\d+)', 'get_event'),
+              ('POST', r'/api/v1/(events|suspicious-events)/search', 'search_events'),
+              ('POST', r'/api/v1/(events|suspicious-events)/actions/(archive|unarchive|open|close)', 'event_action'),
+              ('GET', r'/api/v1/policies/?', 'get_policies'),
+              ('POST', r'/api/v1/policies/?', 'create_policy'),
+              ('DELETE', r'/api/v1/policies/(\d+)', 'delete_policy'),
+              ('GET', r'/api/v1/policies/(\d+)/data', 'get_policy_data'),
+              ('PUT', r'/api/v1/policies/(\d+)/data', 'put_policy_data'),
+              ('GET', r'/api/v1/policies/(\d+)/((?:allow|deny|exclusion)-list/\w+)', 'get_list'),
+              ('POST', r'/api/v1/policies/(\d+)/((?:allow|deny|exclusion)-list/\w+)', 'add_list_items'),
+              ('DELETE', r'/api/v1/policies/(\d+)/((?:allow|deny|exclusion)-list/\w+)', 'delete_list_items'),
+              ('GET', r'/api/v1/groups/?', 'get_groups'),
+              ('POST', r'/api/v1/groups/(\d+)/(add-devices|remove-devices)', 'group_devices'),
+              ('GET', r'/api/v1/multitenancy/msp/?', 'get_msps'),
+              ('GET', r'/api/v1/multitenancy/tenant/?', 'get_tenants')]
+
+    def setup(self):
+        super().setup()
+        with self.appliance.lock:
+            self.appliance.stats['connections'] += 1
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        appliance = self.appliance
+        url = urllib.parse.urlparse(self.path)
+        self.query = urllib.parse.parse_qs(url.query)
+        length = int(self.headers.get('Content-Length', 0))
+        self.body = json.loads(self.rfile.read(length)) if length > 0 else None
+
+        if appliance.latency_ms > 0 or appliance.latency_jitter_ms > 0:
+            time.sleep((appliance.latency_ms + random.random() * appliance.latency_jitter_ms) / 1000)
+
+        for route_method, pattern, handler_name in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                endpoint = f'{method} {pattern}'
+                break
+        else:
+            match = None
+            endpoint = f'{method} unknown'
+
+        with appliance.lock:
+            appliance.stats['requests'] += 1
+            appliance.stats['bytes_received'] += length
+            appliance.stats['endpoints'][endpoint] = appliance.stats['endpoints'].get(endpoint, 0) + 1
+            throttled = False
+            if appliance.rate_limit_per_second != None:
+                window, count = appliance.rate_limit_window
+                if window != int(time.time()):
+                    window, count = int(time.time()), 0
+                throttled = count >= appliance.rate_limit_per_second
+                appliance.rate_limit_window = (window, count + 1)
+
+        if self.headers.get('Authorization') != appliance.key:
+            return self.respond(401, {'error': 'invalid API key'})
+        if throttled:
+            return self.respond(429, {'error': 'rate limit exceeded'}, {'Retry-After': '1'})
+        if appliance.error_rate > 0 and random.random() < appliance.error_rate:
+            return self.respond(503, {'error': 'simulated failure'})
+        if match == None:
+            return self.respond(404, {'error': 'not found'})
+        getattr(self, handler_name)(*match.groups())
+
+    def respond(self, status_code, body=None, headers={}):
+        payload = json.dumps(body).encode() if body != None else b''
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if body != None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.appliance.lock:
+            self.appliance.stats['bytes_sent'] += len(payload)
+            self.appliance.stats['status_codes'][status_code] = self.appliance.stats['status_codes'].get(status_code, 0) + 1
+
+    def get_devices(self):
+        self.respond(200, self.appliance.get_devices_page(int(self.query.get('after_device_id', ['0'])[0])))
+
+    def get_device(self, device_id):
+        device = self.appliance.get_device(int(device_id))
+        self.respond(200, device) if device != None else self.respond(404, {'error': 'device not found'})
+
+    def get_event(self, event_type, event_id):
+        suspicious = event_type == 'suspicious-events'
+        event = self.appliance.get_event(int(event_id), suspicious) if int(event_id) not in self.appliance.archived_events[suspicious] else None
+        self.respond(200, {'event': event}) if event != None else self.respond(404, {'error': 'event not found'})
+
+    def search_events(self, event_type):
+        after_event_id = int(self.query.get('after_event_id', ['0'])[0])
+        self.respond(200, self.appliance.search_events(after_event_id, self.body or {}, suspicious=event_type == 'suspicious-events'))
+
+    def event_action(self, event_type, action):
+        self.appliance.apply_event_action(self.body.get('ids', []), action, suspicious=event_type == 'suspicious-events')
+        self.respond(204)
+
+    def get_policies(self):
+        self.respond(200, list(self.appliance.policies.values()))
+
+    def create_policy(self):
+        policy = self.appliance.create_policy(self.body['name'], self.body['base_policy_id'], self.body.get('comment', ''))
+        self.respond(200, policy) if policy != None else self.respond(400, {'error': 'invalid base_policy_id'})
+
+    def delete_policy(self, policy_id):
+        self.respond(204) if self.appliance.delete_policy(int(policy_id)) else self.respond(404, {'error': 'policy not found'})
+
+    def get_policy_data(self, policy_id):
+        policy = self.appliance.policies.get(int(policy_id))
+        if policy == None:
+            return self.respond(404, {'error': 'policy not found'})
+        self.respond(200, {'id': policy['id'], 'name': policy['name'], 'os': policy['os'], 'is_default_policy': policy['is_default_policy'],
+                           'data': self.appliance.policy_data[policy['id']]})
+
+    def put_policy_data(self, policy_id):
+        if int(policy_id) not in self.appliance.policies:
+            return self.respond(404, {'error': 'policy not found'})
+        with self.appliance.lock:
+            self.appliance.policy_data[int(policy_id)].update(self.body['data'])
+        self.respond(204)
+
+    def get_list(self, policy_id, list_type):
+        if (int(policy_id), list_type) not in self.appliance.lists:
+            return self.respond(404, {'error': 'not found'})
+        self.respond(200, {'items': [dict(item) for item in self.appliance.lists[(int(policy_id), list_type)]]})
+
+    def add_list_items(self, policy_id, list_type, delete=False):
+        if (int(policy_id), list_type) not in self.appliance.lists:
+            return self.respond(404, {'error': 'not found'})
+        if not self.appliance.update_list(int(policy_id), list_type, self.body.get('items', []), delete=delete):
+            return self.respond(400, {'error': 'comment must not be null'})
+        self.respond(204)
+
+    def delete_list_items(self, policy_id, list_type):
+        self.add_list_items(policy_id, list_type, delete=True)
+
+    def get_groups(self):
+        self.respond(200, self.appliance.groups)
+
+    def group_devices(self, group_id, action):
+        self.appliance.move_devices(self.body.get('devices', []), int(group_id) if action == 'add-devices' else None)
+        self.respond(204)
+
+    def get_msps(self):
+        self.respond(200, {'msps': self.appliance.msps})
+
+    def get_tenants(self):
+        self.respond(200, {'tenants': self.appliance.tenants})
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Starts a mock D-Appliance on a background thread and returns the server. The
+# MockDAppliance is available as server.appliance and the host:port to use as
+# the fqdn (with protocol='http') as server.fqdn. Keyword arguments are passed
+# to MockDAppliance. Use port=0 to pick a free port.
+def start_server(host='127.0.0.1', port=0, **kwargs):
+    handler = type('ConfiguredMockDApplianceHandler', (MockDApplianceHandler,), {'appliance': MockDAppliance(**kwargs)})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.appliance = handler.appliance
+    server.fqdn = f'{host}:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local mock of the Deep Instinct D-Appliance REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--devices', type=int, default=1000, help='Number of synthetic devices')
+    parser.add_argument('--events', type=int, help='Number of events (default half the device count)')
+    parser.add_argument('--suspicious-events', type=int, help='Number of suspicious events (default 5%% of the device count)')
+    parser.add_argument('--msps', type=int, default=1)
+    parser.add_argument('--tenants-per-msp', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--key', default='mock-api-key', help='API key the server accepts')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests that fail with HTTP 503')
+    parser.add_argument('--rate-limit-per-second', type=int, help='Requests per second before HTTP 429 is returned')
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, device_count=args.devices, event_count=args.events, suspicious_event_count=args.suspicious_events,
+                          msp_count=args.msps, tenants_per_msp=args.tenants_per_msp, seed=args.seed, key=args.key,
+                          latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms, error_rate=args.error_rate,
+                          rate_limit_per_second=args.rate_limit_per_second)
+    print('INFO: Mock D-Appliance listening on', f'http://{server.fqdn}', 'with API key', args.key, '(Ctrl+C to stop)')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
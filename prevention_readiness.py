@@ -37,7 +37,6 @@
 
 # import required libraries
 import deepinstinct30 as di, json, datetime, pandas
-from dateutil import parser
 
 def run_prevention_readiness(fqdn, key, config):
 
@@ -73,18 +72,28 @@ def run_prevention_readiness(fqdn, key, config):
     #get the data from DI server
     print('INFO: Gathering data')
     print('\tCalling get_devices')
-    devices = di.get_devices(include_deactivated=False)
+    devices = di.get_devices(include_deactivated=False, parallel=True)
     print('\tCalling get_policies')
     policies = di.get_policies(include_policy_data=True)
     print('\tCalling get_groups')
     groups = di.get_groups(exclude_default_groups=False)
-    print('\tCalling get_events (this may take a while) using search_parameters:\n', search_parameters)
-    events = di.get_events(minimum_event_id=config['minimum_event_id'], search=search_parameters)
-    print('\t', len(events), 'events were returned from server.')
+    #events are counted by device_id, type and severity as they stream in, so
+    #the raw events are never held in memory
+    event_aggregation_fields = ['device_id', 'type', 'threat_severity']
+    if config.get('use_local_event_store', False):
+        print('\tSyncing local event store, then querying it using search_parameters:\n', search_parameters)
+        with di.EventStore() as event_store:
+            event_store.sync()
+            events = event_store.iter_events(minimum_event_id=int(config['minimum_event_id']), search=search_parameters)
+            event_aggregator = di.aggregate_events(event_aggregation_fields, events=events)
+    else:
+        print('\tCalling iter_events (this may take a while) using search_parameters:\n', search_parameters)
+        event_aggregator = di.aggregate_events(event_aggregation_fields, minimum_event_id=int(config['minimum_event_id']), search=search_parameters)
+    print('\t', event_aggregator.event_count, 'events were returned from server.')
 
     #count the filtered events by device_id
     print('INFO: Summarizing events by device_id')
-    event_counts = di.count_data_by_field(events, 'device_id')
+    event_counts = event_aggregator.totals('device_id')
 
     print('INFO: Adding prevention_mode field to policy data')
     prevention_policy_count = 0
@@ -104,10 +113,7 @@ def run_prevention_readiness(fqdn, key, config):
 
     #add in_prevention field to devices
     print('INFO: Adding prevention_mode field to device data')
-    for device in devices:
-        for policy in policies:
-            if policy['id'] == device['policy_id']:
-                device['in_prevention'] = policy['prevention_mode']
+    di.enrich_devices(devices, policies=policies, policy_fields={'in_prevention': 'prevention_mode'})
 
     #add event_count field to devices
     print('INFO: Adding event_count field to device data')
@@ -119,21 +125,11 @@ def run_prevention_readiness(fqdn, key, config):
 
     #add associated policy name and prevention mode to group data (for display purposes only)
     print('INFO: Adding policy_name and prevention_mode to device group data')
-    for group in groups:
-        for policy in policies:
-            if group['policy_id'] == policy['id']:
-                group['policy_name'] = policy['name']
-                group['prevention_mode'] = policy['prevention_mode']
+    di.attach(groups, di.build_index(policies), 'policy_id', {'policy_name': 'name', 'prevention_mode': 'prevention_mode'})
 
-    #add days_since_deployment field to devices
-    print('INFO: Adding days_since_deployment to device data by comparing last_registration to current datetime')
-    for device in devices:
-        device['days_since_deployment'] = (datetime.datetime.now(datetime.timezone.utc) - parser.parse(device['last_registration'])).days
-
-    #add days_since_last_contact field to devices
-    print('INFO: Adding last_contact_days_ago to device data by comparing last_contact to current datetime')
-    for device in devices:
-        device['last_contact_days_ago'] = (datetime.datetime.now(datetime.timezone.utc) - parser.parse(device['last_contact'])).days
+    #add days_since_deployment and last_contact_days_ago fields to devices
+    print('INFO: Adding days_since_deployment and last_contact_days_ago to device data by comparing last_registration and last_contact to current datetime')
+    di.add_days_since(devices, {'days_since_deployment': 'last_registration', 'last_contact_days_ago': 'last_contact'})
 
     #add weekly_event_rate field to devices
     print('INFO: Adding weekly_event_rate to device data')
@@ -166,12 +162,9 @@ def run_prevention_readiness(fqdn, key, config):
             devices_not_ready_for_prevention.append(device)
 
     print('INFO: Calculating how many devices in each group are ready for prevention')
+    devices_ready_for_prevention_by_group_id = di.group_data_by_field(devices_ready_for_prevention, 'group_id')
     for group in groups:
-        group['devices_ready_for_prevention'] = 0
-    for device in devices_ready_for_prevention:
-        for group in groups:
-            if device['group_id'] == group['id']:
-                group['devices_ready_for_prevention'] +=1
+        group['devices_ready_for_prevention'] = len(devices_ready_for_prevention_by_group_id.get(group['id'], []))
 
     print('INFO: Building list of groups with devices ready for prevention')
     groups_with_devices_ready_for_prevention = []
@@ -191,7 +184,8 @@ def run_prevention_readiness(fqdn, key, config):
     devices_already_in_prevention_df = pandas.DataFrame(devices_already_in_prevention)
     devices_ready_for_prevention_df = pandas.DataFrame(devices_ready_for_prevention)
     devices_not_ready_for_prevention_df = pandas.DataFrame(devices_not_ready_for_prevention)
-    events_df = pandas.DataFrame(events)
+    event_counts_by_type_df = event_aggregator.pivot(index='device_id', columns='type')
+    event_counts_by_severity_df = event_aggregator.pivot(index='device_id', columns='threat_severity')
     with pandas.ExcelWriter(f'{folder_name}/{file_name}') as writer:
         devices_ready_for_prevention_df.to_excel(writer, sheet_name='ready_for_prevention', index=False)
         devices_not_ready_for_prevention_df.to_excel(writer, sheet_name='not_ready_for_prevention', index=False)
@@ -200,7 +194,8 @@ def run_prevention_readiness(fqdn, key, config):
         event_counts_df.to_excel(writer, sheet_name='event_counts', index=False)
         policies_df.to_excel(writer, sheet_name='policies', index=False)
         groups_df.to_excel(writer, sheet_name='groups', index=False)
-        events_df.to_excel(writer, sheet_name='events', index=False)
+        event_counts_by_type_df.to_excel(writer, sheet_name='event_counts_by_type')
+        event_counts_by_severity_df.to_excel(writer, sheet_name='event_counts_by_severity')
 
     #print summary data
     print()
@@ -266,9 +261,8 @@ def run_prevention_readiness(fqdn, key, config):
             destination_group_id = group['destination_group_id']
 
             device_ids_to_move = []
-            for device in devices_ready_for_prevention:
-                if device['group_id'] == source_group_id:
-                    device_ids_to_move.append(device['id'])
+            for device in devices_ready_for_prevention_by_group_id.get(source_group_id, []):
+                device_ids_to_move.append(device['id'])
 
             print('INFO: Moving', len(device_ids_to_move), 'devices from group', source_group_id, 'to group', destination_group_id)
 
@@ -328,6 +322,12 @@ def main():
     if config['minimum_event_id'] == '':
         config['minimum_event_id'] = 0
 
+    user_response = input('Use local event store (incremental sync instead of downloading all events)? Enter YES or NO, or press enter to accept the default [NO]: ')
+    if user_response.lower() == 'yes':
+        config['use_local_event_store'] = True
+    else:
+        config['use_local_event_store'] = False
+
     return run_prevention_readiness(fqdn=fqdn, key=key, config=config)
 
 if __name__ == "__main__":
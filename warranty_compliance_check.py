@@ -6,20 +6,17 @@ def do_warranty_compliance_check(fqdn, key, exclude_empty_policies):
 
     #Get data from server
     print('INFO: Getting policy data from server')
-    policies = di.get_policies(include_policy_data=True)
+    policies = di.get_policies(include_policy_data=True, parallel=True)
     print('INFO: Getting device data from server')
     devices = di.get_devices(include_deactivated=False)
 
     # Calculate device_count for each policy (how many active devices in policy)
     # Add device_countfield with initial value zero
     print('INFO: Calculating device count for each policy')
+    # Count devices by policy_id in one pass, then look up each policy's count
+    device_counts = di.count_data_by_field(devices, 'policy_id')
     for policy in policies:
-        policy['device_count'] = 0
-    # Iterate through devices and policies, incrementing device_count appropriately
-    for device in devices:
-        for policy in policies:
-            if policy['id'] == device['policy_id']:
-                policy['device_count'] +=1
+        policy['device_count'] = device_counts.get(policy['id'], 0)
 
     if exclude_empty_policies:
         print('INFO: Narrowing policy list to include only those which contain 1 or more activated devices')
@@ -102,7 +99,7 @@ def do_warranty_compliance_check(fqdn, key, exclude_empty_policies):
 
     print('INFO: Writing data to disk')
 
-    output.writelines(['--------\nDeep Instinct Ransomware Warranty Compliance Check\n', di.fqdn, '\n', datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d_%H.%M"), ' UTC\n--------\n\n'])
+    output.writelines(['--------\nDeep Instinct Ransomware Warranty Compliance Check\n', fqdn, '\n', datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d_%H.%M"), ' UTC\n--------\n\n'])
 
     if exclude_empty_policies:
         if empty_policy_count > 0: